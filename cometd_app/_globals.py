@@ -18,6 +18,53 @@ PROD_USERNAME = os.getenv("PROD_USERNAME")
 PROD_PASSWORD = os.getenv("PROD_PASSWORD")
 PROD_SECURITY_TOKEN = os.getenv("PROD_SECURITY_TOKEN")
 
+# comma separated list of the channels to subscribe to
+SF_CHANNELS = [
+    channel.strip()
+    for channel in os.getenv("SF_CHANNELS", "/data/ChangeEvents").split(",")
+    if channel.strip()
+]
+
+# replay marker storage: "sqlite" or "mmap"
+REPLAY_STORAGE = os.getenv("REPLAY_STORAGE", "sqlite")
+REPLAY_STORAGE_PATH = os.getenv("REPLAY_STORAGE_PATH")
+
+# incoming messages are handled in batches of up to BATCH_MAX_ITEMS messages,
+# collected for at most BATCH_MAX_WAIT_MS after the first one
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 100))
+BATCH_MAX_WAIT = int(os.getenv("BATCH_MAX_WAIT_MS", 0)) / 1000
+
+# limits of the messages prefetched from the server (0 for no limit)
+MAX_PENDING_COUNT = int(os.getenv("MAX_PENDING_COUNT", 100))
+MAX_PENDING_BYTES = int(os.getenv("MAX_PENDING_BYTES", 16 * 1024 * 1024))
+
+# the maximum number of batches produced to Kafka and waiting for their
+# delivery reports, the replay markers only move past acknowledged batches
+MAX_IN_FLIGHT_BATCHES = int(os.getenv("MAX_IN_FLIGHT_BATCHES", 100))
+
+# the org limits are polled every LIMITS_MAX_INTERVAL seconds, down to every
+# LIMITS_MIN_INTERVAL seconds as the daily platform event allocation runs out
+LIMITS_MIN_INTERVAL = float(os.getenv("LIMITS_MIN_INTERVAL", 30))
+LIMITS_MAX_INTERVAL = float(os.getenv("LIMITS_MAX_INTERVAL", 300))
+
+# access tokens are shared with the other listener processes through this
+# file, unset to request a new token on every connection
+TOKEN_CACHE_PATH = os.getenv("TOKEN_CACHE_PATH")
+
+# events are written to a spill log in this directory and forwarded to Kafka
+# in the background, unset to produce them to Kafka directly
+SPILL_LOG_DIR = os.getenv("SPILL_LOG_DIR")
+SPILL_SEGMENT_BYTES = int(os.getenv("SPILL_SEGMENT_BYTES", 64 * 1024 * 1024))
+SPILL_MAX_BYTES = int(os.getenv("SPILL_MAX_BYTES", 1024 * 1024 * 1024))
+
+# the updates of a record received within COALESCE_WINDOW_MS are merged into
+# one event (0 to forward every event), across transactions only if
+# COALESCE_ACROSS_TRANSACTIONS is "true"
+COALESCE_WINDOW = int(os.getenv("COALESCE_WINDOW_MS", 0)) / 1000
+COALESCE_ACROSS_TRANSACTIONS = (
+    os.getenv("COALESCE_ACROSS_TRANSACTIONS", "false").lower() == "true"
+)
+
 try:
     SANDBOX_PAYLOAD_CLIENT_CREDENTIALS = {
         "grant_type": "client_credentials",
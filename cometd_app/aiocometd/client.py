@@ -5,8 +5,7 @@ import reprlib
 import logging
 from collections import abc
 from contextlib import suppress
-import json
-from typing import Optional, List, Union, Set, AsyncIterator, Type, Any
+from typing import Optional, List, Union, Set, AsyncIterator, Type, Dict
 from types import TracebackType
 
 from aiocometd.transports import create_transport
@@ -26,6 +25,12 @@ from aiocometd.exceptions import (
 )
 from aiocometd.utils import is_server_error_message
 from aiocometd.extensions import Extension, AuthExtension
+from aiocometd.message_queue import MessageQueue
+from aiocometd.http import ConnectionPoolOptions, HttpSessionProvider
+from aiocometd.json_codec import (
+    json_dumps as default_json_dumps,
+    json_loads as default_json_loads,
+)
 from aiocometd.typing import (
     ConnectionTypeSpec,
     SSLValidationMode,
@@ -37,6 +42,10 @@ from aiocometd.typing import (
 
 LOGGER = logging.getLogger(__name__)
 
+#: put in the empty incoming queue to wake up a receive waiting on it when \
+#: the connection fails, it's never returned to the caller
+_WAKE_UP: JsonObject = {}
+
 
 class Client:  # pylint: disable=too-many-instance-attributes
     """CometD client"""
@@ -60,10 +69,13 @@ class Client:  # pylint: disable=too-many-instance-attributes
         connection_timeout: Union[int, float] = 10.0,
         ssl: Optional[SSLValidationMode] = None,
         max_pending_count: int = 100,
+        max_pending_bytes: int = 0,
         extensions: Optional[List[Extension]] = None,
         auth: Optional[AuthExtension] = None,
-        json_dumps: JsonDumper = json.dumps,
-        json_loads: JsonLoader = json.loads,
+        json_dumps: JsonDumper = default_json_dumps,
+        json_loads: JsonLoader = default_json_loads,
+        connection_pool: Optional[ConnectionPoolOptions] = None,
+        session_provider: Optional[HttpSessionProvider] = None,
     ) -> None:
         """
         :param url: CometD service url
@@ -86,12 +98,21 @@ class Client:  # pylint: disable=too-many-instance-attributes
         this size then the connection will be suspended, until messages are \
         consumed. \
         If it is less than or equal to zero, the count is infinite.
+        :param max_pending_bytes: The maximum total size in bytes of the \
+        prefetched messages. If the size of the prefetched messages reach \
+        this limit then the connection will be suspended, until messages are \
+        consumed. \
+        If it is less than or equal to zero, the size is infinite.
         :param extensions: List of protocol extension objects
         :param auth: An auth extension
         :param json_dumps: Function for JSON serialization, the default is \
-        :func:`json.dumps`
+        :func:`aiocometd.json_codec.json_dumps`
         :param json_loads: Function for JSON deserialization, the default is \
-        :func:`json.loads`
+        :func:`aiocometd.json_codec.json_loads`
+        :param connection_pool: Settings of the connection pools of the \
+        HTTP sessions created by the transports
+        :param session_provider: Provider of an HTTP session shared by the \
+        transports, and possibly by other parts of the application
 
         """
         #: CometD service url
@@ -104,7 +125,7 @@ class Client:  # pylint: disable=too-many-instance-attributes
         else:
             self._connection_types = self._DEFAULT_CONNECTION_TYPES
         #: queue for consuming incoming event messages
-        self._incoming_queue: "Optional[asyncio.Queue[JsonObject]]" = None
+        self._incoming_queue: Optional[MessageQueue] = None
         #: transport object
         self._transport: Optional[Transport] = None
         #: marks whether the client is open or closed
@@ -116,6 +137,8 @@ class Client:  # pylint: disable=too-many-instance-attributes
         self.ssl = ssl
         #: the maximum number of messages to prefetch from the server
         self._max_pending_count = max_pending_count
+        #: the maximum total size of the messages prefetched from the server
+        self._max_pending_bytes = max_pending_bytes
         #: List of protocol extension objects
         self.extensions = extensions
         #: An auth extension
@@ -124,13 +147,26 @@ class Client:  # pylint: disable=too-many-instance-attributes
         self._json_dumps = json_dumps
         #: Function for JSON deserialization
         self._json_loads = json_loads
+        #: settings of the connection pools of the transports
+        self.connection_pool = connection_pool
+        #: provider of the HTTP session shared by the transports
+        self.session_provider = session_provider
+        #: unsuccessful message held back by :obj:`receive_batch` until the \
+        #: messages received before it are consumed
+        self._held_message: Optional[JsonObject] = None
+        #: task watching the state of the transport while the client is open
+        self._supervisor_task: "Optional[asyncio.Future[None]]" = None
+        #: the error to raise from the receive path while the connection \
+        #: is failing
+        self._failure: Optional[Exception] = None
 
     def __repr__(self) -> str:
         """Formal string representation"""
         cls_name = type(self).__name__
         fmt_spec = (
             "{}({}, {}, connection_timeout={}, ssl={}, "
-            "max_pending_count={}, extensions={}, auth={})"
+            "max_pending_count={}, max_pending_bytes={}, extensions={}, "
+            "auth={})"
         )
         return fmt_spec.format(
             cls_name,
@@ -139,6 +175,7 @@ class Client:  # pylint: disable=too-many-instance-attributes
             reprlib.repr(self.connection_timeout),
             reprlib.repr(self.ssl),
             reprlib.repr(self._max_pending_count),
+            reprlib.repr(self._max_pending_bytes),
             reprlib.repr(self.extensions),
             reprlib.repr(self.auth),
         )
@@ -175,10 +212,26 @@ class Client:  # pylint: disable=too-many-instance-attributes
             return 0
         return self._incoming_queue.qsize()
 
+    @property
+    def pending_bytes(self) -> int:
+        """The total size in bytes of the pending incoming messages"""
+        if self._incoming_queue is None:
+            return 0
+        return self._incoming_queue.pending_bytes
+
+    @property
+    def incoming_stats(self) -> Dict[str, int]:
+        """The current and the high-water levels of the incoming message \
+        queue, and the number of times the connection was suspended because \
+        the queue was full"""
+        if self._incoming_queue is None:
+            return {}
+        return self._incoming_queue.stats()
+
     @property
     def has_pending_messages(self) -> bool:
         """Marks whether the client has any pending incoming messages"""
-        return self.pending_count > 0
+        return self.pending_count > 0 or self._held_message is not None
 
     def _pick_connection_type(
         self, connection_types: List[str]
@@ -211,7 +264,9 @@ class Client:  # pylint: disable=too-many-instance-attributes
         :raise ClientError: If none of the connection types offered by the \
         server are supported
         """
-        self._incoming_queue = asyncio.Queue(maxsize=self._max_pending_count)
+        self._incoming_queue = MessageQueue(
+            maxsize=self._max_pending_count, max_bytes=self._max_pending_bytes
+        )
         transport = create_transport(
             DEFAULT_CONNECTION_TYPE,
             url=self.url,
@@ -221,6 +276,8 @@ class Client:  # pylint: disable=too-many-instance-attributes
             auth=self.auth,
             json_dumps=self._json_dumps,
             json_loads=self._json_loads,
+            connection_pool=self.connection_pool,
+            session_provider=self.session_provider,
         )
 
         try:
@@ -267,6 +324,8 @@ class Client:  # pylint: disable=too-many-instance-attributes
                     json_loads=self._json_loads,
                     reconnect_advice=advice,
                     http_session=session,
+                    connection_pool=self.connection_pool,
+                    session_provider=self.session_provider,
                 )
             return transport
         except Exception:
@@ -299,6 +358,7 @@ class Client:  # pylint: disable=too-many-instance-attributes
         response = await self._transport.connect()
         self._verify_response(response)
         self._closed = False
+        self._start_supervisor()
 
         assert self.connection_type is not None
         LOGGER.info("Client opened with connection_type %r", self.connection_type.value)
@@ -314,6 +374,7 @@ class Client:  # pylint: disable=too-many-instance-attributes
                     self.pending_count,
                 )
             try:
+                await self._stop_supervisor()
                 if self._transport:
                     await self._transport.disconnect()
                     await self._transport.close()
@@ -341,6 +402,59 @@ class Client:  # pylint: disable=too-many-instance-attributes
         self._verify_response(response)
         LOGGER.info("Subscribed to channel %s", channel)
 
+    async def subscribe_many(self, channels: List[str]) -> Dict[str, JsonObject]:
+        """Subscribe to all the *channels* with a single request
+
+        Unlike :obj:`subscribe`, a rejected subscription doesn't raise an
+        error, the response of every channel is returned instead.
+
+        :param channels: Names of the channels
+        :return: The subscribe response of every channel
+        :raise ClientInvalidOperation: If the client is :obj:`closed`
+        :raise TransportError: If a network or transport related error occurs
+        """
+        if self.closed:
+            raise ClientInvalidOperation(
+                "Can't send subscribe request while, " "the client is closed."
+            )
+        await self._check_server_disconnected()
+
+        assert self._transport is not None
+        responses = await self._transport.subscribe_many(list(channels))
+        results = dict(zip(channels, responses))
+        for channel, response in results.items():
+            if is_server_error_message(response):
+                LOGGER.warning(
+                    "Failed to subscribe to channel %s: %r",
+                    channel,
+                    response.get("error"),
+                )
+            else:
+                LOGGER.info("Subscribed to channel %s", channel)
+        return results
+
+    async def unsubscribe_many(self, channels: List[str]) -> Dict[str, JsonObject]:
+        """Unsubscribe from all the *channels* with a single request
+
+        :param channels: Names of the channels
+        :return: The unsubscribe response of every channel
+        :raise ClientInvalidOperation: If the client is :obj:`closed`
+        :raise TransportError: If a network or transport related error occurs
+        """
+        if self.closed:
+            raise ClientInvalidOperation(
+                "Can't send unsubscribe request " "while, the client is closed."
+            )
+        await self._check_server_disconnected()
+
+        assert self._transport is not None
+        responses = await self._transport.unsubscribe_many(list(channels))
+        results = dict(zip(channels, responses))
+        for channel, response in results.items():
+            if not is_server_error_message(response):
+                LOGGER.info("Unsubscribed from channel %s", channel)
+        return results
+
     async def unsubscribe(self, channel: str) -> None:
         """Unsubscribe from *channel*
 
@@ -422,6 +536,11 @@ class Client:  # pylint: disable=too-many-instance-attributes
         :raise TransportTimeoutError: If the transport can't re-establish \
         connection with the server in :obj:`connection_timeout` time.
         """
+        if self._held_message is not None:
+            response, self._held_message = self._held_message, None
+            self._verify_response(response)
+            return response
+
         if not self.closed or self.has_pending_messages:
             response = await self._get_message(self.connection_timeout)
             self._verify_response(response)
@@ -431,6 +550,95 @@ class Client:  # pylint: disable=too-many-instance-attributes
             "The client is closed and there are " "no pending messages."
         )
 
+    async def receive_batch(
+        self, max_items: int = 100, max_wait: Union[int, float, None] = None
+    ) -> List[JsonObject]:
+        """Wait for incoming messages from the server and return all of the \
+        pending ones, up to *max_items*
+
+        Waits for the first message like :obj:`receive` does, then takes the
+        messages already pending in the incoming queue without waiting again.
+        If *max_wait* is given and the batch is not full yet, it keeps
+        collecting messages for at most *max_wait* seconds after the first
+        one arrived.
+
+        :param max_items: The maximum number of messages to return
+        :param max_wait: The maximum amount of time to wait for the batch to \
+        fill up, after the first message was received
+        :return: List of incoming messages, in the order they were received
+        :raise ClientInvalidOperation: If the client is closed, and has no \
+        more pending incoming messages
+        :raise ServerError: If the client receives a confirmation message \
+         which is not ``successful``
+        :raise TransportTimeoutError: If the transport can't re-establish \
+        connection with the server in :obj:`connection_timeout` time.
+        """
+        batch = [await self.receive()]
+        await self._receive_pending(batch, max_items, max_wait)
+        return batch
+
+    async def _receive_pending(
+        self,
+        batch: List[JsonObject],
+        max_items: int,
+        max_wait: Union[int, float, None],
+    ) -> None:
+        """Append the pending incoming messages to *batch* until it has \
+        *max_items* items
+
+        :param batch: List of already received messages
+        :param max_items: The maximum number of messages in the *batch*
+        :param max_wait: The maximum amount of time to wait for the batch to \
+        fill up
+        """
+        assert self._incoming_queue is not None
+        queue = self._incoming_queue
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_wait if max_wait else None
+
+        while len(batch) < max_items:
+            if queue.empty():
+                if deadline is None or self.closed:
+                    break
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    response = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            else:
+                response = queue.get_nowait()
+
+            if response is _WAKE_UP:
+                # the failure is raised by the next receive
+                break
+            if is_server_error_message(response):
+                # return the successful messages first, the error is raised
+                # by the next receive
+                self._held_message = response
+                break
+            batch.append(response)
+
+    async def batches(
+        self, max_items: int = 100, max_wait: Union[int, float, None] = None
+    ) -> AsyncIterator[List[JsonObject]]:
+        """Asynchronous iterator over batches of incoming messages
+
+        :param max_items: The maximum number of messages in a batch
+        :param max_wait: The maximum amount of time to wait for a batch to \
+        fill up, after its first message was received
+        :raise ServerError: If the client receives a confirmation message \
+         which is not ``successful``
+        :raise TransportTimeoutError: If the transport can't re-establish \
+        connection with the server in :obj:`connection_timeout` time.
+        """
+        while True:
+            try:
+                yield await self.receive_batch(max_items, max_wait)
+            except ClientInvalidOperation:
+                break
+
     async def __aiter__(self) -> AsyncIterator[JsonObject]:
         """Asynchronous iterator
 
@@ -472,63 +680,111 @@ class Client:  # pylint: disable=too-many-instance-attributes
         """Exit the runtime context and call :obj:`open`"""
         await self.close()
 
-    async def _get_message(self, connection_timeout: Union[int, float]) -> JsonObject:
-        """Get the next incoming message
+    def _start_supervisor(self) -> None:
+        """Start the task watching the connection of the open session"""
+        self._failure = None
+        self._supervisor_task = asyncio.ensure_future(
+            self._supervise(self.connection_timeout)
+        )
+
+    async def _stop_supervisor(self) -> None:
+        """Stop the task watching the connection"""
+        if self._supervisor_task is not None:
+            self._supervisor_task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self._supervisor_task
+            self._supervisor_task = None
+
+    def _set_failure(self, error: Exception) -> None:
+        """Signal *error* to the receive path"""
+        if self._failure is None:
+            self._failure = error
+            # wake up the receive waiting for the next message, if any
+            queue = self._incoming_queue
+            if queue is not None and queue.empty():
+                queue.put_nowait(_WAKE_UP)
+
+    def _clear_failure(self) -> None:
+        """Clear the failure signalled to the receive path"""
+        self._failure = None
+
+    async def _supervise(self, connection_timeout: Union[int, float]) -> None:
+        """Watch the state transitions of the transport for as long as the \
+        session is open
+
+        Signals a :obj:`TransportTimeoutError` while the transport can't \
+        re-establish the connection in *connection_timeout* time, and a \
+        :obj:`ServerError` once the server closes the connection.
 
         :param connection_timeout: The maximum amount of time to wait for the \
         transport to re-establish a connection with the server when the \
         connection fails.
-        :return: Incoming message
-        :raise TransportTimeoutError: If the transport can't re-establish \
-        connection with the server in :obj:`connection_timeout` time.
-        :raise ServerError: If the connection gets closed by the server.
         """
-        tasks: List[asyncio.Future[Any]] = []
-        # task waiting on connection timeout
+        assert self._transport is not None
+        watchers = [
+            asyncio.ensure_future(
+                self._transport.wait_for_state(TransportState.SERVER_DISCONNECTED)
+            )
+        ]
         if connection_timeout:
-            timeout_task = asyncio.ensure_future(
-                self._wait_connection_timeout(connection_timeout),
+            watchers.append(
+                asyncio.ensure_future(self._watch_connection(connection_timeout))
             )
-            tasks.append(timeout_task)
+        try:
+            done, _ = await asyncio.wait(watchers, return_when=asyncio.FIRST_COMPLETED)
+            if watchers[0] in done:
+                self._set_failure(
+                    ServerError(
+                        "Connection closed by the server",
+                        self._transport.last_connect_result,
+                    )
+                )
+        finally:
+            for watcher in watchers:
+                watcher.cancel()
 
-        assert self._incoming_queue is not None
-        # task waiting on incoming messages
-        get_task = asyncio.ensure_future(self._incoming_queue.get())
-        tasks.append(get_task)
+    async def _watch_connection(self, timeout: Union[int, float]) -> None:
+        """Signal a :obj:`TransportTimeoutError` for as long as the transport \
+        fails to re-establish the connection in *timeout* time
 
+        :param timeout: The maximum amount of time to wait for the \
+        transport to re-establish a connection with the server when the \
+        connection fails.
+        """
         assert self._transport is not None
-        # task waiting on server side disconnect
-        server_disconnected_task = asyncio.ensure_future(
-            self._transport.wait_for_state(TransportState.SERVER_DISCONNECTED),
-        )
-        tasks.append(server_disconnected_task)
-
-        try:
-            done, pending = await asyncio.wait(
-                tasks,
-                return_when=asyncio.FIRST_COMPLETED,
-            )
+        while True:
+            await self._wait_connection_timeout(timeout)
+            self._set_failure(TransportTimeoutError("Lost connection with the server."))
+            # the transport keeps trying to reconnect, receiving works again
+            # once it succeeds
+            await self._transport.wait_for_state(TransportState.CONNECTED)
+            self._clear_failure()
 
-            # cancel all pending tasks
-            for task in pending:
-                task.cancel()
+    async def _get_message(self, connection_timeout: Union[int, float]) -> JsonObject:
+        """Get the next incoming message
 
-            # handle the completed task
-            if get_task in done:
-                return get_task.result()
+        Pending messages are returned right away. Otherwise the message is
+        awaited, until the supervisor task signals a failure and wakes the
+        receive up.
 
-            if server_disconnected_task in done:
-                await self.close()
-                raise ServerError(
-                    "Connection closed by the server",
-                    self._transport.last_connect_result,
-                )
-            raise TransportTimeoutError("Lost connection with the server.")
-        except asyncio.CancelledError:
-            # cancel all tasks
-            for task in tasks:
-                task.cancel()
-            raise
+        :param connection_timeout: The maximum amount of time to wait for the \
+        transport to re-establish a connection with the server when the \
+        connection fails.
+        :return: Incoming message
+        :raise TransportTimeoutError: If the transport can't re-establish \
+        connection with the server in :obj:`connection_timeout` time.
+        :raise ServerError: If the connection gets closed by the server.
+        """
+        assert self._incoming_queue is not None
+        while True:
+            error = self._failure
+            if error is not None and self._incoming_queue.empty() and not self.closed:
+                if isinstance(error, ServerError):
+                    await self.close()
+                raise error
+            message = await self._incoming_queue.get()
+            if message is not _WAKE_UP:
+                return message
 
     async def _wait_connection_timeout(self, timeout: Union[int, float]) -> None:
         """Wait for and return when the transport can't re-establish \
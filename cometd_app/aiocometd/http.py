@@ -0,0 +1,132 @@
+"""HTTP connection pool settings and session sharing"""
+
+import reprlib
+import ssl as ssl_module
+from typing import Any, Dict, NamedTuple, Optional, Union
+
+import aiohttp
+
+from aiocometd.typing import SSLValidationMode, JsonDumper
+from aiocometd.json_codec import json_dumps as default_json_dumps
+
+
+class ConnectionPoolOptions(NamedTuple):
+    """Settings of the connection pools used by the transports
+
+    .. note::
+
+        aiohttp enables ``TCP_NODELAY`` on every client connection, and
+        doesn't support HTTP/1.1 pipelining. Requests that shouldn't wait for
+        each other are sent on separate keep-alive connections of the pool
+        instead.
+    """
+
+    #: The maximum number of simultaneous connections, 0 for no limit
+    limit: int = 100
+    #: The maximum number of simultaneous connections to the same host, 0 \
+    #: for no limit
+    limit_per_host: int = 0
+    #: The time in seconds to keep idle connections open for reuse
+    keepalive_timeout: Union[int, float] = 30.0
+    #: Time to live of the cached DNS entries in seconds, ``None`` caches \
+    #: them forever
+    ttl_dns_cache: Optional[int] = 300
+    #: Marks whether to cache the DNS lookups
+    use_dns_cache: bool = True
+    #: Marks whether to close the connections after every request
+    force_close: bool = False
+    #: The maximum number of concurrent requests other than the long poll \
+    #: ``/meta/connect`` request of the long-polling transport
+    max_concurrent_requests: int = 4
+
+
+def create_connector(
+    options: Optional[ConnectionPoolOptions] = None,
+    ssl: Optional[SSLValidationMode] = None,
+) -> aiohttp.TCPConnector:
+    """Create a connector with the connection pool *options*
+
+    :param options: Connection pool settings, if ``None`` the defaults of \
+    :obj:`ConnectionPoolOptions` are used
+    :param ssl: SSL validation mode used for the connections by default
+    :return: A new connector
+    """
+    options = options or ConnectionPoolOptions()
+    kwargs: Dict[str, Any] = {}
+    if ssl is not None:
+        kwargs["ssl"] = ssl
+    if not options.force_close:
+        # aiohttp doesn't allow a keep-alive timeout with force_close
+        kwargs["keepalive_timeout"] = options.keepalive_timeout
+    return aiohttp.TCPConnector(
+        limit=options.limit,
+        limit_per_host=options.limit_per_host,
+        ttl_dns_cache=options.ttl_dns_cache,
+        use_dns_cache=options.use_dns_cache,
+        force_close=options.force_close,
+        **kwargs,
+    )
+
+
+class HttpSessionProvider:
+    """Provides a single HTTP session, shared by the transports, the \
+    authenticator and REST calls
+
+    All the requests made through the shared session reuse the same
+    connection pool, TLS context and cookie jar, so consecutive requests to
+    the same host don't need new TCP connections and TLS handshakes. The
+    session is created on first use and recreated if it gets closed.
+    """
+
+    def __init__(
+        self,
+        connection_pool: Optional[ConnectionPoolOptions] = None,
+        ssl: Optional[SSLValidationMode] = None,
+        json_dumps: JsonDumper = default_json_dumps,
+    ) -> None:
+        """
+        :param connection_pool: Settings of the connection pool
+        :param ssl: SSL validation mode. None for default SSL check \
+        (a single context created with :func:`ssl.create_default_context` \
+        is used for every connection), False for skip SSL certificate \
+        validation, :obj:`aiohttp.Fingerprint` for fingerprint validation, \
+        :obj:`ssl.SSLContext` for custom SSL certificate validation.
+        :param json_dumps: Function for JSON serialization
+        """
+        #: Settings of the connection pool
+        self.connection_pool = connection_pool or ConnectionPoolOptions()
+        #: SSL validation mode
+        self.ssl = ssl if ssl is not None else ssl_module.create_default_context()
+        #: Function for JSON serialization
+        self.json_dumps = json_dumps
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def __repr__(self) -> str:
+        """Formal string representation"""
+        cls_name = type(self).__name__
+        return f"{cls_name}(connection_pool={reprlib.repr(self.connection_pool)})"
+
+    @property
+    def closed(self) -> bool:
+        """Marks whether the provider has no open session"""
+        return self._session is None or self._session.closed
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """Return the shared session, creating it if necessary
+
+        :return: The shared HTTP session
+        """
+        if self.closed:
+            self._session = aiohttp.ClientSession(
+                connector=create_connector(self.connection_pool, self.ssl),
+                json_serialize=self.json_dumps,
+            )
+        assert self._session is not None
+        return self._session
+
+    async def close(self) -> None:
+        """Close the shared session"""
+        if not self.closed:
+            assert self._session is not None
+            await self._session.close()
+        self._session = None
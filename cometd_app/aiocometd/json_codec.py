@@ -0,0 +1,67 @@
+"""JSON codec used by default for serializing and deserializing messages
+
+If `orjson <https://github.com/ijl/orjson>`_ is installed it's used as the
+backend, otherwise the functions fall back to the :mod:`json` module of the
+standard library. The output of both backends is compact, without
+indentation or extra whitespace.
+"""
+
+import json
+from typing import Any, Union
+
+from aiocometd.typing import JsonObject
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None  # type: ignore
+
+
+#: Name of the selected JSON backend
+BACKEND = "orjson" if orjson is not None else "json"
+
+_stdlib_dumps = json.JSONEncoder(
+    ensure_ascii=False, separators=(",", ":")
+).encode
+
+
+def json_dumps_bytes(obj: Any) -> bytes:
+    """Serialize *obj* to UTF-8 encoded JSON
+
+    :param obj: A JSON serializable object
+    :return: The serialized object
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # orjson rejects a few inputs the standard library accepts, like
+            # non string keys or integers wider than 64 bits
+            pass
+    return _stdlib_dumps(obj).encode("utf-8")
+
+
+def json_dumps(obj: Any) -> str:
+    """Serialize *obj* to a JSON formatted :obj:`str`
+
+    :param obj: A JSON serializable object
+    :return: The serialized object
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except TypeError:
+            pass
+    return _stdlib_dumps(obj)
+
+
+def json_loads(data: Union[str, bytes]) -> JsonObject:
+    """Deserialize *data*, a JSON document as :obj:`str` or UTF-8 encoded \
+    :obj:`bytes`
+
+    :param data: A JSON document
+    :return: The deserialized object
+    """
+    if orjson is not None:
+        return orjson.loads(data)  # type: ignore
+    return json.loads(data)  # type: ignore
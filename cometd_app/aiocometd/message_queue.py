@@ -0,0 +1,104 @@
+"""Incoming message queue class definition"""
+
+import asyncio
+from collections import deque
+from typing import Dict, Tuple, Deque
+
+from aiocometd.typing import JsonObject
+
+
+class MessageQueue(asyncio.Queue):  # type: ignore
+    """Queue of incoming messages bounded by the number of messages and by \
+    the total size of their payloads
+
+    The queue is :meth:`full` once it holds *maxsize* messages, or once the
+    size of the pending messages reaches *max_bytes*. The transports put the
+    received messages in the queue with :meth:`put`, so their connect loop
+    is suspended until the consumer makes room again. A single message is
+    always accepted by an empty queue, even if it's larger than *max_bytes*.
+    """
+
+    def __init__(self, maxsize: int = 0, max_bytes: int = 0) -> None:
+        """
+        :param maxsize: The maximum number of pending messages. If it is \
+        less than or equal to zero, the count is infinite.
+        :param max_bytes: The maximum total payload size of the pending \
+        messages. If it is less than or equal to zero, the size is infinite.
+        """
+        super().__init__(maxsize)
+        #: The maximum total payload size of the pending messages
+        self.max_bytes = max_bytes
+        #: The total payload size of the pending messages
+        self.pending_bytes = 0
+        #: The highest number of pending messages so far
+        self.high_water_count = 0
+        #: The highest total payload size of the pending messages so far
+        self.high_water_bytes = 0
+        #: The number of times a producer had to wait for the queue to have \
+        #: room for its message
+        self.full_count = 0
+        # payload sizes of the messages passed to put, until they're queued
+        self._sizes: Dict[int, int] = {}
+
+    def _init(self, maxsize: int) -> None:
+        self._queue: Deque[Tuple[JsonObject, int]] = deque()
+
+    def _put(self, item: JsonObject) -> None:
+        size = self._sizes.pop(id(item), 0)
+        self._queue.append((item, size))
+        self.pending_bytes += size
+        self.high_water_count = max(self.high_water_count, len(self._queue))
+        self.high_water_bytes = max(self.high_water_bytes, self.pending_bytes)
+
+    def _get(self) -> JsonObject:
+        item, size = self._queue.popleft()
+        self.pending_bytes -= size
+        return item
+
+    def full(self) -> bool:
+        """Return ``True`` if there is no room for another message"""
+        if super().full():
+            return True
+        return self.max_bytes > 0 and self.pending_bytes >= self.max_bytes
+
+    async def put(self, item: JsonObject, size: int = 0) -> None:
+        """Put the *item* into the queue, waiting for a free slot if the \
+        queue is full
+
+        :param item: An incoming message
+        :param size: The size of the message's payload in bytes
+        """
+        if self.full():
+            self.full_count += 1
+        self._sizes[id(item)] = size
+        try:
+            await super().put(item)
+        except BaseException:
+            self._sizes.pop(id(item), None)
+            raise
+
+    def put_nowait(self, item: JsonObject, size: int = 0) -> None:
+        """Put the *item* into the queue without blocking
+
+        :param item: An incoming message
+        :param size: The size of the message's payload in bytes
+        :raise asyncio.QueueFull: If the queue is full
+        """
+        # keep the size registered by put, which calls this method when the
+        # queue has room
+        self._sizes.setdefault(id(item), size)
+        try:
+            super().put_nowait(item)
+        except asyncio.QueueFull:
+            self._sizes.pop(id(item), None)
+            raise
+
+    def stats(self) -> Dict[str, int]:
+        """Return the current and the high-water levels of the queue"""
+        return {
+            "pending_count": self.qsize(),
+            "pending_bytes": self.pending_bytes,
+            "high_water_count": self.high_water_count,
+            "high_water_bytes": self.high_water_bytes,
+            "full_count": self.full_count,
+        }
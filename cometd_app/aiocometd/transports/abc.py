@@ -117,6 +117,30 @@ class Transport(ABC):
         :raises TransportError: When the network request fails.
         """
 
+    @abstractmethod
+    async def subscribe_many(self, channels: List[str]) -> List[JsonObject]:
+        """Subscribe to all the *channels* with a single payload
+
+        :param channels: Names of the channels
+        :return: Subscribe responses, in the order of the *channels*
+        :raise TransportInvalidOperation: If the transport is not in the \
+        :obj:`~TransportState.CONNECTED` or :obj:`~TransportState.CONNECTING` \
+        :obj:`state`
+        :raises TransportError: When the network request fails.
+        """
+
+    @abstractmethod
+    async def unsubscribe_many(self, channels: List[str]) -> List[JsonObject]:
+        """Unsubscribe from all the *channels* with a single payload
+
+        :param channels: Names of the channels
+        :return: Unsubscribe responses, in the order of the *channels*
+        :raise TransportInvalidOperation: If the transport is not in the \
+        :obj:`~TransportState.CONNECTED` or :obj:`~TransportState.CONNECTING` \
+        :obj:`state`
+        :raises TransportError: When the network request fails.
+        """
+
     @abstractmethod
     async def publish(self, channel: str, data: JsonObject) -> JsonObject:
         """Publish *data* to the given *channel*
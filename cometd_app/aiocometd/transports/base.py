@@ -4,10 +4,10 @@ import asyncio
 import logging
 from abc import abstractmethod
 from contextlib import suppress
-import json
-from typing import Union, Optional, List, Set, Awaitable, Any
+from typing import Union, Optional, List, Set, Tuple, Awaitable, Any
 
 import aiohttp
+import aiohttp.abc
 
 from aiocometd.constants import (
     ConnectionType,
@@ -36,6 +36,16 @@ from aiocometd.typing import (
     Payload,
 )
 from aiocometd.extensions import Extension, AuthExtension
+from aiocometd.message_queue import MessageQueue
+from aiocometd.http import (
+    ConnectionPoolOptions,
+    HttpSessionProvider,
+    create_connector,
+)
+from aiocometd.json_codec import (
+    json_dumps as default_json_dumps,
+    json_loads as default_json_loads,
+)
 from aiocometd.transports.abc import Transport
 
 
@@ -66,10 +76,12 @@ class TransportBase(Transport):  # pylint: disable=too-many-instance-attributes
         ssl: Optional[SSLValidationMode] = None,
         extensions: Optional[List[Extension]] = None,
         auth: Optional[AuthExtension] = None,
-        json_dumps: JsonDumper = json.dumps,
-        json_loads: JsonLoader = json.loads,
+        json_dumps: JsonDumper = default_json_dumps,
+        json_loads: JsonLoader = default_json_loads,
         reconnect_advice: Optional[JsonObject] = None,
         http_session: Optional[aiohttp.ClientSession] = None,
+        connection_pool: Optional[ConnectionPoolOptions] = None,
+        session_provider: Optional[HttpSessionProvider] = None,
         loop: Optional[asyncio.AbstractEventLoop] = None,
     ) -> None:
         """
@@ -89,11 +101,16 @@ class TransportBase(Transport):  # pylint: disable=too-many-instance-attributes
         :param extensions: List of protocol extension objects
         :param auth: An auth extension
         :param json_dumps: Function for JSON serialization, the default is \
-        :func:`json.dumps`
+        :func:`aiocometd.json_codec.json_dumps`
         :param json_loads: Function for JSON deserialization, the default is \
-        :func:`json.loads`
+        :func:`aiocometd.json_codec.json_loads`
         :param reconnect_advice: Initial reconnect advice
         :param http_session: HTTP client session
+        :param connection_pool: Settings of the connection pool of the \
+        HTTP sessions created by the transport
+        :param session_provider: Provider of a shared HTTP session. If it's \
+        given, the transport sends its requests with the shared session \
+        instead of creating its own.
         :param loop: Event :obj:`loop <asyncio.BaseEventLoop>` used to
                      schedule tasks. If *loop* is ``None`` then
                      :func:`asyncio.get_event_loop` is used to get the default
@@ -124,10 +141,19 @@ class TransportBase(Transport):  # pylint: disable=too-many-instance-attributes
         self._connect_task: Optional[asyncio.Future[JsonObject]] = None
         #: time to wait before reconnecting after a network failure
         self._reconnect_timeout = reconnection_timeout
+        #: sent messages waiting for their response message, with the \
+        #: futures to resolve with it
+        self._response_waiters: List[
+            Tuple[JsonObject, "asyncio.Future[JsonObject]"]
+        ] = []
         #: SSL validation mode
         self.ssl = ssl
         #: http session
         self._http_session = http_session
+        #: settings of the connection pool of the created http sessions
+        self.connection_pool = connection_pool or ConnectionPoolOptions()
+        #: provider of a shared http session
+        self._session_provider = session_provider
         #: List of protocol extension objects
         self._extensions = extensions or []
         #: An auth extension
@@ -147,10 +173,27 @@ class TransportBase(Transport):  # pylint: disable=too-many-instance-attributes
         # initialized, but this seems to be the right way to do it since
         # aiohttp produces log messages with warnings that a session should be
         # created in a coroutine
+        # the shared session is owned, and closed, by its provider
+        if self._session_provider is not None:
+            return await self._session_provider.get_session()
         if self._http_session is None:
-            self._http_session = aiohttp.ClientSession(json_serialize=self._json_dumps)
+            self._http_session = self._create_http_session()
         return self._http_session
 
+    def _create_http_session(
+        self, cookie_jar: Optional[aiohttp.abc.AbstractCookieJar] = None
+    ) -> aiohttp.ClientSession:
+        """Create a new HTTP session with its own connection pool
+
+        :param cookie_jar: Cookie jar to share with another session
+        :return: A new session
+        """
+        return aiohttp.ClientSession(
+            connector=create_connector(self.connection_pool, self.ssl),
+            cookie_jar=cookie_jar,
+            json_serialize=self._json_dumps,
+        )
+
     async def _close_http_session(self) -> None:
         """Close the http session if it's not already closed"""
         # graceful shutdown recommended by the documentation
@@ -361,6 +404,69 @@ class TransportBase(Transport):  # pylint: disable=too-many-instance-attributes
         # send the payload to the server
         return await self._send_final_payload(payload, headers=headers)
 
+    def _resolve_waiter(self, response_message: JsonObject) -> bool:
+        """Set the *response_message* as the result of the waiter of the \
+        message it responds to
+
+        :param response_message: A response message
+        :return: True if a waiter was found for the *response_message*
+        """
+        for index, (message, future) in enumerate(self._response_waiters):
+            if is_matching_response(response_message, message):
+                del self._response_waiters[index]
+                if not future.done():
+                    future.set_result(response_message)
+                return True
+        return False
+
+    async def _send_batch(self, payload: Payload) -> List[JsonObject]:
+        """Finalize and send *payload* to server and return the responses for \
+        all of its messages
+
+        :param payload: A list of messages
+        :return: The response messages, in the order of the messages in the \
+        *payload*
+        :raises TransportError: When the network request fails or when no \
+        response is received for some of the messages.
+        """
+        # the ids of the messages are only assigned when the payload gets
+        # finalized, so the waiters match on the message objects themselves
+        waiters = [
+            (message, self._loop.create_future()) for message in payload[1:]
+        ]
+        self._response_waiters.extend(waiters)
+        try:
+            first_response = await self._send_payload(payload)
+            futures = [future for _, future in waiters]
+            if futures:
+                done, _ = await asyncio.wait(futures, timeout=self.request_timeout)
+                if len(done) != len(futures):
+                    raise TransportError(
+                        "No response message received for some of the "
+                        "messages in the payload"
+                    )
+            return [first_response] + [future.result() for future in futures]
+        finally:
+            for waiter in waiters:
+                if waiter in self._response_waiters:
+                    self._response_waiters.remove(waiter)
+
+    async def _send_batch_with_auth(self, payload: Payload) -> List[JsonObject]:
+        """Send *payload* with :meth:`_send_batch` and retry on \
+        authentication failure
+
+        :param payload: A list of messages
+        :return: The response messages, in the order of the messages in the \
+        *payload*
+        :raises TransportError: When the network request fails.
+        """
+        responses = await self._send_batch(payload)
+
+        if self._auth and any(is_auth_error_message(_) for _ in responses):
+            await self._auth.authenticate()
+            return await self._send_batch(payload)
+        return responses
+
     async def _process_outgoing_payload(
         self, payload: Payload, headers: Headers
     ) -> None:
@@ -394,14 +500,20 @@ class TransportBase(Transport):  # pylint: disable=too-many-instance-attributes
         :raises TransportError: When the network request fails.
         """
 
-    async def _consume_message(self, response_message: JsonObject) -> None:
+    async def _consume_message(
+        self, response_message: JsonObject, size: int = 0
+    ) -> None:
         """Enqueue the *response_message* for consumers if it's a type of
         message that consumers should receive
 
         :param response_message: A response message
+        :param size: The (estimated) size of the message in bytes
         """
         if is_event_message(response_message):
-            await self.incoming_queue.put(response_message)
+            if isinstance(self.incoming_queue, MessageQueue):
+                await self.incoming_queue.put(response_message, size)
+            else:
+                await self.incoming_queue.put(response_message)
 
     def _update_subscriptions(self, response_message: JsonObject) -> None:
         """Update the set of subscriptions based on the *response_message*
@@ -451,6 +563,7 @@ class TransportBase(Transport):  # pylint: disable=too-many-instance-attributes
         *,
         headers: Optional[Headers] = None,
         find_response_for: Optional[JsonObject] = None,
+        payload_size: int = 0,
     ) -> Optional[JsonObject]:
         """Enqueue event messages for the consumers and update the internal
         state of the transport, based on response messages in the *payload*.
@@ -459,12 +572,17 @@ class TransportBase(Transport):  # pylint: disable=too-many-instance-attributes
         :param headers: Received headers
         :param find_response_for: Find and return the matching \
         response message for the given *find_response_for* message.
+        :param payload_size: The size of the received payload in bytes, \
+        used to account for the size of the enqueued messages
         :return: The response message for the *find_response_for* message, \
         otherwise ``None``
         """
         # process incoming payload and headers with the extensions
         await self._process_incoming_payload(payload, headers)
 
+        # the messages are decoded together, so split the size evenly
+        message_size = payload_size // len(payload) if payload else 0
+
         # return None if no response message is found for *find_response_for*
         result = None
         for message in payload:
@@ -482,7 +600,12 @@ class TransportBase(Transport):  # pylint: disable=too-many-instance-attributes
                 result = message
                 continue
 
-            await self._consume_message(message)
+            # resolve the waiter of the message if it's a response for a
+            # message sent by _send_batch
+            if self._response_waiters and self._resolve_waiter(message):
+                continue
+
+            await self._consume_message(message, message_size)
         return result
 
     def _start_connect_task(self, coro: Awaitable[JsonObject]) -> Awaitable[JsonObject]:
@@ -663,6 +786,48 @@ class TransportBase(Transport):  # pylint: disable=too-many-instance-attributes
             )
         return await self._send_message(SUBSCRIBE_MESSAGE.copy(), subscription=channel)
 
+    async def subscribe_many(self, channels: List[str]) -> List[JsonObject]:
+        """Subscribe to all the *channels* with a single payload
+
+        :param channels: Names of the channels
+        :return: Subscribe responses, in the order of the *channels*
+        :raise TransportInvalidOperation: If the transport is not in the \
+        :obj:`~TransportState.CONNECTED` or :obj:`~TransportState.CONNECTING` \
+        :obj:`state`
+        :raises TransportError: When the network request fails.
+        """
+        if self.state not in [TransportState.CONNECTING, TransportState.CONNECTED]:
+            raise TransportInvalidOperation(
+                "Can't subscribe without being connected to a server."
+            )
+        if not channels:
+            return []
+        payload = [
+            dict(SUBSCRIBE_MESSAGE, subscription=channel) for channel in channels
+        ]
+        return await self._send_batch_with_auth(payload)
+
+    async def unsubscribe_many(self, channels: List[str]) -> List[JsonObject]:
+        """Unsubscribe from all the *channels* with a single payload
+
+        :param channels: Names of the channels
+        :return: Unsubscribe responses, in the order of the *channels*
+        :raise TransportInvalidOperation: If the transport is not in the \
+        :obj:`~TransportState.CONNECTED` or :obj:`~TransportState.CONNECTING` \
+        :obj:`state`
+        :raises TransportError: When the network request fails.
+        """
+        if self.state not in [TransportState.CONNECTING, TransportState.CONNECTED]:
+            raise TransportInvalidOperation(
+                "Can't unsubscribe without being connected to a server."
+            )
+        if not channels:
+            return []
+        payload = [
+            dict(UNSUBSCRIBE_MESSAGE, subscription=channel) for channel in channels
+        ]
+        return await self._send_batch_with_auth(payload)
+
     async def unsubscribe(self, channel: str) -> JsonObject:
         """Unsubscribe from *channel*
 
@@ -2,11 +2,11 @@
 
 import asyncio
 import logging
-from typing import Any
+from typing import Any, Optional
 
 import aiohttp
 
-from aiocometd.constants import ConnectionType
+from aiocometd.constants import ConnectionType, MetaChannel
 from aiocometd.exceptions import TransportError
 from aiocometd.typing import JsonObject
 from aiocometd.transports.registry import register_transport
@@ -18,20 +18,57 @@ LOGGER = logging.getLogger(__name__)
 
 @register_transport(ConnectionType.LONG_POLLING)
 class LongPollingTransport(TransportBase):
-    """Long-polling type transport"""
+    """Long-polling type transport
+
+    The long poll ``/meta/connect`` requests are sent on the connection pool
+    of the transport's HTTP session, while every other request (handshake,
+    subscribe, publish, ...) is sent on a second session with its own
+    connection pool, so they never queue behind a pending long poll. The two
+    sessions share their cookies. With a shared session provider, both kinds
+    of requests are sent with the shared session.
+    """
 
     def __init__(self, **kwargs: Any) -> None:
         super().__init__(**kwargs)
 
-        #: semaphore to limit the number of concurrent HTTP connections to 2
-        self._http_semaphore = asyncio.Semaphore(2)
+        #: semaphore allowing a single long poll request at a time
+        self._connect_semaphore = asyncio.Semaphore(1)
+        #: semaphore to limit the number of concurrent requests other than
+        #: the long poll
+        self._http_semaphore = asyncio.Semaphore(
+            self.connection_pool.max_concurrent_requests
+        )
+        #: http session for the requests other than the long poll
+        self._request_session: Optional[aiohttp.ClientSession] = None
+
+    async def _get_request_session(self) -> aiohttp.ClientSession:
+        """Get the HTTP session used for the requests other than the long \
+        poll
+
+        :return: HTTP session sharing its cookie jar with the session of the \
+        long poll requests
+        """
+        session = await self._get_http_session()
+        if self._session_provider is not None:
+            # the pool of the shared session is large enough for both
+            return session
+        if self._request_session is None or self._request_session.closed:
+            self._request_session = self._create_http_session(
+                cookie_jar=session.cookie_jar
+            )
+        return self._request_session
 
     async def _send_final_payload(
         self, payload: Payload, *, headers: Headers
     ) -> JsonObject:
-        try:
+        if payload[0]["channel"] == MetaChannel.CONNECT:
             session = await self._get_http_session()
-            async with self._http_semaphore:
+            semaphore = self._connect_semaphore
+        else:
+            session = await self._get_request_session()
+            semaphore = self._http_semaphore
+        try:
+            async with semaphore:
                 response = await session.post(
                     self._url,
                     json=payload,
@@ -39,13 +76,21 @@ class LongPollingTransport(TransportBase):
                     headers=headers,
                     timeout=self.request_timeout,
                 )
-            response_payload = await response.json(loads=self._json_loads)
+            # decode the raw body, without converting it to text first
+            body = await response.read()
+            response_payload = self._json_loads(body)
             headers = response.headers
         except aiohttp.client_exceptions.ClientError as error:
             LOGGER.warning("Failed to send payload, %s", error)
             raise TransportError(str(error)) from error
+        except ValueError as error:
+            LOGGER.warning("Received invalid response from the server, %s", error)
+            raise TransportError(str(error)) from error
         response_message = await self._consume_payload(
-            response_payload, headers=headers, find_response_for=payload[0]
+            response_payload,
+            headers=headers,
+            find_response_for=payload[0],
+            payload_size=len(body),
         )
 
         if response_message is None:
@@ -55,3 +100,8 @@ class LongPollingTransport(TransportBase):
             LOGGER.warning(error_message)
             raise TransportError(error_message)
         return response_message
+
+    async def close(self) -> None:
+        if self._request_session is not None and not self._request_session.closed:
+            await self._request_session.close()
+        await super().close()
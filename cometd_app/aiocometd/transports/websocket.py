@@ -3,12 +3,23 @@
 import asyncio
 import logging
 from contextlib import suppress
-from typing import Callable, Optional, AsyncContextManager, Any, Awaitable, cast, Dict
+from typing import (
+    Callable,
+    Optional,
+    AsyncContextManager,
+    Any,
+    Awaitable,
+    cast,
+    Dict,
+    List,
+    Set,
+    Tuple,
+)
 
 import aiohttp
 import aiohttp.client_ws
 
-from aiocometd.constants import ConnectionType
+from aiocometd.constants import ConnectionType, MetaChannel, META_CHANNEL_PREFIX
 from aiocometd.exceptions import TransportError, TransportConnectionClosed
 from aiocometd.typing import JsonObject
 from aiocometd.transports.registry import register_transport
@@ -87,7 +98,22 @@ class WebSocketFactory:  # pylint: disable=too-few-public-methods
 class WebSocketTransport(TransportBase):
     """WebSocket type transport"""
 
-    def __init__(self, **kwargs: Any):
+    def __init__(
+        self,
+        *,
+        coalesce_window: float = 0.005,
+        max_batch_size: int = 100,
+        **kwargs: Any,
+    ):
+        """
+        :param coalesce_window: The time in seconds to wait for more \
+        subscribe, unsubscribe and publish messages to send in the same \
+        payload. If it is less than or equal to zero, every message is sent \
+        on its own.
+        :param max_batch_size: The maximum number of messages to send in one \
+        coalesced payload
+        :param kwargs: Keyword arguments for :obj:`TransportBase`
+        """
         super().__init__(**kwargs)
         #: factory for creating websockets
         self._socket_factory = WebSocketFactory(self._get_http_session)
@@ -96,6 +122,16 @@ class WebSocketTransport(TransportBase):
         self._pending_exhanges: Dict[int, "asyncio.Future[JsonObject]"] = dict()
         #: task for receiving incoming messages
         self._receive_task: Optional["asyncio.Task[None]"] = None
+        #: the time to wait for more messages to coalesce into one payload
+        self.coalesce_window = coalesce_window
+        #: the maximum number of messages in a coalesced payload
+        self.max_batch_size = max_batch_size
+        #: outgoing messages waiting to be sent, with their response futures
+        self._outbox: List[Tuple[JsonObject, "asyncio.Future[JsonObject]"]] = []
+        #: handle of the scheduled flush of the outbox
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        #: tasks sending coalesced payloads
+        self._batch_tasks: Set["asyncio.Future[None]"] = set()
 
     async def _reset_socket(self) -> None:
         """Close the socket factory and recreate it"""
@@ -185,6 +221,125 @@ class WebSocketTransport(TransportBase):
             LOGGER.warning("Failed to send payload, %s", error)
             raise TransportError(str(error)) from error
 
+    @staticmethod
+    def _is_coalescable(payload: Payload) -> bool:
+        """Check whether the *payload* can be sent together with others
+
+        Only single subscribe, unsubscribe and publish messages are
+        coalesced, the handshake, connect and disconnect messages are
+        always sent right away.
+
+        :param payload: A list of messages
+        :return: True if the *payload* can be coalesced
+        """
+        if len(payload) != 1:
+            return False
+        channel = payload[0]["channel"]
+        return channel in (
+            MetaChannel.SUBSCRIBE,
+            MetaChannel.UNSUBSCRIBE,
+        ) or not channel.startswith(META_CHANNEL_PREFIX)
+
+    async def _send_payload(self, payload: Payload) -> JsonObject:
+        if self.coalesce_window <= 0 or not self._is_coalescable(payload):
+            return await super()._send_payload(payload)
+
+        # queue the message and wait for the response to it, which is set by
+        # _set_exchange_results once the coalesced payload gets answered
+        future: "asyncio.Future[JsonObject]" = self._loop.create_future()
+        self._outbox.append((payload[0], future))
+        if len(self._outbox) >= self.max_batch_size:
+            self._flush_outbox()
+        elif self._flush_handle is None:
+            self._flush_handle = self._loop.call_later(
+                self.coalesce_window, self._flush_outbox
+            )
+        return await future
+
+    def _flush_outbox(self) -> None:
+        """Send the queued messages in a single payload"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        # skip the messages whose sender stopped waiting for them
+        batch = [item for item in self._outbox if not item[1].done()]
+        self._outbox = []
+        if batch:
+            task = asyncio.ensure_future(
+                self._send_outbox_batch(batch), loop=self._loop
+            )
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+
+    async def _send_outbox_batch(
+        self, batch: List[Tuple[JsonObject, "asyncio.Future[JsonObject]"]]
+    ) -> None:
+        """Send the messages of the *batch* in a single payload
+
+        :param batch: List of messages and the futures awaiting their \
+        responses
+        """
+        payload = [message for message, _ in batch]
+        try:
+            self._finalize_payload(payload)
+            headers: Headers = {}
+            await self._process_outgoing_payload(payload, headers)
+            try:
+                try:
+                    socket = await self._get_socket(headers)
+                    responses = await self._send_socket_batch(socket, payload)
+                except asyncio.TimeoutError:
+                    await self._reset_socket()
+                    raise
+                except TransportConnectionClosed:
+                    # like in _send_final_payload, reopen the socket and
+                    # resend the payload once
+                    socket = await self._get_socket(headers)
+                    responses = await self._send_socket_batch(socket, payload)
+            except aiohttp.client_exceptions.ClientError as error:
+                LOGGER.warning("Failed to send payload, %s", error)
+                raise TransportError(str(error)) from error
+            for (_, future), response in zip(batch, responses):
+                if not future.done():
+                    future.set_result(response)
+        except Exception as error:  # pylint: disable=broad-except
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+
+    async def _send_socket_batch(
+        self, socket: WebSocket, payload: Payload
+    ) -> List[JsonObject]:
+        """Send *payload* to the server on the given *socket* and wait for \
+        the responses to all of its messages
+
+        :param socket: WebSocket object
+        :param payload: A list of messages
+        :return: The response messages, in the order of the messages in the \
+        *payload*
+        :raises TransportConnectionClosed: When the *socket* receives a CLOSE \
+        message instead of the expected responses
+        """
+        futures: List["asyncio.Future[JsonObject]"] = []
+        for message in payload:
+            future: "asyncio.Future[JsonObject]" = self._loop.create_future()
+            self._pending_exhanges[message["id"]] = future
+            futures.append(future)
+        try:
+            await socket.send_json(payload, dumps=self._json_dumps)
+        except Exception as error:
+            self._set_exchange_errors(error)
+            raise
+
+        self._start_receive_task(socket)
+        await asyncio.wait(futures)
+        # retrieve every exception, the futures fail together
+        errors = [future.exception() for future in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+        return [future.result() for future in futures]
+
     async def _send_socket_payload(
         self, socket: WebSocket, payload: Payload
     ) -> JsonObject:
@@ -247,7 +402,9 @@ class WebSocketTransport(TransportBase):
                     )
 
                 # consume all event messages in the payload
-                await self._consume_payload(response_payload)
+                await self._consume_payload(
+                    response_payload, payload_size=len(response.data)
+                )
 
                 # set results of matching exchanges
                 self._set_exchange_results(response_payload)
@@ -271,6 +428,11 @@ class WebSocketTransport(TransportBase):
         LOGGER.debug("Recevie task finished with: %r", result)
 
     async def close(self) -> None:
+        # send the queued messages and wait for the coalesced payloads to be
+        # written before closing the socket
+        self._flush_outbox()
+        if self._batch_tasks:
+            await asyncio.wait(list(self._batch_tasks))
         # cancel the receive task if it exists and wait for its completeion
         if self._receive_task is not None and not self._receive_task.done():
             self._receive_task.cancel()
@@ -14,8 +14,8 @@ CoroFunction = Callable[..., Awaitable[Any]]
 JsonObject = Dict[str, Any]
 #: JSON serializer function
 JsonDumper = Callable[[JsonObject], str]
-#: JSON deserializer function
-JsonLoader = Callable[[str], JsonObject]
+#: JSON deserializer function, accepting either text or UTF-8 encoded bytes
+JsonLoader = Callable[[Union[str, bytes]], JsonObject]
 #: Message payload (list of messages)
 Payload = List[JsonObject]
 #: Header values
@@ -12,6 +12,10 @@ from aiosfstream.replay import MappingStorage  # noqa: F401
 from aiosfstream.replay import DefaultMappingStorage  # noqa: F401
 from aiosfstream.replay import ConstantReplayId  # noqa: F401
 from aiosfstream.replay import ReplayMarkerStorage  # noqa: F401
+from aiosfstream.replay import PersistentStorage  # noqa: F401
+from aiosfstream.replay import SQLiteStorage, MmapStorage  # noqa: F401
+from aiosfstream.rest import RestClient  # noqa: F401
+from aiosfstream.token_cache import TokenCache  # noqa: F401
 
 # Create a default handler to avoid warnings in applications without logging
 # configuration
@@ -1,18 +1,29 @@
 """Authenticatior class implementations"""
 
 from abc import abstractmethod
+import asyncio
 from http import HTTPStatus
+import logging
 import reprlib
-import json
-from typing import Optional, Tuple
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Optional, Tuple, AsyncIterator
 
 from aiocometd import AuthExtension
+from aiocometd.http import HttpSessionProvider
 from aiocometd.typing import JsonObject, JsonLoader, JsonDumper, Payload, Headers
+from aiocometd.json_codec import (
+    json_dumps as default_json_dumps,
+    json_loads as default_json_loads,
+)
 from aiohttp import ClientSession
 from aiohttp.client_exceptions import ClientError
 
 from aiosfstream.exceptions import AuthenticationError
+from aiosfstream.token_cache import TokenCache
+
 
+LOGGER = logging.getLogger(__name__)
 
 TOKEN_URL = "https://login.salesforce.com/services/oauth2/token"
 SANDBOX_TOKEN_URL = (
@@ -31,16 +42,31 @@ class AuthenticatorBase(AuthExtension):
         self,
         domain: str,
         sandbox: bool = False,
-        json_dumps: JsonDumper = json.dumps,
-        json_loads: JsonLoader = json.loads,
+        json_dumps: JsonDumper = default_json_dumps,
+        json_loads: JsonLoader = default_json_loads,
+        session_provider: Optional[HttpSessionProvider] = None,
+        session_lifetime: Optional[float] = 7200.0,
+        refresh_margin: float = 300.0,
+        token_cache: Optional[TokenCache] = None,
     ) -> None:
         """
         :param sandbox: Marks whether the authentication has to be done \
         for a sandbox org or for a production org
         :param json_dumps: Function for JSON serialization, the default is \
-        :func:`json.dumps`
+        :func:`aiocometd.json_codec.json_dumps`
         :param json_loads: Function for JSON deserialization, the default is \
-        :func:`json.loads`
+        :func:`aiocometd.json_codec.json_loads`
+        :param session_provider: Provider of a shared HTTP session for the \
+        token requests. If it's ``None``, a new session is used for every \
+        request.
+        :param session_lifetime: Lifetime of the access tokens in seconds, \
+        the session timeout of the org. If it's ``None``, the tokens are \
+        only renewed after the server rejects them.
+        :param refresh_margin: The amount of time in seconds before the \
+        expiration of the access token when it should be renewed in the \
+        background
+        :param token_cache: Cache of access tokens shared with other \
+        processes. Tokens are only cached if their lifetime is known.
         """
         # Domain of the Salesforce org
         self._domain = domain
@@ -66,6 +92,27 @@ class AuthenticatorBase(AuthExtension):
         self.json_dumps = json_dumps
         #: Function for JSON deserialization
         self.json_loads = json_loads
+        #: Provider of a shared HTTP session for the token requests
+        self.session_provider = session_provider
+        #: Lifetime of the access tokens in seconds
+        self.session_lifetime = session_lifetime
+        #: The amount of time in seconds before the expiration of the \
+        #: access token when it should be renewed
+        self.refresh_margin = refresh_margin
+        #: Cache of access tokens shared with other processes
+        self.token_cache = token_cache
+        #: The time to wait in seconds before retrying a failed renewal
+        self.refresh_retry_interval = 30.0
+        #: Time (as returned by :func:`time.time`) when the access token \
+        #: expires, ``None`` if it's unknown
+        self.expires_at: Optional[float] = None
+        # value of the Authorization header, replaced in a single step when
+        # a new token is obtained
+        self._authorization: Optional[str] = None
+        # serializes the token requests, incremented with every new token
+        self._token_lock = asyncio.Lock()
+        self._token_generation = 0
+        self._refresh_task: Optional["asyncio.Task[None]"] = None
 
     @property
     def _token_url(self) -> str:
@@ -74,6 +121,20 @@ class AuthenticatorBase(AuthExtension):
             return self._domain + "/services/oauth2/token"
         return self._domain + "/services/oauth2/token"
 
+    @asynccontextmanager
+    async def _http_session(self) -> AsyncIterator[ClientSession]:
+        """Asynchronous context manager providing an HTTP session for the \
+        token requests
+
+        The shared session of the :obj:`session_provider` is used if there \
+        is one, otherwise a new session is created and closed on exit.
+        """
+        if self.session_provider is not None:
+            yield await self.session_provider.get_session()
+        else:
+            async with ClientSession(json_serialize=self.json_dumps) as session:
+                yield session
+
     async def outgoing(self, payload: Payload, headers: Headers) -> None:
         """Process outgoing *payload* and *headers*
 
@@ -86,13 +147,13 @@ class AuthenticatorBase(AuthExtension):
         :py:attr:`~access_token` is ``None``. In other words, it's raised if \
         the method is called without authenticating first.
         """
-        if self.token_type is None or self.access_token is None:
+        if self._authorization is None:
             raise AuthenticationError(
                 "Unknown token_type and access_token "
                 "values. Method called without "
                 "authenticating first."
             )
-        headers["Authorization"] = self.token_type + " " + self.access_token
+        headers["Authorization"] = self._authorization
 
     async def incoming(
         self, payload: Payload, headers: Optional[Headers] = None
@@ -102,6 +163,123 @@ class AuthenticatorBase(AuthExtension):
     async def authenticate(self) -> None:
         """Called on initialization and after a failed authentication attempt
 
+        If another token request completes while this one is waiting for
+        its turn, its token is used instead of requesting a new one.
+
+        :raise AuthenticationError: If the server rejects the authentication \
+        request or if a network failure occurs
+        """
+        generation = self._token_generation
+        async with self._token_lock:
+            if (
+                generation != self._token_generation
+                and self._authorization is not None
+            ):
+                return
+            try:
+                # a token is only authenticated again after it was rejected
+                response_data = await self._request_token(
+                    rejected_token=self.access_token
+                )
+            except AuthenticationError:
+                self.access_token = None
+                self.token_type = None
+                self.instance_url = None
+                self.id = None
+                self.signature = None
+                self.issued_at = None
+                self.expires_at = None
+                self._authorization = None
+                raise
+            self._update_token(response_data)
+
+    async def refresh(self) -> None:
+        """Obtain a new access token before the current one expires
+
+        Unlike :meth:`authenticate`, the current token is kept if the request
+        fails, so it can be used until it expires.
+
+        :raise AuthenticationError: If the server rejects the authentication \
+        request or if a network failure occurs
+        """
+        async with self._token_lock:
+            response_data = await self._request_token()
+            self._update_token(response_data)
+
+    async def close(self) -> None:
+        """Stop renewing the access token in the background"""
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
+
+    @property
+    def _token_cache_key(self) -> str:
+        """The key of the tokens of this authenticator in the \
+        :obj:`token_cache`"""
+        return TokenCache.key(
+            getattr(self, "client_id", ""),
+            getattr(self, "username", None),
+            self._domain,
+        )
+
+    async def _request_token(
+        self, rejected_token: Optional[str] = None
+    ) -> JsonObject:
+        """Obtain a new access token from the :obj:`token_cache` or from \
+        the server
+
+        A cached token is only used if it differs from the current one, which
+        is either about to expire or was rejected by the server, and if it's
+        valid for at least :obj:`refresh_margin` more seconds.
+
+        :param rejected_token: An access token rejected by the server, \
+        removed from the :obj:`token_cache` so other processes stop using it
+        :return: The response data from the server's response
+        :raise AuthenticationError: If the server rejects the authentication \
+        request or if a network failure occurs
+        """
+        if self.token_cache is None:
+            return await self._request_new_token()
+
+        cache = self.token_cache
+        key = self._token_cache_key
+        loop = asyncio.get_running_loop()
+        # only one process at a time requests a token, the others wait for
+        # it and then find it in the cache
+        acquire = loop.run_in_executor(None, cache.acquire)
+        try:
+            lock_fd = await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            acquire.add_done_callback(_release_token_cache_lock(cache))
+            raise
+        try:
+            if rejected_token is not None:
+                await loop.run_in_executor(None, cache.discard, rejected_token, key)
+            cached = await loop.run_in_executor(
+                None, cache.get, key, self.refresh_margin
+            )
+            if cached is not None and cached.get("access_token") != self.access_token:
+                LOGGER.debug("Using a cached access token.")
+                return cached
+
+            response_data = await self._request_new_token()
+            expires_at = response_data.get("expires_at")
+            if expires_at is not None:
+                token = {k: v for k, v in response_data.items() if k != "expires_at"}
+                await loop.run_in_executor(None, cache.put, key, token, expires_at)
+            return response_data
+        finally:
+            cache.release(lock_fd)
+
+    async def _request_new_token(self) -> JsonObject:
+        """Request a new access token from the server
+
+        :return: The response data from the server's response, with the \
+        ``expires_at`` time of the token added if its lifetime is known
         :raise AuthenticationError: If the server rejects the authentication \
         request or if a network failure occurs
         """
@@ -111,15 +289,47 @@ class AuthenticatorBase(AuthExtension):
             raise AuthenticationError("Network request failed") from error
 
         if status_code != HTTPStatus.OK:
-            self.access_token = None
-            self.token_type = None
-            self.instance_url = None
-            self.id = None
-            self.signature = None
-            self.issued_at = None
             raise AuthenticationError("Authentication failed", response_data)
 
+        lifetime = response_data.get("expires_in", self.session_lifetime)
+        if lifetime is not None:
+            response_data["expires_at"] = time.time() + float(lifetime)
+        return response_data
+
+    def _update_token(self, response_data: JsonObject) -> None:
+        """Store the token from *response_data* and schedule its renewal"""
+        self.expires_at = None
         self.__dict__.update(response_data)
+        self._authorization = f"{self.token_type} {self.access_token}"
+        self._token_generation += 1
+
+        if self.expires_at is None:
+            return
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh_when_due())
+
+    async def _refresh_when_due(self) -> None:
+        """Renew the access token :obj:`refresh_margin` seconds before it \
+        expires, for as long as the expiration time is known"""
+        while self.expires_at is not None:
+            delay = self.expires_at - self.refresh_margin - time.time()
+            if delay > 0:
+                # the token might get renewed by someone else in the meantime
+                await asyncio.sleep(delay)
+                continue
+            try:
+                LOGGER.debug("Renewing the access token.")
+                await self.refresh()
+            except Exception as error:  # pylint: disable=broad-except
+                # eg: a network error or a token cache I/O error, the task
+                # keeps running so the token still gets renewed later
+                LOGGER.warning(
+                    "Failed to renew the access token: %r, retrying in %r "
+                    "seconds.",
+                    error,
+                    self.refresh_retry_interval,
+                )
+                await asyncio.sleep(self.refresh_retry_interval)
 
     @abstractmethod
     async def _authenticate(self) -> Tuple[int, JsonObject]:
@@ -131,6 +341,19 @@ class AuthenticatorBase(AuthExtension):
         """
 
 
+def _release_token_cache_lock(
+    cache: TokenCache,
+) -> Callable[["asyncio.Future[int]"], None]:
+    """Return a callback releasing the lock of the *cache* once the \
+    acquiring future completes"""
+
+    def callback(future: "asyncio.Future[int]") -> None:
+        if not future.cancelled() and future.exception() is None:
+            cache.release(future.result())
+
+    return callback
+
+
 # pylint: enable=too-many-instance-attributes
 # pylint: disable=too-many-arguments
 
@@ -146,8 +369,8 @@ class PasswordAuthenticator(AuthenticatorBase):
         username: str,
         password: str,
         sandbox: bool = False,
-        json_dumps: JsonDumper = json.dumps,
-        json_loads: JsonLoader = json.loads,
+        json_dumps: JsonDumper = default_json_dumps,
+        json_loads: JsonLoader = default_json_loads,
     ) -> None:
         """
         :param consumer_key: Consumer key from the Salesforce connected \
@@ -159,9 +382,9 @@ class PasswordAuthenticator(AuthenticatorBase):
         :param sandbox: Marks whether the authentication has to be done \
         for a sandbox org or for a production org
         :param json_dumps: Function for JSON serialization, the default is \
-        :func:`json.dumps`
+        :func:`aiocometd.json_codec.json_dumps`
         :param json_loads: Function for JSON deserialization, the default is \
-        :func:`json.loads`
+        :func:`aiocometd.json_codec.json_loads`
         """
         super().__init__(
             domain=domain, sandbox=sandbox, json_dumps=json_dumps, json_loads=json_loads
@@ -186,7 +409,7 @@ class PasswordAuthenticator(AuthenticatorBase):
         )
 
     async def _authenticate(self) -> Tuple[int, JsonObject]:
-        async with ClientSession(json_serialize=self.json_dumps) as session:
+        async with self._http_session() as session:
             data = {
                 "grant_type": "password",
                 "client_id": self.client_id,
@@ -208,8 +431,8 @@ class ClientCredentialsAuthenticator(AuthenticatorBase):
         consumer_key: str,
         consumer_secret: str,
         sandbox: bool = False,
-        json_dumps: JsonDumper = json.dumps,
-        json_loads: JsonLoader = json.loads,
+        json_dumps: JsonDumper = default_json_dumps,
+        json_loads: JsonLoader = default_json_loads,
     ) -> None:
         """
         :param consumer_key: Consumer key from the Salesforce connected \
@@ -219,9 +442,9 @@ class ClientCredentialsAuthenticator(AuthenticatorBase):
         :param sandbox: Marks whether the authentication has to be done \
         for a sandbox org or for a production org
         :param json_dumps: Function for JSON serialization, the default is \
-        :func:`json.dumps`
+        :func:`aiocometd.json_codec.json_dumps`
         :param json_loads: Function for JSON deserialization, the default is \
-        :func:`json.loads`
+        :func:`aiocometd.json_codec.json_loads`
         """
         super().__init__(
             domain=domain, sandbox=sandbox, json_dumps=json_dumps, json_loads=json_loads
@@ -240,7 +463,7 @@ class ClientCredentialsAuthenticator(AuthenticatorBase):
         )
 
     async def _authenticate(self) -> Tuple[int, JsonObject]:
-        async with ClientSession(json_serialize=self.json_dumps) as session:
+        async with self._http_session() as session:
             data = {
                 "grant_type": "client_credentials",
                 "client_id": self.client_id,
@@ -261,8 +484,8 @@ class RefreshTokenAuthenticator(AuthenticatorBase):
         consumer_secret: str,
         refresh_token: str,
         sandbox: bool = False,
-        json_dumps: JsonDumper = json.dumps,
-        json_loads: JsonLoader = json.loads,
+        json_dumps: JsonDumper = default_json_dumps,
+        json_loads: JsonLoader = default_json_loads,
     ) -> None:
         """
         :param domain: Domain of the Salesforce org
@@ -276,9 +499,9 @@ class RefreshTokenAuthenticator(AuthenticatorBase):
         :param sandbox: Marks whether the authentication has to be done \
         for a sandbox org or for a production org
         :param json_dumps: Function for JSON serialization, the default is \
-        :func:`json.dumps`
+        :func:`aiocometd.json_codec.json_dumps`
         :param json_loads: Function for JSON deserialization, the default is \
-        :func:`json.loads`
+        :func:`aiocometd.json_codec.json_loads`
         """
         super().__init__(
             domain=domain, sandbox=sandbox, json_dumps=json_dumps, json_loads=json_loads
@@ -299,8 +522,14 @@ class RefreshTokenAuthenticator(AuthenticatorBase):
             f"refresh_token={reprlib.repr(self.refresh_token)})"
         )
 
+    @property
+    def _token_cache_key(self) -> str:
+        # tokens obtained with different refresh tokens belong to different
+        # users
+        return TokenCache.key(self.client_id, self.refresh_token, self._domain)
+
     async def _authenticate(self) -> Tuple[int, JsonObject]:
-        async with ClientSession(json_serialize=self.json_dumps) as session:
+        async with self._http_session() as session:
             data = {
                 "grant_type": "refresh_token",
                 "client_id": self.client_id,
@@ -3,15 +3,33 @@
 from collections import abc
 from http import HTTPStatus
 import logging
-import json
 import asyncio
-from typing import Optional, Union, MutableMapping, AsyncIterator, Type, cast
+from typing import (
+    Optional,
+    Union,
+    MutableMapping,
+    AsyncIterator,
+    Type,
+    List,
+    Dict,
+    cast,
+)
 from types import TracebackType
 from enum import Enum, auto, unique
 
 from aiocometd import Client as CometdClient
 from aiocometd.exceptions import ServerError
+from aiocometd.http import ConnectionPoolOptions, HttpSessionProvider
+from aiocometd.utils import (
+    is_event_message,
+    is_server_error_message,
+    get_error_code,
+)
 from aiocometd.typing import JsonObject, JsonLoader, JsonDumper
+from aiocometd.json_codec import (
+    json_dumps as default_json_dumps,
+    json_loads as default_json_loads,
+)
 
 from aiosfstream.auth import (
     AuthenticatorBase,
@@ -25,6 +43,7 @@ from aiosfstream.replay import (
     ConstantReplayId,
     ReplayMarker,
 )
+from aiosfstream.token_cache import TokenCache
 from aiosfstream.exceptions import translate_errors, translate_errors_context
 
 
@@ -64,8 +83,12 @@ class Client(CometdClient):
         replay_storage_policy: ReplayMarkerStoragePolicy = ReplayMarkerStoragePolicy.AUTOMATIC,
         connection_timeout: Union[int, float] = 10.0,
         max_pending_count: int = 100,
-        json_dumps: JsonDumper = json.dumps,
-        json_loads: JsonLoader = json.loads,
+        max_pending_bytes: int = 0,
+        json_dumps: JsonDumper = default_json_dumps,
+        json_loads: JsonLoader = default_json_loads,
+        connection_pool: Optional[ConnectionPoolOptions] = None,
+        session_provider: Optional[HttpSessionProvider] = None,
+        token_cache: Optional[TokenCache] = None,
     ):
         """
         :param authenticator: An authenticator object
@@ -88,10 +111,22 @@ class Client(CometdClient):
         this size then the connection will be suspended, until messages are \
         consumed. \
         If it is less than or equal to zero, the count is infinite.
+        :param max_pending_bytes: The maximum total size in bytes of the \
+        prefetched messages. If the size of the prefetched messages reach \
+        this limit then the connection will be suspended, until messages are \
+        consumed. \
+        If it is less than or equal to zero, the size is infinite.
         :param json_dumps: Function for JSON serialization, the default is \
-        :func:`json.dumps`
+        :func:`aiocometd.json_codec.json_dumps`
         :param json_loads: Function for JSON deserialization, the default is \
-        :func:`json.loads`
+        :func:`aiocometd.json_codec.json_loads`
+        :param connection_pool: Settings of the connection pools of the \
+        HTTP sessions created by the transports
+        :param session_provider: Provider of a single HTTP session shared \
+        by the transports and the authenticator. If it's set, \
+        *connection_pool* is ignored in favor of the provider's settings.
+        :param token_cache: Cache of access tokens shared with other \
+        processes, used by the authenticator
         """
         if not isinstance(authenticator, AuthenticatorBase):
             raise TypeError(
@@ -128,6 +163,12 @@ class Client(CometdClient):
         # the callables passed to the client
         authenticator.json_dumps = json_dumps
         authenticator.json_loads = json_loads
+        # share the HTTP session of the transports with the authenticator
+        if session_provider is not None:
+            authenticator.session_provider = session_provider
+        # reuse the tokens requested by other processes
+        if token_cache is not None:
+            authenticator.token_cache = token_cache
 
         # set authenticator as the auth extension
         super().__init__(
@@ -136,8 +177,11 @@ class Client(CometdClient):
             extensions=[self.replay_storage],
             connection_timeout=connection_timeout,
             max_pending_count=max_pending_count,
+            max_pending_bytes=max_pending_bytes,
             json_dumps=json_dumps,
             json_loads=json_loads,
+            connection_pool=connection_pool,
+            session_provider=session_provider,
         )
 
     @translate_errors
@@ -169,6 +213,10 @@ class Client(CometdClient):
     @translate_errors
     async def close(self) -> None:
         await super().close()
+        # stop renewing the access token in the background
+        await cast(AuthenticatorBase, self.auth).close()
+        # write the buffered replay markers of persistent storages
+        await self.replay_storage.flush()
 
     @translate_errors
     async def subscribe(self, channel: str) -> None:
@@ -191,6 +239,44 @@ class Client(CometdClient):
             else:
                 raise
 
+    @translate_errors
+    async def subscribe_many(self, channels: List[str]) -> Dict[str, JsonObject]:
+        """Subscribe to all the *channels* with a single request
+
+        The stored replay ids of the channels are inserted into the subscribe
+        messages. If some of the subscriptions get rejected because their
+        replay id is outside the retention window, and a
+        :obj:`replay_fallback` is set, then those channels are subscribed to
+        again, with the fallback replay option.
+
+        :param channels: Names of the channels
+        :return: The subscribe response of every channel
+        :raise ClientInvalidOperation: If the client is :obj:`closed`
+        :raise TransportError: If a network or transport related error occurs
+        """
+        results = await super().subscribe_many(channels)
+
+        if self.replay_fallback and self.replay_storage:
+            failed = [
+                channel
+                for channel, response in results.items()
+                if is_server_error_message(response)
+                and get_error_code(response.get("error")) == HTTPStatus.BAD_REQUEST
+            ]
+            if failed:
+                LOGGER.warning(
+                    "Subscription to %r failed, retrying subscription with %r.",
+                    failed,
+                    self.replay_fallback,
+                )
+                self.replay_storage.replay_fallback = self.replay_fallback
+                results.update(await super().subscribe_many(failed))
+        return results
+
+    @translate_errors
+    async def unsubscribe_many(self, channels: List[str]) -> Dict[str, JsonObject]:
+        return await super().unsubscribe_many(channels)
+
     @translate_errors
     async def unsubscribe(self, channel: str) -> None:
         await super().unsubscribe(channel)
@@ -247,6 +333,63 @@ class Client(CometdClient):
             await self.replay_storage.extract_replay_id(response)
         return response
 
+    @translate_errors
+    async def receive_batch(
+        self, max_items: int = 100, max_wait: Union[int, float, None] = None
+    ) -> List[JsonObject]:
+        """Wait for incoming messages from the server and return all of the \
+        pending ones, up to *max_items*
+
+        :param max_items: The maximum number of messages to return
+        :param max_wait: The maximum amount of time to wait for the batch to \
+        fill up, after the first message was received
+        :return: List of incoming messages, in the order they were received
+        :raise ClientInvalidOperation: If the client is closed, and has no \
+        more pending incoming messages
+        :raise ServerError: If the client receives a confirmation message \
+         which is not ``successful``
+        :raise TransportTimeoutError: If the transport can't re-establish \
+        connection with the server in :obj:`connection_timeout` time.
+        :raise ReplayError: On a message replay or replay marker storage \
+        related error
+        """
+        # receive the messages without extracting the replay id of each one
+        batch = [await super().receive()]
+        await self._receive_pending(batch, max_items, max_wait)
+
+        if self.replay_storage_policy == ReplayMarkerStoragePolicy.AUTOMATIC:
+            # messages of a channel arrive in order, so storing the replay
+            # id of the last one of every channel is enough
+            last_messages = {}
+            for message in batch:
+                if is_event_message(message):
+                    last_messages[message["channel"]] = message
+            for message in last_messages.values():
+                await self.replay_storage.extract_replay_id(message)
+        return batch
+
+    @translate_errors
+    async def batches(
+        self, max_items: int = 100, max_wait: Union[int, float, None] = None
+    ) -> AsyncIterator[List[JsonObject]]:
+        """Asynchronous iterator over batches of incoming messages
+
+        :param max_items: The maximum number of messages in a batch
+        :param max_wait: The maximum amount of time to wait for a batch to \
+        fill up, after its first message was received
+        :raise ServerError: If the client receives a confirmation message \
+         which is not ``successful``
+        :raise TransportTimeoutError: If the transport can't re-establish \
+        connection with the server in :obj:`connection_timeout` time.
+        :raise ReplayError: On a message replay or replay marker storage \
+        related error
+        """
+        with translate_errors_context():
+            # pylint: disable=not-an-iterable
+            async for batch in super().batches(max_items, max_wait):
+                # pylint: enable=not-an-iterable
+                yield batch
+
     @translate_errors
     async def __aiter__(self) -> AsyncIterator[JsonObject]:
         """Asynchronous iterator
@@ -328,9 +471,13 @@ class SalesforceStreamingClient(Client):
         replay_storage_policy: ReplayMarkerStoragePolicy = ReplayMarkerStoragePolicy.AUTOMATIC,
         connection_timeout: Union[int, float] = 10.0,
         max_pending_count: int = 100,
+        max_pending_bytes: int = 0,
         sandbox: bool = False,
-        json_dumps: JsonDumper = json.dumps,
-        json_loads: JsonLoader = json.loads,
+        json_dumps: JsonDumper = default_json_dumps,
+        json_loads: JsonLoader = default_json_loads,
+        connection_pool: Optional[ConnectionPoolOptions] = None,
+        session_provider: Optional[HttpSessionProvider] = None,
+        token_cache: Optional[TokenCache] = None,
     ):
         """
         :param domain: Salesforce domain
@@ -359,12 +506,24 @@ class SalesforceStreamingClient(Client):
         this size then the connection will be suspended, until messages are \
         consumed. \
         If it is less than or equal to zero, the count is infinite.
+        :param max_pending_bytes: The maximum total size in bytes of the \
+        prefetched messages. If the size of the prefetched messages reach \
+        this limit then the connection will be suspended, until messages are \
+        consumed. \
+        If it is less than or equal to zero, the size is infinite.
         :param sandbox: Marks whether the connection has to be made with \
         a sandbox org or with a production org
         :param json_dumps: Function for JSON serialization, the default is \
-        :func:`json.dumps`
+        :func:`aiocometd.json_codec.json_dumps`
         :param json_loads: Function for JSON deserialization, the default is \
-        :func:`json.loads`
+        :func:`aiocometd.json_codec.json_loads`
+        :param connection_pool: Settings of the connection pools of the \
+        HTTP sessions created by the transports
+        :param session_provider: Provider of a single HTTP session shared \
+        by the transports and the authenticator. If it's set, \
+        *connection_pool* is ignored in favor of the provider's settings.
+        :param token_cache: Cache of access tokens shared with other \
+        processes, used by the authenticator
         """
         # authenticator = PasswordAuthenticator(
         #     domain=domain,
@@ -392,6 +551,10 @@ class SalesforceStreamingClient(Client):
             replay_storage_policy=replay_storage_policy,
             connection_timeout=connection_timeout,
             max_pending_count=max_pending_count,
+            max_pending_bytes=max_pending_bytes,
             json_dumps=json_dumps,
             json_loads=json_loads,
+            connection_pool=connection_pool,
+            session_provider=session_provider,
+            token_cache=token_cache,
         )
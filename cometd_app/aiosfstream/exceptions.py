@@ -12,6 +12,7 @@ Exception hierarchy::
             TransportConnectionClosed
         ServerError
         ReplayError
+        RestError
 """
 
 from functools import wraps
@@ -82,6 +83,10 @@ class ReplayError(AiosfstreamException):
     """Message replay related error"""
 
 
+class RestError(AiosfstreamException):
+    """REST API request failure"""
+
+
 # pylint: enable=too-many-ancestors
 
 
@@ -3,8 +3,24 @@
 from collections import abc
 from abc import abstractmethod
 from enum import IntEnum, unique
+import asyncio
+import mmap
+import os
 import reprlib
-from typing import Optional, NamedTuple, MutableMapping, Any, cast, AsyncContextManager
+import sqlite3
+import struct
+import threading
+import zlib
+from typing import (
+    Optional,
+    NamedTuple,
+    MutableMapping,
+    Dict,
+    List,
+    Any,
+    cast,
+    AsyncContextManager,
+)
 
 from aiocometd import Extension
 from aiocometd.typing import Payload, Headers, JsonObject
@@ -47,11 +63,30 @@ class ReplayMarkerStorage(Extension):
         pass
 
     async def outgoing(self, payload: Payload, headers: Headers) -> None:
-        for message in payload:
-            # if the outgoing message is a subscribe message, then insert the
-            # stored replay id into the message
-            if message["channel"] == MetaChannel.SUBSCRIBE:
-                await self.insert_replay_id(message)
+        # insert the stored replay ids into the subscribe messages of the
+        # payload
+        messages = [
+            message for message in payload if message["channel"] == MetaChannel.SUBSCRIBE
+        ]
+        if not messages:
+            return
+
+        # if there is a replay fallback set, then it must be used as the replay
+        # id of every subscription in the payload in order to successfully
+        # subscribe
+        if self.replay_fallback:
+            replay_ids: Dict[str, Optional[int]] = {
+                message["subscription"]: self.replay_fallback for message in messages
+            }
+            self.replay_fallback = None
+        # otherwise get the stored replay ids in one go
+        else:
+            replay_ids = await self.get_replay_ids(
+                [message["subscription"] for message in messages]
+            )
+
+        for message in messages:
+            self._set_message_replay_id(message, replay_ids[message["subscription"]])
 
     async def insert_replay_id(self, message: JsonObject) -> None:
         """Insert the stored replay id into the *message*
@@ -71,12 +106,22 @@ class ReplayMarkerStorage(Extension):
         else:
             replay_id = await self.get_replay_id(subscription)
 
+        self._set_message_replay_id(message, replay_id)
+
+    @staticmethod
+    def _set_message_replay_id(message: JsonObject, replay_id: Optional[int]) -> None:
+        """Set the *replay_id* in the replay extension field of the \
+        subscribe *message*
+
+        :param message: An outgoing, ``/meta/subscribe`` message
+        :param replay_id: A replay id or ``None``
+        """
         # if the replay id is None, then we do not yet have a replay id for the
         # given subscription, so don't add anything to the message
         if replay_id:
             if "ext" not in message:
                 message["ext"] = {}
-            message["ext"]["replay"] = {subscription: replay_id}
+            message["ext"]["replay"] = {message["subscription"]: replay_id}
 
     @staticmethod
     def get_message_date(message: JsonObject) -> str:
@@ -150,6 +195,19 @@ class ReplayMarkerStorage(Extension):
             return marker.replay_id
         return None
 
+    async def get_replay_ids(
+        self, subscriptions: List[str]
+    ) -> Dict[str, Optional[int]]:
+        """Retrieve the stored replay ids of all the given *subscriptions*
+
+        :param subscriptions: Names of the subscribed channels
+        :return: The replay id, or ``None``, of every subscription
+        """
+        return {
+            subscription: await self.get_replay_id(subscription)
+            for subscription in subscriptions
+        }
+
     @abstractmethod
     async def get_replay_marker(self, subscription: str) -> Optional[ReplayMarker]:
         """Retrieve a stored replay marker for the given *subscription*
@@ -169,6 +227,13 @@ class ReplayMarkerStorage(Extension):
         :param replay_marker: A replay marker
         """
 
+    async def flush(self) -> None:
+        """Write the stored replay markers to durable storage
+
+        Storage implementations which don't buffer their writes don't have to
+        do anything.
+        """
+
     def __call__(self, message: JsonObject) -> AsyncContextManager[None]:
         """Return an asynchronous context manager instance for extracting the
         replay id from the *message* if no exceptions occur inside the runtime
@@ -311,3 +376,366 @@ class DefaultMappingStorage(DefaultReplayIdMixin, MappingStorage):
             f"{cls_name}(mapping={reprlib.repr(self.mapping)}, "
             f"default_id={reprlib.repr(self.default_id)})"
         )
+
+
+class PersistentStorage(ReplayMarkerStorage):
+    """Abstract base class for durable replay marker storage implementations
+
+    Replay markers are kept in memory and loaded from the backing store the
+    first time a subscription's marker is requested. Calls to
+    :meth:`set_replay_marker` only update the in-memory copy; the changed
+    markers are written to the backing store in a single batch once
+    *flush_every* markers were set, at most *flush_interval* seconds after
+    the first unwritten one, or when :meth:`flush` or :meth:`close` is
+    awaited. A crash can therefore only lose the markers of that window,
+    and those messages are replayed on restart.
+    """
+
+    def __init__(self, flush_every: int = 100, flush_interval: float = 1.0) -> None:
+        """
+        :param flush_every: The number of replay markers to set before \
+        writing them to the backing store
+        :param flush_interval: The maximum number of seconds a replay marker \
+        is kept only in memory
+        """
+        super().__init__()
+        #: The number of replay markers to set before writing them out
+        self.flush_every = flush_every
+        #: The maximum number of seconds a replay marker is kept in memory
+        self.flush_interval = flush_interval
+        self._markers: Dict[str, Optional[ReplayMarker]] = {}
+        self._dirty: Dict[str, ReplayMarker] = {}
+        self._dirty_count = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_task: Optional["asyncio.Future[None]"] = None
+        self._flush_lock = asyncio.Lock()
+
+    async def get_replay_marker(self, subscription: str) -> Optional[ReplayMarker]:
+        try:
+            return self._markers[subscription]
+        except KeyError:
+            marker = await asyncio.get_running_loop().run_in_executor(
+                None, self._read_marker, subscription
+            )
+            # don't overwrite a marker set while the stored one was loaded
+            return self._markers.setdefault(subscription, marker)
+
+    async def get_replay_ids(
+        self, subscriptions: List[str]
+    ) -> Dict[str, Optional[int]]:
+        # load the markers which are not in memory yet in one go
+        missing = [_ for _ in subscriptions if _ not in self._markers]
+        if missing:
+            markers = await asyncio.get_running_loop().run_in_executor(
+                None, self._read_markers, missing
+            )
+            for subscription in missing:
+                self._markers.setdefault(subscription, markers.get(subscription))
+        return await super().get_replay_ids(subscriptions)
+
+    async def set_replay_marker(
+        self, subscription: str, replay_marker: ReplayMarker
+    ) -> None:
+        self._markers[subscription] = replay_marker
+        self._dirty[subscription] = replay_marker
+        self._dirty_count += 1
+
+        if self._dirty_count >= self.flush_every:
+            await self.flush()
+        elif self._flush_handle is None and self.flush_interval:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(
+                self.flush_interval, self._schedule_flush
+            )
+
+    def _schedule_flush(self) -> None:
+        self._flush_handle = None
+        self._flush_task = asyncio.ensure_future(self.flush())
+
+    async def flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            markers = self._dirty
+            self._dirty = {}
+            self._dirty_count = 0
+            try:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, self._write_markers, markers
+                )
+            except Exception:
+                # keep the markers for the next flush, unless newer ones
+                # were set in the meantime
+                for subscription, marker in markers.items():
+                    self._dirty.setdefault(subscription, marker)
+                raise
+
+    async def close(self) -> None:
+        """Write the pending replay markers and release the backing store"""
+        await self.flush()
+        await asyncio.get_running_loop().run_in_executor(None, self._close)
+
+    @abstractmethod
+    def _read_marker(self, subscription: str) -> Optional[ReplayMarker]:
+        """Read the replay marker of the *subscription* from the backing \
+        store
+
+        :param subscription: Name of the subscribed channel
+        :return: A replay marker or ``None``
+        """
+
+    def _read_markers(
+        self, subscriptions: List[str]
+    ) -> Dict[str, Optional[ReplayMarker]]:
+        """Read the replay markers of the *subscriptions* from the backing \
+        store
+
+        :param subscriptions: Names of the subscribed channels
+        :return: The replay marker, or ``None``, of every subscription
+        """
+        return {_: self._read_marker(_) for _ in subscriptions}
+
+    @abstractmethod
+    def _write_markers(self, markers: Dict[str, ReplayMarker]) -> None:
+        """Durably write the *markers* to the backing store
+
+        :param markers: Replay markers by subscription name
+        """
+
+    def _close(self) -> None:
+        """Release the resources of the backing store"""
+
+
+class SQLiteStorage(PersistentStorage):
+    """SQLite based replay marker storage
+
+    The markers are stored in a database in WAL mode, one row per
+    subscription, and every flush is a single transaction.
+    """
+
+    def __init__(
+        self,
+        path: str = "replay_markers.db",
+        flush_every: int = 100,
+        flush_interval: float = 1.0,
+    ) -> None:
+        """
+        :param path: Path of the database file
+        :param flush_every: The number of replay markers to set before \
+        writing them to the database
+        :param flush_interval: The maximum number of seconds a replay marker \
+        is kept only in memory
+        """
+        super().__init__(flush_every=flush_every, flush_interval=flush_interval)
+        #: Path of the database file
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS replay_markers ("
+            "subscription TEXT PRIMARY KEY, date TEXT NOT NULL, "
+            "replay_id INTEGER NOT NULL)"
+        )
+        self._connection.commit()
+
+    def __repr__(self) -> str:
+        """Formal string representation"""
+        cls_name = type(self).__name__
+        return f"{cls_name}(path={reprlib.repr(self.path)})"
+
+    def _read_marker(self, subscription: str) -> Optional[ReplayMarker]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT date, replay_id FROM replay_markers WHERE subscription = ?",
+                (subscription,),
+            ).fetchone()
+        if row is None:
+            return None
+        return ReplayMarker(date=row[0], replay_id=row[1])
+
+    def _read_markers(
+        self, subscriptions: List[str]
+    ) -> Dict[str, Optional[ReplayMarker]]:
+        placeholders = ", ".join("?" * len(subscriptions))
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT subscription, date, replay_id FROM replay_markers "
+                f"WHERE subscription IN ({placeholders})",
+                subscriptions,
+            ).fetchall()
+        markers: Dict[str, Optional[ReplayMarker]] = dict.fromkeys(subscriptions)
+        for subscription, date, replay_id in rows:
+            markers[subscription] = ReplayMarker(date=date, replay_id=replay_id)
+        return markers
+
+    def _write_markers(self, markers: Dict[str, ReplayMarker]) -> None:
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO replay_markers (subscription, date, replay_id) "
+                "VALUES (?, ?, ?) ON CONFLICT(subscription) DO UPDATE SET "
+                "date = excluded.date, replay_id = excluded.replay_id",
+                [
+                    (subscription, marker.date, marker.replay_id)
+                    for subscription, marker in markers.items()
+                ],
+            )
+
+    def _close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class MmapStorage(PersistentStorage):
+    """Memory-mapped file based replay marker storage
+
+    The file is made of *slot_count* fixed size slots, one per subscription.
+    A slot holds two copies of the marker, each with the subscription name,
+    the date, the replay id and a sequence number followed by a CRC32
+    checksum. A marker is written over the older copy, so a copy torn by a
+    crash is ignored on load and the other, valid copy with the highest
+    sequence number is used instead. Setting a marker is a copy into the
+    mapped memory, and a flush syncs the changed pages to disk.
+    """
+
+    #: Layout of a copy: sequence number, name length, name, date length,
+    #: date, replay id
+    COPY_FORMAT = struct.Struct("<QH200sB40sq")
+    #: Size of a copy, including the checksum
+    COPY_SIZE = COPY_FORMAT.size + 4
+    #: Size of a slot, made of two copies
+    SLOT_SIZE = 2 * COPY_SIZE
+
+    def __init__(
+        self,
+        path: str = "replay_markers.mmap",
+        slot_count: int = 64,
+        flush_every: int = 100,
+        flush_interval: float = 1.0,
+    ) -> None:
+        """
+        :param path: Path of the storage file
+        :param slot_count: The maximum number of subscriptions that can be \
+        stored
+        :param flush_every: The number of replay markers to set before \
+        syncing the file to disk
+        :param flush_interval: The maximum number of seconds a replay marker \
+        is kept only in memory
+        """
+        super().__init__(flush_every=flush_every, flush_interval=flush_interval)
+        #: Path of the storage file
+        self.path = path
+        #: The maximum number of subscriptions that can be stored
+        self.slot_count = slot_count
+        self._lock = threading.Lock()
+        self._slots: Optional[Dict[str, int]] = None
+
+        size = slot_count * self.SLOT_SIZE
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._mmap = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def __repr__(self) -> str:
+        """Formal string representation"""
+        cls_name = type(self).__name__
+        return (
+            f"{cls_name}(path={reprlib.repr(self.path)}, "
+            f"slot_count={reprlib.repr(self.slot_count)})"
+        )
+
+    def _read_copy(self, index: int, copy: int) -> Optional[Any]:
+        offset = index * self.SLOT_SIZE + copy * self.COPY_SIZE
+        data = self._mmap[offset : offset + self.COPY_FORMAT.size]
+        (checksum,) = struct.unpack_from("<I", self._mmap, offset + self.COPY_FORMAT.size)
+        sequence, name_len, name, date_len, date, replay_id = self.COPY_FORMAT.unpack(
+            data
+        )
+        if name_len == 0 or zlib.crc32(data) != checksum:
+            return None
+        return (
+            sequence,
+            name[:name_len].decode("utf-8"),
+            ReplayMarker(date=date[:date_len].decode("utf-8"), replay_id=replay_id),
+        )
+
+    def _read_newest_copy(self, index: int) -> Optional[Any]:
+        # the valid copy with the highest sequence number, and its position
+        newest = None
+        for copy in range(2):
+            content = self._read_copy(index, copy)
+            if content is not None and (newest is None or content[0] > newest[1][0]):
+                newest = (copy, content)
+        return newest
+
+    def _read_slot(self, index: int) -> Optional[Any]:
+        newest = self._read_newest_copy(index)
+        if newest is None:
+            return None
+        _, (_, name, marker) = newest
+        return name, marker
+
+    def _load_slots(self) -> Dict[str, int]:
+        if self._slots is None:
+            self._slots = {}
+            for index in range(self.slot_count):
+                slot = self._read_slot(index)
+                if slot is not None:
+                    self._slots[slot[0]] = index
+        return self._slots
+
+    def _read_marker(self, subscription: str) -> Optional[ReplayMarker]:
+        with self._lock:
+            index = self._load_slots().get(subscription)
+            if index is None:
+                return None
+            slot = self._read_slot(index)
+            return slot[1] if slot is not None else None
+
+    def _write_markers(self, markers: Dict[str, ReplayMarker]) -> None:
+        with self._lock:
+            slots = self._load_slots()
+            for subscription, marker in markers.items():
+                name = subscription.encode("utf-8")
+                date = marker.date.encode("utf-8")
+                if len(name) > 200 or len(date) > 40:
+                    raise ReplayError(
+                        f"The replay marker of {subscription!r} doesn't fit "
+                        f"in a slot."
+                    )
+                index = slots.get(subscription)
+                if index is None:
+                    free = set(range(self.slot_count)) - set(slots.values())
+                    if not free:
+                        raise ReplayError(
+                            f"No free slot left to store the replay marker "
+                            f"of {subscription!r}."
+                        )
+                    index = slots[subscription] = min(free)
+                # overwrite the older copy, the newest one stays valid until
+                # the new one is written completely
+                newest = self._read_newest_copy(index)
+                if newest is None:
+                    copy, sequence = 0, 1
+                else:
+                    copy, sequence = 1 - newest[0], newest[1][0] + 1
+                data = self.COPY_FORMAT.pack(
+                    sequence, len(name), name, len(date), date, marker.replay_id
+                )
+                offset = index * self.SLOT_SIZE + copy * self.COPY_SIZE
+                self._mmap[offset : offset + self.COPY_FORMAT.size] = data
+                struct.pack_into(
+                    "<I", self._mmap, offset + self.COPY_FORMAT.size, zlib.crc32(data)
+                )
+            self._mmap.flush()
+
+    def _close(self) -> None:
+        with self._lock:
+            self._mmap.close()
@@ -0,0 +1,141 @@
+"""Asynchronous helper for Salesforce REST API calls"""
+
+from http import HTTPStatus
+import logging
+import reprlib
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from aiohttp import ClientSession
+from aiohttp.client_exceptions import ClientError as HttpClientError
+
+from aiocometd.http import HttpSessionProvider
+
+from aiosfstream.auth import AuthenticatorBase
+from aiosfstream.exceptions import AuthenticationError, RestError
+
+
+LOGGER = logging.getLogger(__name__)
+
+#: The default version of the REST API
+API_VERSION = "59.0"
+
+
+class RestClient:
+    """Salesforce REST API client using the authenticator of a streaming \
+    client
+
+    The requests are sent to the instance URL of the *authenticator* with its
+    access token. If the token has expired, the authenticator is asked to
+    authenticate again and the request is retried once. When a
+    *session_provider* is given, its session is used for the requests, so
+    they share the connection pool and TLS context of the transports.
+    """
+
+    def __init__(
+        self,
+        authenticator: AuthenticatorBase,
+        session_provider: Optional[HttpSessionProvider] = None,
+        api_version: str = API_VERSION,
+    ) -> None:
+        """
+        :param authenticator: An authenticator object
+        :param session_provider: Provider of the HTTP session used for the \
+        requests. If it's ``None``, the provider of the *authenticator* is \
+        used, or a new session is created for every request if it has none.
+        :param api_version: Version of the REST API
+        """
+        #: Authenticator object providing the access token
+        self.authenticator = authenticator
+        #: Provider of the HTTP session used for the requests
+        self.session_provider = session_provider or authenticator.session_provider
+        #: Version of the REST API
+        self.api_version = api_version
+
+    def __repr__(self) -> str:
+        """Formal string representation"""
+        cls_name = type(self).__name__
+        return (
+            f"{cls_name}(authenticator={reprlib.repr(self.authenticator)}, "
+            f"api_version={self.api_version!r})"
+        )
+
+    @property
+    def base_url(self) -> str:
+        """The URL of the REST API on the instance of the org"""
+        if self.authenticator.instance_url is None:
+            raise AuthenticationError(
+                "Unknown instance_url. Method called without "
+                "authenticating first."
+            )
+        return (
+            f"{self.authenticator.instance_url}/services/data/v{self.api_version}"
+        )
+
+    async def get(
+        self, path: str, params: Optional[Mapping[str, str]] = None
+    ) -> Any:
+        """Send a GET request to the REST API
+
+        :param path: Path of the resource relative to :obj:`base_url`
+        :param params: Query parameters
+        :return: The deserialized response
+        :raise RestError: If the server rejects the request or if a network \
+        failure occurs
+        :raise AuthenticationError: If the authentication fails
+        """
+        status, response_data = await self._get(path, params)
+        if status == HTTPStatus.UNAUTHORIZED:
+            LOGGER.debug("Access token rejected, authenticating again.")
+            await self.authenticator.authenticate()
+            status, response_data = await self._get(path, params)
+        if status != HTTPStatus.OK:
+            raise RestError(f"Request to {path!r} failed", status, response_data)
+        return response_data
+
+    async def _get(
+        self, path: str, params: Optional[Mapping[str, str]]
+    ) -> Tuple[int, Any]:
+        """Send a GET request and return the status and the deserialized \
+        response"""
+        headers = {
+            "Authorization": f"{self.authenticator.token_type or 'Bearer'} "
+            f"{self.authenticator.access_token}"
+        }
+        url = self.base_url + path
+        try:
+            if self.session_provider is not None:
+                session = await self.session_provider.get_session()
+                return await self._request(session, url, params, headers)
+            async with ClientSession() as session:
+                return await self._request(session, url, params, headers)
+        except HttpClientError as error:
+            raise RestError("Network request failed") from error
+
+    async def _request(
+        self,
+        session: ClientSession,
+        url: str,
+        params: Optional[Mapping[str, str]],
+        headers: Dict[str, str],
+    ) -> Tuple[int, Any]:
+        async with session.get(url, params=params, headers=headers) as response:
+            response_data = await response.json(
+                loads=self.authenticator.json_loads, content_type=None
+            )
+            return response.status, response_data
+
+    async def limits(self) -> Dict[str, Any]:
+        """Return the limits of the org
+
+        :return: The limit names mapped to their ``Max`` and ``Remaining`` \
+        values
+        """
+        return await self.get("/limits")  # type: ignore
+
+    async def query(self, soql: str) -> Dict[str, Any]:
+        """Execute a SOQL query
+
+        :param soql: The query
+        :return: The query result
+        """
+        return await self.get("/query", {"q": soql})  # type: ignore
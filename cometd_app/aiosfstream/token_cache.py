@@ -0,0 +1,162 @@
+"""On-disk access token cache shared by processes"""
+
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import json
+import os
+import reprlib
+import tempfile
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from aiocometd.typing import JsonObject
+
+
+class TokenCache:
+    """Access token cache stored in a JSON file, shared by every process \
+    using the same *path*
+
+    The tokens are stored under a key derived from the client id, the
+    username and the domain, along with the time they expire. Writers hold an
+    exclusive :func:`fcntl.flock` lock on a separate lock file, which callers
+    also hold with :meth:`locked` while requesting a new token, so when
+    several processes need a token at the same time only the first one
+    requests it, and the others find it in the cache once they get the lock.
+    The file is replaced atomically, so readers never see a partial write.
+    """
+
+    def __init__(self, path: str = "token_cache.json") -> None:
+        """
+        :param path: Path of the cache file
+        """
+        #: Path of the cache file
+        self.path = path
+        #: Path of the lock file
+        self.lock_path = path + ".lock"
+
+    def __repr__(self) -> str:
+        """Formal string representation"""
+        cls_name = type(self).__name__
+        return f"{cls_name}(path={reprlib.repr(self.path)})"
+
+    @staticmethod
+    def key(client_id: str, username: Optional[str] = None, domain: str = "") -> str:
+        """Return the cache key of the tokens of a client and user
+
+        :param client_id: OAuth2 client id
+        :param username: Salesforce username, ``None`` for flows without a user
+        :param domain: Domain of the Salesforce org
+        :return: Cache key which doesn't reveal the client id
+        """
+        value = "\0".join((domain, client_id, username or ""))
+        return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+    def acquire(self) -> int:
+        """Acquire the exclusive lock of the cache, blocking until it's free
+
+        :return: File descriptor of the lock file, to be passed to \
+        :meth:`release`
+        """
+        lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+        except BaseException:
+            os.close(lock_fd)
+            raise
+        return lock_fd
+
+    @staticmethod
+    def release(lock_fd: int) -> None:
+        """Release the lock acquired with :meth:`acquire`
+
+        :param lock_fd: File descriptor of the lock file
+        """
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+        finally:
+            os.close(lock_fd)
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Context manager holding the exclusive lock of the cache"""
+        lock_fd = self.acquire()
+        try:
+            yield
+        finally:
+            self.release(lock_fd)
+
+    def get(self, key: str, min_ttl: float = 0.0) -> Optional[JsonObject]:
+        """Return the cached token response of *key*
+
+        :param key: Cache key returned by :meth:`key`
+        :param min_ttl: The minimum number of seconds the token should still \
+        be valid for
+        :return: The token response, or ``None`` if there is no token for \
+        *key* or if it expires in less than *min_ttl* seconds
+        """
+        entry = self._read().get(key)
+        if entry is None or entry["expires_at"] - min_ttl <= time.time():
+            return None
+        return dict(entry["token"], expires_at=entry["expires_at"])
+
+    def put(self, key: str, token: JsonObject, expires_at: float) -> None:
+        """Store the token response of *key*
+
+        Should be called while holding the lock of the cache.
+
+        :param key: Cache key returned by :meth:`key`
+        :param token: The token response
+        :param expires_at: Time (as returned by :func:`time.time`) when the \
+        token expires
+        """
+        entries = self._read()
+        now = time.time()
+        # drop the expired tokens of every key while rewriting the file
+        entries = {k: v for k, v in entries.items() if v["expires_at"] > now}
+        entries[key] = {"token": token, "expires_at": expires_at}
+        self._write(entries)
+
+    def discard(self, access_token: str, key: Optional[str] = None) -> None:
+        """Remove *access_token* from the cache, for example after the \
+        server rejected it
+
+        Should be called while holding the lock of the cache.
+
+        :param access_token: The token to remove, cached tokens which differ \
+        from it are kept
+        :param key: Only look for the token under this cache key, returned \
+        by :meth:`key`
+        """
+        entries = self._read()
+        remaining = {
+            k: v
+            for k, v in entries.items()
+            if (key is not None and k != key)
+            or v["token"].get("access_token") != access_token
+        }
+        if len(remaining) != len(entries):
+            self._write(remaining)
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "rb") as file:
+                return json.load(file)  # type: ignore
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            # a corrupt cache is treated as empty, and rewritten on next put
+            return {}
+
+    def _write(self, entries: Dict[str, Any]) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        # mkstemp creates the file readable only by the user, the tokens are
+        # credentials
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".token_cache")
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(entries, file)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
@@ -1,11 +1,19 @@
 # import os
-import requests
-import json
 import time
 
 # Async libraries
 import asyncio
-from aiosfstream import SalesforceStreamingClient
+from aiocometd import HttpSessionProvider
+from aiocometd.utils import is_event_message
+from aiosfstream import (
+    SalesforceStreamingClient,
+    ReplayOption,
+    ReplayMarkerStoragePolicy,
+    RestClient,
+    TokenCache,
+    SQLiteStorage,
+    MmapStorage,
+)
 
 # Internal imports
 from _globals import (
@@ -15,32 +23,82 @@ from _globals import (
     PROD_PASSWORD,
     PROD_SECURITY_TOKEN,
     PROD_DOMAIN,
+    REPLAY_STORAGE,
+    REPLAY_STORAGE_PATH,
+    BATCH_MAX_ITEMS,
+    BATCH_MAX_WAIT,
+    MAX_PENDING_COUNT,
+    MAX_PENDING_BYTES,
+    MAX_IN_FLIGHT_BATCHES,
+    SF_CHANNELS,
+    LIMITS_MIN_INTERVAL,
+    LIMITS_MAX_INTERVAL,
+    TOKEN_CACHE_PATH,
+    SPILL_LOG_DIR,
+    SPILL_SEGMENT_BYTES,
+    SPILL_MAX_BYTES,
+    COALESCE_WINDOW,
+    COALESCE_ACROSS_TRANSACTIONS,
     # PROD_PAYLOAD_CLIENT_CREDENTIALS,
 )
-from utils.kafka_produce import send_message
-from utils.transform_sf_message import transform_message
+from utils.coalesce import ChangeEventCoalescer
+from utils.commit_coordinator import CommitCoordinator
+from utils.kafka_produce import AsyncProducer, existing_producer
+from utils.limits_monitor import LimitsMonitor
+from utils.spill_log import SpillLog, SpillDrainer
+from utils.transform_sf_message import transform_payload
 # from utils.access_token import AccessToken
 
 
-def get_limits(domain: str, access_token: str):
-    headers = {"Authorization": f"Bearer {access_token}"}
-    response = requests.get(f"{domain}/services/data/v59.0/limits", headers=headers)
-    response.raise_for_status()
-    return response.json()
+def create_replay_storage():
+    if REPLAY_STORAGE == "mmap":
+        return MmapStorage(REPLAY_STORAGE_PATH or "replay_markers.mmap")
+    return SQLiteStorage(REPLAY_STORAGE_PATH or "replay_markers.db")
+
+
+KAFKA_TOPIC = "account_updated"
 
 
-def get_platform_events_usage(domain: str, access_token: str):
-    headers = {"Authorization": f"Bearer {access_token}"}
-    response = requests.get(
-        f"{domain}/services/data/v59.0/query?q=SELECT+Name+,+StartDate+,+EndDate+,+Value+FROM+PlatformEventUsageMetric",
-        headers=headers,
+def create_spill_log():
+    if not SPILL_LOG_DIR:
+        return None
+    return SpillLog(
+        SPILL_LOG_DIR, segment_size=SPILL_SEGMENT_BYTES, max_bytes=SPILL_MAX_BYTES
     )
-    response.raise_for_status()
-    return json.dumps(obj=response.json(), indent=4)
+
+
+def last_event_messages(batch):
+    # messages of a channel arrive in order, the replay marker of the last one
+    # covers the whole batch
+    return list({m["channel"]: m for m in batch if is_event_message(m)}.values())
+
+
+def event_items(batch):
+    # the (payload, replay id) of every event, as buffered by the coalescer
+    return [
+        (message["data"]["payload"], message["data"]["event"]["replayId"])
+        for message in batch
+    ]
 
 
 async def stream_events():
     reconnect_attempts = 0
+    producer = AsyncProducer()
+    # with a spill log the events are written to disk first, and forwarded to
+    # Kafka by the drainer thread, so a broker outage doesn't stop the stream
+    spill_log = create_spill_log()
+    spill_drainer = None
+    if spill_log is not None:
+        spill_drainer = SpillDrainer(spill_log, topic=KAFKA_TOPIC)
+        spill_drainer.start()
+    # the replay markers outlive the client, so every reconnect (and restart)
+    # resumes from the last stored event
+    replay_storage = create_replay_storage()
+    # a single connection pool and TLS context for the streaming transports,
+    # the token requests and the REST calls, kept across reconnects
+    session_provider = HttpSessionProvider()
+    # reconnects reuse a still valid token instead of requesting a new one
+    token_cache = TokenCache(TOKEN_CACHE_PATH) if TOKEN_CACHE_PATH else None
     # connect to your Salesforce Org (Production or Developer org)
     while True:
         try:
@@ -51,43 +109,131 @@ async def stream_events():
                 sandbox=False,
                 username=PROD_USERNAME,
                 password=PROD_PASSWORD + PROD_SECURITY_TOKEN,
+                replay=replay_storage,
+                # a stored marker older than the retention window is rejected
+                replay_fallback=ReplayOption.ALL_EVENTS,
+                # the markers are stored once Kafka acknowledged the events
+                replay_storage_policy=ReplayMarkerStoragePolicy.MANUAL,
+                max_pending_count=MAX_PENDING_COUNT,
+                max_pending_bytes=MAX_PENDING_BYTES,
+                session_provider=session_provider,
+                token_cache=token_cache,
             ) as client:
                 reconnect_attempts = (
                     0  # resets reconnect attempts upon successful connection
                 )
 
-                # subscribe to the platform event using CometD
-                await client.subscribe("/data/ChangeEvents")
-                access_token = client.auth.__dict__["access_token"]
-                domain = client.auth.__dict__["instance_url"]
-                # listen for incoming messages
-                message_count = 0
-                async for message in client:
-                    value = json.dumps(
-                        message["data"]["payload"], indent=4, sort_keys=True
-                    )
-                    key, value = transform_message(message)
-                    print(f"Key: {str(key)}")
-                    print(f"Value: {value}")
-
-                    # # Send to Kafka
-                    send_message(
-                        config_file="app/utils/client.properties",
-                        topic="account_updated",
-                        key=key,
-                        value=value,
-                    )
-
-                    message_count += 1
-                    print(f"Message Count: {message_count}")
-
-                    # Get limits
-                    if message_count % 5 == 0:
-                        limits = get_limits(domain=domain, access_token=access_token)
-                        print(
-                            f'{limits["DailyDeliveredPlatformEvents"]}\n{limits["DailyApiRequests"]}'
+                # subscribe to all the channels with a single request
+                results = await client.subscribe_many(SF_CHANNELS)
+                failed = [
+                    channel
+                    for channel, response in results.items()
+                    if not response.get("successful", True)
+                ]
+                if failed:
+                    print(f"Failed to subscribe to: {failed}")
+                if len(failed) == len(SF_CHANNELS):
+                    raise RuntimeError("None of the subscriptions succeeded")
+
+                async def store_replay_markers(messages):
+                    for message in messages:
+                        await replay_storage.extract_replay_id(message)
+
+                # produce asynchronously, storing the replay markers of a
+                # batch only after it and every earlier one were delivered
+                coordinator = CommitCoordinator(
+                    store_replay_markers, max_pending=MAX_IN_FLIGHT_BATCHES
+                )
+                # the limits are polled in the background, off the message loop
+                async with LimitsMonitor(
+                    RestClient(client.auth, session_provider),
+                    min_interval=LIMITS_MIN_INTERVAL,
+                    max_interval=LIMITS_MAX_INTERVAL,
+                ) as limits_monitor:
+                    async def forward(items, position):
+                        messages = [
+                            pair
+                            for payload, replay_id in items
+                            for pair in transform_payload(payload, replay_id)
+                        ]
+                        for key, _ in messages:
+                            print(f"Key: {str(key)}")
+
+                        if spill_log is not None:
+                            appended = spill_log.append_batch(messages, block=False)
+                            if appended < len(messages):
+                                # the spill log is full, wait for the drainer in a worker thread
+                                await asyncio.to_thread(
+                                    spill_log.append_batch, messages[appended:]
+                                )
+                            # the spill log delivers whatever it holds, once the
+                            # records are on disk
+                            await asyncio.to_thread(spill_log.sync)
+                            coordinator.begin(position, 0)
+                        else:
+                            # Queue the whole batch without waiting for Kafka
+                            await coordinator.wait_for_capacity_async()
+                            futures = [
+                                await producer.enqueue(KAFKA_TOPIC, key, value)
+                                for key, value in messages
+                            ]
+                            coordinator.track(position, futures)
+
+                    async def forward_coalesced(items, positions):
+                        # the last marker of every channel covers all the merged batches
+                        await forward(
+                            items, last_event_messages(sum(positions, []))
                         )
 
+                    # bursts of updates of a record are merged into one event
+                    # before they are produced, the replay markers only move
+                    # once the merged events are delivered
+                    coalescer = None
+                    if COALESCE_WINDOW > 0:
+                        coalescer = ChangeEventCoalescer(
+                            COALESCE_WINDOW,
+                            forward_coalesced,
+                            merge_across_transactions=COALESCE_ACROSS_TRANSACTIONS,
+                        )
+
+                    # listen for incoming messages
+                    message_count = 0
+                    try:
+                        async for batch in client.batches(
+                            max_items=BATCH_MAX_ITEMS, max_wait=BATCH_MAX_WAIT
+                        ):
+                            # reconnect and replay from the last stored marker if
+                            # an earlier batch couldn't be delivered
+                            coordinator.raise_for_error()
+                            position = last_event_messages(batch)
+                            if coalescer is not None:
+                                await coalescer.add(event_items(batch), position)
+                            else:
+                                await forward(event_items(batch), position)
+
+                            previous_count = message_count
+                            message_count += len(batch)
+                            print(f"Message Count: {message_count}")
+
+                            # Print the incoming queue and the latest cached limits
+                            if message_count // 5 > previous_count // 5:
+                                print(f"Incoming queue: {client.incoming_stats}")
+                                print(
+                                    f'{limits_monitor.get("DailyDeliveredPlatformEvents")}\n'
+                                    f'{limits_monitor.get("DailyApiRequests")}'
+                                )
+                    finally:
+                        if coalescer is not None:
+                            await coalescer.close()
+
+        except asyncio.CancelledError:
+            await replay_storage.close()
+            await session_provider.close()
+            if spill_drainer is not None:
+                spill_drainer.stop()
+                spill_log.close()
+            raise
+
         except Exception as e:
             print(f"An error occurred: {e}")
             reconnect_attempts += 1
@@ -99,18 +245,21 @@ async def stream_events():
 
 
 if __name__ == "__main__":
+    start = time.time()
+    print(f"Started at {start}")
     try:
-        start = time.time()
-        print(f"Started at {start}")
         asyncio.run(stream_events())
     except KeyboardInterrupt:
-        end = time.time()
-        print(f"Finished at {end}")
-        print(f"Time elapsed: {(end - start) / 60:.2f} minutes.")
+        print(f"Finished at {time.time()}")
     except Exception as e:
         print(f"An error occurred: {e}")
     finally:
-        print(f"Exiting... Listened for {(end-start) / 60} minutes.")
+        # deliver whatever is still buffered in the shared producer, if any
+        producer = existing_producer()
+        if producer is not None:
+            producer.close()
+        end = time.time()
+        print(f"Exiting... Listened for {(end - start) / 60:.2f} minutes.")
 
     # instance = AccessToken(domain=PROD_DOMAIN, payload=PROD_PAYLOAD_CLIENT_CREDENTIALS)
     # instance.generate_access_token()
@@ -1,4 +1,3 @@
-import requests
 from _globals import (
     SANDBOX_CONSUMER_KEY,
     SANDBOX_CONSUMER_SECRET,
@@ -10,30 +9,14 @@ from _globals import (
 )
 import asyncio
 import json
-from aiosfstream import SalesforceStreamingClient
+from aiosfstream import SalesforceStreamingClient, RestClient
+from utils.limits_monitor import LimitsMonitor
 
 # from aiosfstream.auth import PasswordAuthenticator
 # import os
 # from utils.access_token import AccessToken
 
 
-def get_limits(domain: str, access_token: str):
-    headers = {"Authorization": f"Bearer {access_token}"}
-    response = requests.get(f"{domain}/services/data/v59.0/limits", headers=headers)
-    response.raise_for_status()
-    return response.json()
-
-
-def get_platform_events_usage(domain: str, access_token: str):
-    headers = {"Authorization": f"Bearer {access_token}"}
-    response = requests.get(
-        f"{domain}/services/data/v59.0/query?q=SELECT+Name+,+StartDate+,+EndDate+,+Value+FROM+PlatformEventUsageMetric",
-        headers=headers,
-    )
-    response.raise_for_status()
-    return json.dumps(obj=response.json(), indent=4)
-
-
 async def stream_events():
     # connect to your Salesforce Org (Production or Developer org)
     async with SalesforceStreamingClient(
@@ -46,20 +29,20 @@ async def stream_events():
     ) as client:
         # subscribe to the platform event using CometD
         await client.subscribe("/data/ChangeEvents")
-        access_token = client.auth.__dict__["access_token"]
-        domain = client.auth.__dict__["instance_url"]
-        # listen for incoming messages
-        message_count = 0
-        async for message in client:
-            pretty_data = json.dumps(message, indent=4, sort_keys=True)
-            print(f"{pretty_data}")
-            message_count += 1
-            print(f"Message Count: {message_count}")
-            if message_count % 5 == 0:
-                limits = get_limits(domain=domain, access_token=access_token)
-                print(
-                    f'{limits["DailyDeliveredPlatformEvents"]}\n{limits["DailyApiRequests"]}'
-                )
+        # listen for incoming messages, the limits are polled in the background
+        async with LimitsMonitor(RestClient(client.auth)) as limits_monitor:
+            message_count = 0
+            async for message in client:
+                pretty_data = json.dumps(message, indent=4, sort_keys=True)
+                print(f"{pretty_data}")
+                message_count += 1
+                print(f"Message Count: {message_count}")
+                if message_count % 5 == 0:
+                    print(
+                        f'{limits_monitor.get("DailyDeliveredPlatformEvents")}\n'
+                        f'{limits_monitor.get("DailyApiRequests")}'
+                    )
+                    print(json.dumps(limits_monitor.snapshot["platform_events_usage"], indent=4))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,159 @@
+import asyncio
+import copy
+
+MERGED_LIST_FIELDS = ("changedFields", "nulledFields", "diffFields")
+
+
+def _merge_lists(first, second):
+    # union of two field lists, in order of first appearance
+    merged = list(first or [])
+    merged.extend(name for name in second or [] if name not in merged)
+    return merged
+
+
+def merge_updates(earlier: dict, later: dict) -> dict:
+    """
+    Merges two UPDATE change events of the same record into one event.
+
+    The field values and the header fields of the later event win, the
+    changedFields and diffFields of both are combined, and a field nulled by
+    one event and set by the other ends up in the state of the later event.
+    The `coalescedCount` header field counts the events merged so far.
+    """
+    merged = dict(earlier)
+    merged.update((k, v) for k, v in later.items() if k != "ChangeEventHeader")
+
+    earlier_header = earlier["ChangeEventHeader"]
+    later_header = later["ChangeEventHeader"]
+    header = dict(later_header)
+    for name in MERGED_LIST_FIELDS:
+        header[name] = _merge_lists(earlier_header.get(name), later_header.get(name))
+    # a field set again after being nulled isn't null anymore
+    later_changed = set(later_header.get("changedFields") or [])
+    later_nulled = set(later_header.get("nulledFields") or [])
+    header["nulledFields"] = [
+        name
+        for name in header["nulledFields"]
+        if name in later_nulled or name not in later_changed
+    ]
+    header["coalescedCount"] = earlier_header.get("coalescedCount", 1) + 1
+    merged["ChangeEventHeader"] = header
+    return merged
+
+
+class ChangeEventCoalescer:
+    """
+    Merges the UPDATE change events of a record received within a time window.
+
+    Events are buffered for `window` seconds after the first one, then passed
+    to `forward(items, positions)` in their original order, with every run of
+    UPDATEs of a single record merged into the first of them. CREATE, DELETE,
+    UNDELETE and GAP events, and UPDATEs of several records at once, are never
+    merged and end the run of the records they touch, so the updates before
+    and after them stay separate. Unless `merge_across_transactions` is set,
+    only the updates of the same transaction (same transactionKey) are merged.
+
+    Items are (payload, extra) pairs: the merged item keeps the `extra` of the
+    latest event (eg: its replay id). `positions` are the checkpoint positions
+    passed to `add()`, reached once the forwarded items are delivered.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        forward,
+        max_events: int = 10000,
+        merge_across_transactions: bool = False,
+    ):
+        self.window = window
+        self.forward = forward
+        self.max_events = max_events
+        self.merge_across_transactions = merge_across_transactions
+        self._items = []
+        # index in _items of the open run of updates of every record
+        self._runs = {}
+        self._positions = []
+        self._timer = None
+        self._error = None
+        # forwards happen one at a time, in the order of the buffered events
+        self._forward_lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    @staticmethod
+    def _record_key(header: dict):
+        record_ids = header.get("recordIds") or []
+        if len(record_ids) != 1:
+            return None
+        return header.get("entityName"), record_ids[0]
+
+    def _add(self, payload: dict, extra):
+        header = payload.get("ChangeEventHeader")
+        if header is None:
+            self._items.append((payload, extra))
+            return
+
+        key = self._record_key(header)
+        if header.get("changeType") != "UPDATE" or key is None:
+            # a boundary, later updates of its records start a new run
+            for record_id in header.get("recordIds") or []:
+                self._runs.pop((header.get("entityName"), record_id), None)
+            self._items.append((payload, extra))
+            return
+
+        index = self._runs.get(key)
+        if index is not None:
+            earlier = self._items[index][0]
+            same_transaction = earlier["ChangeEventHeader"].get(
+                "transactionKey"
+            ) == header.get("transactionKey")
+            if same_transaction or self.merge_across_transactions:
+                self._items[index] = (merge_updates(earlier, payload), extra)
+                return
+        self._runs[key] = len(self._items)
+        # the payload is copied so merging never changes the caller's events
+        self._items.append((copy.copy(payload), extra))
+
+    async def add(self, items, position):
+        """
+        Buffers the (payload, extra) `items`, and the checkpoint `position`
+        reached once they are delivered.
+        """
+        if self._error is not None:
+            raise self._error
+        for payload, extra in items:
+            self._add(payload, extra)
+        self._positions.append(position)
+        if len(self._items) >= self.max_events:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.window, self._flush_soon
+            )
+
+    def _flush_soon(self):
+        self._timer = None
+        task = asyncio.ensure_future(self.flush())
+        task.add_done_callback(self._flush_done)
+
+    def _flush_done(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            # raised by the next add()
+            self._error = task.exception()
+
+    async def flush(self):
+        """
+        Forwards the buffered events right away.
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._forward_lock:
+            items, positions = self._items, self._positions
+            self._items, self._positions, self._runs = [], [], {}
+            if items or positions:
+                await self.forward(items, positions)
+
+    async def close(self):
+        await self.flush()
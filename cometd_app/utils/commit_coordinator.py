@@ -0,0 +1,169 @@
+import asyncio
+import threading
+from collections import deque
+
+
+def _wake_up(waiter):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class _Batch:
+    # a batch of messages produced to Kafka, and the position it advances to
+
+    __slots__ = ("position", "remaining", "error")
+
+    def __init__(self, position, remaining: int):
+        self.position = position
+        self.remaining = remaining
+        self.error = None
+
+
+class CommitCoordinator:
+    """
+    Advances a checkpoint only after Kafka acknowledged the messages before it.
+
+    Every batch of produced messages is registered with `begin()` along with
+    the position (eg: a replay id) reached once it's delivered, and every
+    delivery report is passed to `ack()`. Batches are committed in the order
+    they were registered: `commit(position)` is called for a batch once it and
+    every earlier batch were fully acknowledged, so the checkpoint never moves
+    past an undelivered message. After a failed delivery or a failed commit
+    nothing is committed anymore, and `error` holds the failure; restarting
+    from the last commit then delivers the lost messages again (at least once).
+
+    `ack()` may be called from any thread, eg: from librdkafka's delivery
+    callbacks. If `commit` is a coroutine function, `ack()` must be called from
+    the event loop's thread, and the commits are awaited one after the other.
+    """
+
+    def __init__(self, commit, max_pending: int = 1000):
+        self.commit = commit
+        self.max_pending = max_pending
+        self.error = None
+        self._async_commit = asyncio.iscoroutinefunction(commit)
+        self._last_commit = None
+        self._pending = deque()
+        self._lock = threading.Lock()
+        # held while committing, so the positions are committed in order
+        self._commit_lock = threading.Lock()
+        self._has_capacity = threading.Condition(self._lock)
+        # (loop, future) of the coroutines in `wait_for_capacity_async()`
+        self._capacity_waiters = []
+
+    def __len__(self):
+        # number of batches waiting for their delivery reports
+        return len(self._pending)
+
+    def begin(self, position, count: int):
+        """
+        Registers a batch of `count` messages, and returns the handle to pass
+        to `ack()` with the delivery report of each of them.
+        """
+        batch = _Batch(position, count)
+        with self._lock:
+            self._pending.append(batch)
+        if count == 0:
+            self._advance()
+        return batch
+
+    def ack(self, batch, error=None):
+        with self._lock:
+            batch.remaining -= 1
+            if error is not None and batch.error is None:
+                batch.error = error
+        self._advance()
+
+    def _advance(self):
+        with self._commit_lock:
+            committed = []
+            with self._lock:
+                while (
+                    self.error is None
+                    and self._pending
+                    and self._pending[0].remaining <= 0
+                ):
+                    if self._pending[0].error is not None:
+                        # keep the failed batch at the head, so nothing after
+                        # it gets committed
+                        self.error = self._pending[0].error
+                        break
+                    committed.append(self._pending.popleft().position)
+                if committed or self.error is not None:
+                    self._notify_capacity()
+            for position in committed:
+                if self._async_commit:
+                    self._last_commit = asyncio.ensure_future(
+                        self._commit_after(self._last_commit, position)
+                    )
+                else:
+                    try:
+                        self.commit(position)
+                    except Exception as e:
+                        self._fail(e)
+                        break
+
+    async def _commit_after(self, previous, position):
+        # commits are serialized, so an older position never overwrites a newer one
+        if previous is not None:
+            await asyncio.wait([previous])
+        if self.error is not None:
+            return
+        try:
+            await self.commit(position)
+        except Exception as e:
+            self._fail(e)
+
+    def _fail(self, error):
+        # a failed commit stops the commits, and is raised by `raise_for_error()`
+        with self._lock:
+            if self.error is None:
+                self.error = error
+            self._notify_capacity()
+
+    def _notify_capacity(self):
+        # called while holding the lock
+        self._has_capacity.notify_all()
+        for loop, waiter in self._capacity_waiters:
+            loop.call_soon_threadsafe(_wake_up, waiter)
+        self._capacity_waiters.clear()
+
+    def track(self, position, futures):
+        """
+        Registers a batch of asyncio `futures`, eg: the ones returned by
+        `AsyncProducer.enqueue()`, acknowledged as they complete.
+        """
+        batch = self.begin(position, len(futures))
+
+        def on_done(future):
+            if future.cancelled():
+                self.ack(batch, asyncio.CancelledError())
+            else:
+                self.ack(batch, future.exception())
+
+        for future in futures:
+            future.add_done_callback(on_done)
+        return batch
+
+    def wait_for_capacity(self, timeout: float = None) -> bool:
+        # blocks while `max_pending` batches are waiting for delivery reports
+        with self._lock:
+            return self._has_capacity.wait_for(
+                lambda: len(self._pending) < self.max_pending or self.error is not None,
+                timeout,
+            )
+
+    async def wait_for_capacity_async(self):
+        # same as `wait_for_capacity()`, without blocking the event loop
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if len(self._pending) < self.max_pending or self.error is not None:
+                    return
+                waiter = loop.create_future()
+                self._capacity_waiters.append((loop, waiter))
+            await waiter
+
+    def raise_for_error(self):
+        if self.error is not None:
+            raise RuntimeError(f"Kafka delivery or commit failed: {self.error}")
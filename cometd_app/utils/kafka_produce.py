@@ -1,5 +1,8 @@
-from confluent_kafka import Producer, Consumer
+from confluent_kafka import Producer, Consumer, KafkaException
+import asyncio
+import atexit
 import os
+import threading
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -26,6 +29,13 @@ def create_config_from_env():
         "sasl.username": os.getenv("SASL_USERNAME"),
         "sasl.password": os.getenv("SASL_PASSWORD"),
         "session.timeout.ms": os.getenv("SESSION_TIMEOUT_MS"),
+        # no duplicates or reordering when the producer retries a batch, the
+        # replay id checkpoints rely on the delivery reports
+        "enable.idempotence": os.getenv("KAFKA_ENABLE_IDEMPOTENCE", "true"),
+        "acks": "all",
+        # murmur2 hashes the keys like the Java clients do, so topics keyed
+        # by record stay co-partitioned with the ones written by other apps
+        "partitioner": os.getenv("KAFKA_PARTITIONER", "murmur2_random"),
     }
 
 
@@ -67,19 +77,151 @@ def test_send(config_file, topic, key, value):
         consumer.close()
 
 
-def send_message(config_file, topic, key, value):
-    # producer and consumer code here
-    config = create_config_from_env()
+class SharedProducer:
+    """
+    Long-lived Kafka producer shared by the whole process.
+
+    Messages are only enqueued in librdkafka's internal buffer by `produce()`;
+    a background thread serves the delivery reports with `poll()` so the
+    caller never waits on a broker round trip. Outstanding messages are only
+    flushed when `flush()` is called explicitly (eg: on a checkpoint) or when
+    the producer is closed on shutdown.
+    """
+
+    def __init__(self, config: dict, poll_interval: float = 0.1):
+        self.producer = Producer(config)
+        self.poll_interval = poll_interval
+        self._closed = threading.Event()
+        self._poll_thread = threading.Thread(
+            target=self._poll_loop, name="kafka-delivery-poll", daemon=True
+        )
+        self._poll_thread.start()
+
+    def _poll_loop(self):
+        # serve delivery reports until the producer gets closed
+        while not self._closed.is_set():
+            self.producer.poll(self.poll_interval)
+
+    def produce(
+        self, topic, key, value, on_delivery=None, block: bool = True, headers=None
+    ):
+        while True:
+            try:
+                self.producer.produce(
+                    topic, key=key, value=value, headers=headers, on_delivery=on_delivery
+                )
+                return
+            except BufferError:
+                if not block:
+                    raise
+                # the local queue is full, wait for some deliveries to complete
+                self.producer.poll(self.poll_interval)
 
-    # creates a new producer instance
-    producer = Producer(config)
+    def flush(self, timeout: float = None):
+        # send any outstanding or buffered messages to the Kafka broker
+        if timeout is None:
+            return self.producer.flush()
+        return self.producer.flush(timeout)
 
-    # produces a sample message
-    producer.produce(topic, key=key, value=value)
-    print(f"Produced message to {topic} with key = {key:12}")
+    def close(self):
+        if self._closed.is_set():
+            return
+        self.flush()
+        self._closed.set()
+        self._poll_thread.join()
 
-    # send any outstanding or buffered messages to the Kafka broker
-    producer.flush()
+    def __len__(self):
+        # number of messages waiting for delivery
+        return len(self.producer)
+
+
+_shared_producer = None
+_shared_producer_lock = threading.Lock()
+
+
+def get_producer() -> SharedProducer:
+    # creates the process-wide producer on first use and reuses it afterwards
+    global _shared_producer
+    with _shared_producer_lock:
+        if _shared_producer is None:
+            _shared_producer = SharedProducer(create_config_from_env())
+            atexit.register(_shared_producer.close)
+    return _shared_producer
+
+
+def existing_producer():
+    # the process-wide producer if it was created, without creating it
+    with _shared_producer_lock:
+        return _shared_producer
+
+
+def _set_delivery_result(future: asyncio.Future, err, msg):
+    if future.done():
+        return
+    if err is not None:
+        future.set_exception(KafkaException(err))
+    else:
+        future.set_result(msg)
+
+
+class AsyncProducer:
+    """
+    asyncio facade over the `SharedProducer`.
+
+    `produce()` never blocks the event loop: the message is handed to
+    librdkafka and the coroutine resolves once the delivery report for it is
+    served by the producer's poll thread.
+    """
+
+    def __init__(self, producer: SharedProducer = None):
+        self.producer = producer or get_producer()
+
+    async def enqueue(self, topic, key, value, headers=None) -> asyncio.Future:
+        # returns as soon as the message is queued, with a future for its delivery report
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def on_delivery(err, msg):
+            # called from the poll thread
+            loop.call_soon_threadsafe(_set_delivery_result, future, err, msg)
+
+        while True:
+            try:
+                self.producer.produce(
+                    topic,
+                    key=key,
+                    value=value,
+                    on_delivery=on_delivery,
+                    block=False,
+                    headers=headers,
+                )
+                return future
+            except BufferError:
+                # the local queue is full, give the poll thread time to drain it
+                await asyncio.sleep(self.producer.poll_interval)
+
+    async def produce(self, topic, key, value, headers=None):
+        future = await self.enqueue(topic, key, value, headers)
+        return await future
+
+    async def enqueue_batch(self, topic, messages) -> list:
+        # queues every (key, value) or (key, value, headers) message, and
+        # returns the futures of their delivery reports
+        return [await self.enqueue(topic, *message) for message in messages]
+
+    async def produce_batch(self, topic, messages):
+        # queue every message first, then wait for all the delivery reports
+        return await asyncio.gather(*await self.enqueue_batch(topic, messages))
+
+    async def flush(self, timeout: float = None):
+        # flush in a worker thread so the event loop keeps running
+        return await asyncio.to_thread(self.producer.flush, timeout)
+
+
+def send_message(config_file, topic, key, value):
+    # enqueue the message on the shared producer, delivery happens in the background
+    get_producer().produce(topic, key=key, value=value)
+    print(f"Produced message to {topic} with key = {key:12}")
 
     return
 
@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+from aiosfstream import RestClient
+
+PLATFORM_EVENTS_USAGE_QUERY = (
+    "SELECT Name, StartDate, EndDate, Value FROM PlatformEventUsageMetric"
+)
+
+
+def limit_usage(limits: dict, name: str = "DailyDeliveredPlatformEvents") -> float:
+    # fraction of the limit already used, between 0 and 1
+    limit = limits.get(name) or {}
+    maximum = limit.get("Max") or 0
+    if maximum <= 0:
+        return 0.0
+    return max(0.0, min(1.0, (maximum - limit.get("Remaining", maximum)) / maximum))
+
+
+class LimitsMonitor:
+    """
+    Polls the org's `/limits` and `PlatformEventUsageMetric` in a background task.
+
+    The latest results are cached in `snapshot`, so the listener and the
+    metrics can read them without waiting on a REST call. The polling
+    interval shrinks from `max_interval` towards `min_interval` as the usage
+    of `DailyDeliveredPlatformEvents` grows past `usage_threshold`, so the
+    numbers are fresher when the org gets close to its daily allocation.
+    """
+
+    def __init__(
+        self,
+        rest_client: RestClient,
+        min_interval: float = 30.0,
+        max_interval: float = 300.0,
+        usage_threshold: float = 0.5,
+        query_usage: bool = True,
+    ):
+        self.rest_client = rest_client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.usage_threshold = usage_threshold
+        self.query_usage = query_usage
+        self.snapshot = {
+            "limits": None,
+            "platform_events_usage": None,
+            "delivered_usage": 0.0,
+            "fetched_at": None,
+            "error": None,
+        }
+        self._task = None
+
+    @property
+    def interval(self) -> float:
+        # seconds until the next poll, based on the latest snapshot
+        usage = self.snapshot["delivered_usage"]
+        if usage <= self.usage_threshold:
+            return self.max_interval
+        # scale linearly between the threshold and the full allocation
+        ratio = (usage - self.usage_threshold) / (1.0 - self.usage_threshold)
+        return max(
+            self.min_interval,
+            self.max_interval - ratio * (self.max_interval - self.min_interval),
+        )
+
+    def get(self, name: str) -> dict:
+        # the cached value of a single limit, eg: "DailyApiRequests"
+        limits = self.snapshot["limits"] or {}
+        return limits.get(name)
+
+    async def poll(self) -> dict:
+        # fetch the limits (and the usage metrics) once and update the snapshot
+        try:
+            limits = await self.rest_client.limits()
+            usage = None
+            if self.query_usage:
+                result = await self.rest_client.query(PLATFORM_EVENTS_USAGE_QUERY)
+                usage = result.get("records", [])
+        except Exception as e:
+            # keep serving the previous values, the next poll may succeed
+            self.snapshot = dict(self.snapshot, error=str(e))
+            print(f"Failed to fetch the org limits: {e}")
+            return self.snapshot
+
+        # replace the snapshot as a whole, readers never see a partial update
+        self.snapshot = {
+            "limits": limits,
+            "platform_events_usage": usage,
+            "delivered_usage": limit_usage(limits),
+            "fetched_at": time.time(),
+            "error": None,
+        }
+        return self.snapshot
+
+    async def _run(self):
+        while True:
+            await self.poll()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="limits-monitor")
+        return self._task
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.stop()
@@ -0,0 +1,418 @@
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+
+from confluent_kafka import KafkaException
+
+from utils.kafka_produce import get_producer
+
+# crc32 of the rest of the record, key length, value length, headers length
+RECORD_HEADER = struct.Struct("<IHII")
+# name length, value length of every Kafka header
+KAFKA_HEADER = struct.Struct("<HI")
+# key length of records without a key, left to the producer's partitioner
+NO_KEY = 0xFFFF
+SEGMENT_SUFFIX = ".seg"
+CHECKPOINT_FILE = "checkpoint"
+
+
+def pack_headers(headers) -> bytes:
+    packed = []
+    for name, value in headers:
+        name = name.encode("utf-8")
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        packed.append(KAFKA_HEADER.pack(len(name), len(value)) + name + value)
+    return b"".join(packed)
+
+
+def _fsync_directory(directory: str):
+    # makes the creation or the rename of a file in `directory` durable
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def unpack_headers(data: bytes) -> list:
+    headers = []
+    pos = 0
+    while pos < len(data):
+        name_len, value_len = KAFKA_HEADER.unpack_from(data, pos)
+        pos += KAFKA_HEADER.size
+        name = data[pos : pos + name_len].decode("utf-8")
+        headers.append((name, data[pos + name_len : pos + name_len + value_len]))
+        pos += name_len + value_len
+    return headers
+
+
+class _Segment:
+    # a preallocated, memory-mapped segment file
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.index = int(os.path.basename(path)[: -len(SEGMENT_SUFFIX)])
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+                # a new segment must survive a crash along with its records
+                os.fsync(fd)
+                _fsync_directory(os.path.dirname(path))
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    def read(self, pos: int):
+        # returns (key, value, headers, next position), or None past the last record
+        if pos + RECORD_HEADER.size > len(self.map):
+            return None
+        crc, key_len, value_len, headers_len = RECORD_HEADER.unpack_from(self.map, pos)
+        has_key = key_len != NO_KEY
+        if not has_key:
+            key_len = 0
+        end = pos + RECORD_HEADER.size + key_len + value_len + headers_len
+        if end > len(self.map):
+            return None
+        body = self.map[pos + 4 : end]
+        if crc != zlib.crc32(body):
+            # zero filled space after the last record, or a torn write
+            return None
+        start = pos + RECORD_HEADER.size
+        key = self.map[start : start + key_len] if has_key else None
+        value = self.map[start + key_len : start + key_len + value_len]
+        headers = unpack_headers(self.map[end - headers_len : end]) if headers_len else None
+        return key, value, headers, end
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+
+
+class SpillLog:
+    """
+    Segmented, memory-mapped append-only log of (key, value) records.
+
+    The listeners append the events here instead of producing them to Kafka
+    directly, and a `SpillDrainer` forwards them to Kafka in the background.
+    An append is a copy into a memory-mapped segment, so it keeps up with
+    Salesforce while the brokers are slow or unreachable. The records
+    survive a crash of the process, since the mapped pages belong to the
+    page cache; `sync()` also writes them to the disk.
+
+    Segments are preallocated files of `segment_size` bytes. The position of
+    the last record delivered to Kafka is stored in a checkpoint file, and
+    segments are deleted once every record in them was delivered. At most
+    `max_bytes` of segments exist at once: when they are all in use, appends
+    block until the drainer frees a segment.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int = 64 * 1024 * 1024,
+        max_bytes: int = 1024 * 1024 * 1024,
+    ):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_segments = max(2, max_bytes // segment_size)
+        self._lock = threading.Lock()
+        # notified when records are appended, and when segments are freed
+        self._appended = threading.Condition(self._lock)
+        self._freed = threading.Condition(self._lock)
+        self._closed = False
+        os.makedirs(directory, exist_ok=True)
+
+        indexes = sorted(
+            int(name[: -len(SEGMENT_SUFFIX)])
+            for name in os.listdir(directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+        self._committed = self._read_checkpoint() or (indexes[0] if indexes else 0, 0)
+        # segments before the checkpoint were fully delivered
+        for index in indexes:
+            if index < self._committed[0]:
+                os.unlink(self._segment_path(index))
+        indexes = [index for index in indexes if index >= self._committed[0]]
+
+        self._segments = {}
+        self._write_segment = self._open_segment(indexes[-1] if indexes else self._committed[0])
+        # find the end of the last segment
+        self._write_pos = 0
+        while True:
+            record = self._write_segment.read(self._write_pos)
+            if record is None:
+                break
+            self._write_pos = record[3]
+        self._read_cursor = self._committed
+
+    def _segment_path(self, index: int) -> str:
+        return os.path.join(self.directory, f"{index:012d}{SEGMENT_SUFFIX}")
+
+    def _open_segment(self, index: int) -> _Segment:
+        if index not in self._segments:
+            self._segments[index] = _Segment(self._segment_path(index), self.segment_size)
+        return self._segments[index]
+
+    def _read_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, CHECKPOINT_FILE)) as file:
+                index, pos = file.read().split(":")
+                return int(index), int(pos)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_checkpoint(self, position):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".checkpoint")
+        with os.fdopen(fd, "w") as file:
+            file.write(f"{position[0]}:{position[1]}")
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, os.path.join(self.directory, CHECKPOINT_FILE))
+        # make the rename itself durable
+        _fsync_directory(self.directory)
+
+    def _segment_count(self) -> int:
+        return self._write_segment.index - self._committed[0] + 1
+
+    def _append(self, key: bytes, value: bytes, headers, block: bool) -> bool:
+        key_len = NO_KEY if key is None else len(key)
+        key = key or b""
+        if len(key) >= NO_KEY:
+            raise ValueError(f"Key of {len(key)} bytes is too long")
+        headers = pack_headers(headers) if headers else b""
+        size = RECORD_HEADER.size + len(key) + len(value) + len(headers)
+        if size > self.segment_size:
+            raise ValueError(f"Record of {size} bytes doesn't fit in a segment")
+        if self._write_pos + size > self.segment_size:
+            # roll over to a new segment once there is room for one
+            while self._segment_count() >= self.max_segments:
+                if not block:
+                    return False
+                self._freed.wait()
+            self._write_segment.map.flush()
+            self._write_segment = self._open_segment(self._write_segment.index + 1)
+            self._write_pos = 0
+
+        body = RECORD_HEADER.pack(0, key_len, len(value), len(headers))[4:] + key + value + headers
+        pos = self._write_pos
+        segment_map = self._write_segment.map
+        segment_map[pos + 4 : pos + size] = body
+        # the checksum goes last, a torn record never looks complete
+        segment_map[pos : pos + 4] = struct.pack("<I", zlib.crc32(body))
+        self._write_pos += size
+        return True
+
+    def append_batch(self, messages, block: bool = True) -> int:
+        """
+        Appends the (key, value) or (key, value, headers) messages and returns how many were
+        appended. With `block=False` it stops at the first record that doesn't
+        fit, instead of waiting for the drainer to free a segment.
+        """
+        appended = 0
+        with self._lock:
+            for key, value, *headers in messages:
+                if isinstance(key, str):
+                    key = key.encode("utf-8")
+                if not self._append(key, value, headers[0] if headers else None, block):
+                    break
+                appended += 1
+            if appended:
+                self._appended.notify_all()
+        return appended
+
+    def read_batch(self, max_records: int = 500, timeout: float = None):
+        """
+        Returns up to `max_records` records after the previously read ones,
+        and the position to `commit()` once they are delivered. Waits at most
+        `timeout` seconds for records to be appended.
+        """
+        with self._lock:
+            if self._read_cursor == (self._write_segment.index, self._write_pos):
+                self._appended.wait(timeout)
+
+            records = []
+            index, pos = self._read_cursor
+            while len(records) < max_records:
+                if (index, pos) == (self._write_segment.index, self._write_pos):
+                    break
+                record = self._open_segment(index).read(pos)
+                if record is None:
+                    if index >= self._write_segment.index:
+                        break
+                    # rest of the segment is unused, continue in the next one
+                    index, pos = index + 1, 0
+                    continue
+                key, value, headers, pos = record
+                records.append((key, value, headers))
+            self._read_cursor = (index, pos)
+            return records, self._read_cursor
+
+    def commit(self, position):
+        """
+        Records that every record before `position` was delivered, and frees
+        the segments that only held delivered records.
+        """
+        self._write_checkpoint(position)
+        with self._lock:
+            for index in range(self._committed[0], position[0]):
+                segment = self._segments.pop(index, None)
+                if segment is not None:
+                    segment.close()
+                os.unlink(self._segment_path(index))
+            self._committed = position
+            self._freed.notify_all()
+
+    def rewind(self):
+        # read the undelivered records again
+        with self._lock:
+            self._read_cursor = self._committed
+
+    def pending_bytes(self) -> int:
+        # approximate size of the undelivered records
+        with self._lock:
+            segments = self._write_segment.index - self._committed[0]
+            return segments * self.segment_size + self._write_pos - self._committed[1]
+
+    def sync(self):
+        # writes the appended records to the disk (msync, earlier segments are
+        # synced when rolling over), so a position covering them can be
+        # committed upstream
+        with self._lock:
+            self._write_segment.map.flush()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for segment in self._segments.values():
+                segment.close()
+            self._segments.clear()
+
+
+class SpillDrainer(threading.Thread):
+    """
+    Forwards the records of a `SpillLog` to Kafka, with at-least-once
+    semantics.
+
+    The records are read in batches, produced with the shared producer and
+    committed in the log once every delivery report of the batch succeeded.
+    The records whose delivery failed are produced again after a backoff, so
+    records may be delivered more than once, but never dropped. A progress
+    message is printed every `delivery_timeout` seconds while the delivery
+    reports of a batch are outstanding.
+    """
+
+    def __init__(
+        self,
+        spill_log: SpillLog,
+        topic: str,
+        producer=None,
+        batch_size: int = 500,
+        delivery_timeout: float = 30.0,
+        max_retry_interval: float = 30.0,
+    ):
+        super().__init__(name="spill-log-drainer", daemon=True)
+        self.spill_log = spill_log
+        self.topic = topic
+        self.producer = producer or get_producer()
+        self.batch_size = batch_size
+        self.delivery_timeout = delivery_timeout
+        self.max_retry_interval = max_retry_interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        wait_time = 1
+        while not self._stopped.is_set():
+            try:
+                records, position = self.spill_log.read_batch(self.batch_size, timeout=0.5)
+                if not records:
+                    continue
+                if self._deliver(records):
+                    self.spill_log.commit(position)
+                else:
+                    # stopped before the batch was delivered
+                    self.spill_log.rewind()
+                wait_time = 1
+            except Exception as e:
+                # keep draining, appends would block forever on a dead drainer
+                print(f"Spill log drainer failed: {e!r}. Retrying in {wait_time} seconds...")
+                self.spill_log.rewind()
+                self._stopped.wait(wait_time)
+                wait_time = min(wait_time * 2, self.max_retry_interval)
+
+    def _deliver(self, records) -> bool:
+        wait_time = 1
+        while not self._stopped.is_set():
+            records = self._produce(records)
+            if records is None:
+                return False
+            if not records:
+                return True
+            print(
+                f"Failed to forward {len(records)} spilled events. "
+                f"Retrying in {wait_time} seconds..."
+            )
+            self._stopped.wait(wait_time)
+            wait_time = min(wait_time * 2, self.max_retry_interval)
+        return False
+
+    def _produce(self, records):
+        """
+        Produces the records once and waits for all their delivery reports.
+        Returns the records that failed, to produce again, or None if the
+        drainer was stopped first. Records are never produced again while
+        they are still queued in the producer, so an outage doesn't pile up
+        copies of the batch.
+        """
+        failed = []
+        reported = [0]
+        lock = threading.Lock()
+        all_reported = threading.Event()
+
+        def report(index):
+            def on_delivery(err, msg):
+                with lock:
+                    if err is not None:
+                        failed.append(index)
+                    reported[0] += 1
+                    if reported[0] == produced:
+                        all_reported.set()
+
+            return on_delivery
+
+        produced = len(records)
+        for index, (key, value, headers) in enumerate(records):
+            try:
+                self.producer.produce(
+                    self.topic, key=key, value=value, headers=headers, on_delivery=report(index)
+                )
+            except KafkaException as e:
+                print(f"Failed to forward spilled events: {e}")
+                with lock:
+                    # the rest of the batch is retried along with the failed records
+                    failed.extend(range(index, len(records)))
+                    produced = index
+                    if reported[0] == produced:
+                        all_reported.set()
+                break
+
+        waited = 0.0
+        while not all_reported.wait(0.5):
+            if self._stopped.is_set():
+                return None
+            waited += 0.5
+            if waited >= self.delivery_timeout:
+                print(f"Waiting for the delivery of {produced - reported[0]} spilled events...")
+                waited = 0.0
+        # retried in their original order
+        return [records[index] for index in sorted(failed)]
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
@@ -1,4 +1,6 @@
-import json
+from aiocometd.json_codec import json_dumps_bytes
+
+from utils.partitioning import keyed_messages, record_keys
 
 
 def transform_message(message):
@@ -16,6 +18,13 @@ def transform_message(message):
 
     #     },
     # }
-    key = str(key)
-    value = json.dumps(value, indent=4)
-    return key, value
+    # a single (key, value) message, keyed by the first changed record;
+    # transform_payload() returns one message per changed record instead
+    (key,) = record_keys(value, default=str(key), fan_out=False)
+    return key, json_dumps_bytes(value)
+
+
+def transform_payload(payload, replay_id):
+    # compact UTF-8 bytes, handed to the Kafka producer as they are, with
+    # one (key, value) pair per changed record
+    return keyed_messages(payload, json_dumps_bytes(payload), default=str(replay_id))
@@ -0,0 +1,209 @@
+import asyncio
+import functools
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+from util.access_token import AccessToken
+from util.async_pubsub import AsyncPubSub
+from util.flow_control import FlowController
+from util.subscription_manager import SubscriptionManager
+from util.checkpoint import create_checkpoint_store_from_env, read_position, replay_position
+from util.coalesce import create_coalescer_from_env
+from util.commit_coordinator import CommitCoordinator
+from util.json_codec import json_dumps_bytes
+from util.kafka_produce import AsyncProducer, get_producer
+from util.partitioning import keyed_messages
+from util.passthrough import PAYLOAD_FORMAT, create_schema_exporter_from_env, passthrough_messages
+from util.spill_log import SpillDrainer, create_spill_log_from_env
+from util.token_cache import create_token_cache_from_env, discard_rejected_token, discard_token
+
+load_dotenv()
+
+argument_dict = {
+    "url": os.environ.get("PROD_DOMAIN"),
+    "client_id": os.environ.get("PROD_CONSUMER_KEY"),
+    "client_secret": os.environ.get("PROD_CONSUMER_SECRET"),
+    "username": os.environ.get("PROD_USERNAME"),
+    "password": os.environ.get("PROD_PASSWORD"),
+    "security_token": os.environ.get("PROD_SECURITY_TOKEN"),
+    "grpc_host": os.environ.get("GRPC_HOST"),
+    "grpc_port": os.environ.get("GRPC_PORT"),
+    "topic_name": os.environ.get("TOPIC_NAME"),
+    "topic_names": os.environ.get("TOPIC_NAMES"),
+    "schema_cache_size": os.environ.get("SCHEMA_CACHE_SIZE"),
+    "schema_cache_dir": os.environ.get("SCHEMA_CACHE_DIR"),
+}
+
+
+def create_coordinator(topic):
+    # the replay id of a FetchResponse is saved once Kafka acknowledged its
+    # events and the ones of every earlier FetchResponse
+    return CommitCoordinator(
+        lambda replay_id: checkpoint_store.save(topic, replay_id),
+        max_pending=int(os.environ.get("MAX_IN_FLIGHT_BATCHES", 100)),
+    )
+
+
+def make_callback(topic):
+    coordinator = create_coordinator(topic)
+
+    async def forward(messages, replay_id):
+        if spill_log is not None:
+            # the drainer forwards the batch to Kafka
+            appended = spill_log.append_batch(messages, block=False)
+            if appended < len(messages):
+                # the spill log is full, wait for the drainer in a worker thread
+                await asyncio.to_thread(spill_log.append_batch, messages[appended:])
+            # the replay id is only saved once the records are on disk
+            await asyncio.to_thread(spill_log.sync)
+            coordinator.begin(replay_id, 0)
+        else:
+            # queue the batch without waiting for its delivery reports
+            await coordinator.wait_for_capacity_async()
+            futures = await producer.enqueue_batch(os.environ.get("KAFKA_TOPIC"), messages)
+            coordinator.track(replay_id, futures)
+
+    async def forward_coalesced(items, replay_ids):
+        # one message per changed record, keyed by entity and record id
+        messages = [
+            message
+            for event_read, _ in items
+            for message in keyed_messages(event_read, json_dumps_bytes(event_read))
+        ]
+        # the last replay id covers every FetchResponse merged in the window
+        await forward(messages, replay_ids[-1])
+
+    # bursts of updates of a record are merged before they are produced, in
+    # the JSON payload format only
+    coalescer = create_coalescer_from_env(forward_coalesced) if PAYLOAD_FORMAT != "avro" else None
+
+    async def process_event(event, pubsub):
+        nonlocal coordinator
+        if event.events:
+            print(f"Number of events received in FetchResponse for {topic}: ", len(event.events))
+            if coordinator.error is not None:
+                # resubscribe from the last saved replay id (see `resume_position`)
+                # with a new coordinator, dropping the events held back since
+                failed, coordinator = coordinator, create_coordinator(topic)
+                if coalescer is not None:
+                    coalescer.discard()
+                failed.raise_for_error()
+
+            if coalescer is not None:
+                events_read = [
+                    (pubsub.return_event(event_read), None) for event_read in await pubsub.read_events(event)
+                ]
+                await coalescer.add(events_read, event.latest_replay_id)
+                return
+
+            messages = []
+            if PAYLOAD_FORMAT == "avro":
+                # forward the Avro payloads as they are, with their schema id in the headers
+                for consumer_event in event.events:
+                    schema = await pubsub.get_schema(consumer_event.event.schema_id)
+                    # the events using a new schema wait for its export
+                    await schema_exporter.export_async(schema, producer)
+                    messages.extend(passthrough_messages(schema, consumer_event, topic))
+            else:
+                for event_read in await pubsub.read_events(event):
+                    event_read = pubsub.return_event(event_read)
+                    # one message per changed record, keyed by entity and record id
+                    messages.extend(keyed_messages(event_read, json_dumps_bytes(event_read)))
+            await forward(messages, event.latest_replay_id)
+
+        else:
+            print(
+                "[",
+                time.strftime("%b %d, %Y %I:%M%p %Z"),
+                f"] The subscription to {topic} is active.",
+            )
+
+    return process_event
+
+
+def resume_position(topic):
+    # after a failed delivery the topic resumes from its last saved replay id
+    replay_id = checkpoint_store.load(topic)
+    return replay_position(replay_id) if replay_id else None
+
+
+async def main():
+    wait_time = 1
+    while True:
+        pubsub = AsyncPubSub(
+            argument_dict=argument_dict,
+            auth=functools.partial(AccessToken, token_cache=token_cache),
+        )
+        try:
+            await pubsub.authenticate()
+
+            # all topics share the channel, the access token and the schema cache
+            topics = (argument_dict["topic_names"] or pubsub.topic_name).split(",")
+            topics = [topic.strip() for topic in topics if topic.strip()]
+            manager = SubscriptionManager(
+                pubsub,
+                # a rejected token is removed from the shared cache before reauthenticating
+                on_token_rejected=(
+                    functools.partial(discard_token, token_cache)
+                    if token_cache is not None
+                    else None
+                ),
+            )
+            for topic in topics:
+                # with a single topic, fall back to a replay id file written by
+                # earlier versions of the listener
+                replay_type, replay_id = read_position(
+                    checkpoint_store,
+                    topic,
+                    pubsub if len(topics) == 1 else None,
+                    sys.argv[1] if len(sys.argv) > 1 else None,
+                )
+                manager.add(
+                    topic=topic,
+                    callback=make_callback(topic),
+                    resume=functools.partial(resume_position, topic),
+                    replay_type=replay_type,
+                    replay_id=replay_id,
+                    flow_controller=FlowController(
+                        min_requested=int(os.environ.get("FETCH_MIN_REQUESTED", 10)),
+                        max_requested=int(os.environ.get("FETCH_MAX_REQUESTED", 100)),
+                        queue_depth=lambda: len(get_producer()),
+                    ),
+                )
+            await manager.run()
+            wait_time = 1
+
+        except Exception as e:
+            print(f"Error encountered: {e}. Retrying in {wait_time} seconds...")
+            discard_rejected_token(token_cache, pubsub, e)
+            await asyncio.sleep(wait_time)
+            wait_time = min(wait_time * 2, 30)  # Exponential backoff capped at 30 seconds
+        finally:
+            await pubsub.close()
+
+
+if __name__ == "__main__":
+    producer = AsyncProducer()
+    schema_exporter = create_schema_exporter_from_env(get_producer())
+    checkpoint_store = create_checkpoint_store_from_env()
+    token_cache = create_token_cache_from_env()
+    spill_log = create_spill_log_from_env()
+    spill_drainer = None
+    if spill_log is not None:
+        spill_drainer = SpillDrainer(spill_log, topic=os.environ.get("KAFKA_TOPIC"))
+        spill_drainer.start()
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # records left in the spill log are forwarded after the next start
+        if spill_drainer is not None:
+            spill_drainer.stop()
+            spill_log.close()
+        # write the latest replay ids before exiting
+        checkpoint_store.close()
+        # deliver whatever is still buffered in the shared producer
+        get_producer().close()
@@ -1,13 +1,20 @@
+import functools
 import os
 import time
-import json
 from dotenv import load_dotenv
 import sys
 
 from util.access_token import AccessToken
 from util.pubsub_class import PubSub
-from util.ChangeEventHeaderUtility import process_bitmap
-from util.kafka_produce import send_message
+from util.flow_control import FlowController
+from util.checkpoint import create_checkpoint_store_from_env, read_position
+from util.commit_coordinator import CommitCoordinator
+from util.json_codec import json_dumps_bytes
+from util.kafka_produce import get_producer
+from util.partitioning import keyed_messages
+from util.passthrough import PAYLOAD_FORMAT, create_schema_exporter_from_env, passthrough_messages
+from util.spill_log import SpillDrainer, create_spill_log_from_env
+from util.token_cache import create_token_cache_from_env, discard_rejected_token
 
 load_dotenv()
 
@@ -21,6 +28,8 @@ argument_dict = {
     "grpc_host": os.environ.get("GRPC_HOST"),
     "grpc_port": os.environ.get("GRPC_PORT"),
     "topic_name": os.environ.get("TOPIC_NAME"),
+    "schema_cache_size": os.environ.get("SCHEMA_CACHE_SIZE"),
+    "schema_cache_dir": os.environ.get("SCHEMA_CACHE_DIR"),
 }
 
 
@@ -29,22 +38,52 @@ def process_event(event, pubsub):
         print("Number of events received in FetchResponse: ", len(event.events))
         # If all requested events are delivered, release the semaphore
         # so that a new FetchRequest gets sent by `PubSub.fetch_req_stream()`.
-        if event.pending_num_requested == 0:
+        # With a flow controller, the controller sends the next FetchRequest.
+        if pubsub.flow_controller is None and event.pending_num_requested == 0:
             pubsub.release_subscription_semaphore()
 
-        for evt in event.events:
-            event_read = pubsub.read_event(evt, process_bitmap)
-            event_read = pubsub.return_event(event_read)
-
-            print(json.dumps(event_read, indent=2))
-
-            send_message(
-                topic=os.environ.get("KAFKA_TOPIC"),
-                key=event_read["ChangeEventHeader"]["recordIds"][0],
-                value=json.dumps(event_read, indent=2),
-            )
-
-        pubsub.store_replay_id(event.latest_replay_id)
+        # resubscribe from the last saved replay id if a delivery failed
+        coordinator.raise_for_error()
+
+        messages = []
+        if PAYLOAD_FORMAT == "avro":
+            # forward the Avro payloads as they are, with their schema id in the headers
+            for consumer_event in event.events:
+                schema = pubsub.get_schema(consumer_event.event.schema_id)
+                schema_exporter.export(schema)
+                messages.extend(passthrough_messages(schema, consumer_event, pubsub.topic_name))
+        else:
+            for event_read in pubsub.read_events(event):
+                event_read = pubsub.return_event(event_read)
+
+                value = json_dumps_bytes(event_read)
+                print(value.decode("utf-8"))
+                # one message per changed record, keyed by entity and record id
+                messages.extend(keyed_messages(event_read, value))
+
+        if spill_log is not None:
+            # the drainer forwards the batch to Kafka, the replay id is only
+            # saved once it's synced to disk
+            spill_log.append_batch(messages)
+            spill_log.sync()
+            coordinator.begin(event.latest_replay_id, 0)
+        else:
+            # the replay id is saved from the delivery reports, once every
+            # event up to it reached Kafka
+            coordinator.wait_for_capacity()
+            batch = coordinator.begin(event.latest_replay_id, len(messages))
+
+            def on_delivery(err, msg):
+                coordinator.ack(batch, err)
+
+            for key, value, *headers in messages:
+                get_producer().produce(
+                    os.environ.get("KAFKA_TOPIC"),
+                    key=key,
+                    value=value,
+                    headers=headers[0] if headers else None,
+                    on_delivery=on_delivery,
+                )
 
     else:
         print(
@@ -57,39 +96,64 @@ def process_event(event, pubsub):
 if __name__ == "__main__":
     wait_time = 1
     attempt = 0
-    while True:
-        try:
-            pubsub = PubSub(argument_dict=argument_dict, auth=AccessToken)
-            pubsub.authenticate()
-
+    checkpoint_store = create_checkpoint_store_from_env()
+    token_cache = create_token_cache_from_env()
+    schema_exporter = create_schema_exporter_from_env(get_producer())
+    spill_log = create_spill_log_from_env()
+    spill_drainer = None
+    if spill_log is not None:
+        spill_drainer = SpillDrainer(spill_log, topic=os.environ.get("KAFKA_TOPIC"))
+        spill_drainer.start()
+    pubsub = None
+    try:
+        while True:
             try:
-                if len(sys.argv) > 1:
-                    replay_id = pubsub.read_replay_id(sys.argv[1])
-                else:
-                    replay_id = pubsub.read_replay_id()
-                replay_type = "CUSTOM"
-                # print(bytes.fromhex(replay_id))
-                # print(int(replay_id).to_bytes(10, "big"))
-
-            except FileNotFoundError:
-                replay_id = ""
-                replay_type = "LATEST"
-                print(replay_id)
-
-            pubsub.subscribe(
-                topic=pubsub.topic_name,
-                replay_type=replay_type,
-                replay_id=replay_id,
-                num_requested=10,
-                callback=process_event,
-            )
-            wait_time = 1
-            attempt = 0
-
-        except Exception as e:
-            print(f"Error encountered: {e}. Retrying in {wait_time} seconds...")
-            time.sleep(wait_time)
-            wait_time *= 2  # Exponential backoff
-            wait_time = min(wait_time, 30)  # Cap the wait time at 30 seconds
-            attempt += 1  # Increment the retry attempt
-            continue
+                pubsub = PubSub(
+                    argument_dict=argument_dict,
+                    auth=functools.partial(AccessToken, token_cache=token_cache),
+                )
+                pubsub.authenticate()
+                coordinator = CommitCoordinator(
+                    lambda replay_id: checkpoint_store.save(pubsub.topic_name, replay_id),
+                    max_pending=int(os.environ.get("MAX_IN_FLIGHT_BATCHES", 100)),
+                )
+
+                # falls back to a replay id file written by earlier versions of
+                # the listener
+                replay_type, replay_id = read_position(
+                    checkpoint_store,
+                    pubsub.topic_name,
+                    pubsub,
+                    sys.argv[1] if len(sys.argv) > 1 else None,
+                )
+
+                pubsub.subscribe(
+                    topic=pubsub.topic_name,
+                    replay_type=replay_type,
+                    replay_id=replay_id,
+                    num_requested=10,
+                    callback=process_event,
+                    flow_controller=FlowController(
+                        min_requested=int(os.environ.get("FETCH_MIN_REQUESTED", 10)),
+                        max_requested=int(os.environ.get("FETCH_MAX_REQUESTED", 100)),
+                        queue_depth=lambda: len(get_producer()),
+                    ),
+                )
+                wait_time = 1
+                attempt = 0
+
+            except Exception as e:
+                print(f"Error encountered: {e}. Retrying in {wait_time} seconds...")
+                discard_rejected_token(token_cache, pubsub, e)
+                time.sleep(wait_time)
+                wait_time *= 2  # Exponential backoff
+                wait_time = min(wait_time, 30)  # Cap the wait time at 30 seconds
+                attempt += 1  # Increment the retry attempt
+                continue
+    finally:
+        # write the latest replay id before exiting
+        checkpoint_store.close()
+        # records left in the spill log are forwarded after the next start
+        if spill_drainer is not None:
+            spill_drainer.stop()
+            spill_log.close()
@@ -5,37 +5,94 @@ This class provides the utility method to decode the bitmap fields (eg: changedF
 To understand the process of bitmap conversion, see "Event Deserialization Considerations" in the Pub/Sub API documentation at https://developer.salesforce.com/docs/platform/pub-sub-api/guide/event-deserialization-considerations.html.
 """
 
+from collections import OrderedDict
+
 from avro.schema import Schema
 from bitstring import BitArray
 
+BITMAP_FIELDS = ("changedFields", "nulledFields", "diffFields")
+
+
+class BitmapDecoder:
+    """
+    Decodes the bitmap fields of a ChangeEventHeader for one Avro schema.
+
+    The field name tables are computed once per schema: the top level field
+    names by position, and for every compound field (a record, eg: an Address)
+    the "parent.child" names of its nested fields, used for the
+    parentPos-childBitmap form. Bitmaps are decoded with integer bit operations.
+    """
+
+    def __init__(self, avro_schema: Schema):
+        self.field_names = [field.name for field in avro_schema.fields]
+        self.child_field_names = {}
+        for pos, field in enumerate(avro_schema.fields):
+            child_schema = get_value_schema(field.type)
+            if child_schema.type is not None and child_schema.type == 'record':
+                self.child_field_names[pos] = [
+                    field.name + "." + child.name for child in child_schema.fields
+                ]
+
+    def decode(self, bitmap_fields: list) -> list:
+        fields = []
+        for bitmap_field in bitmap_fields:
+            if bitmap_field is None:
+                continue
+            if bitmap_field.startswith("0x"):
+                fields.extend(names_from_bitmap(bitmap_field, self.field_names))
+            elif "-" in bitmap_field:
+                # interpret the parent field from mapping of parentFieldPos -> childFieldbitMap
+                parent_pos, child_bitmap = bitmap_field.split("-", 1)
+                child_names = self.child_field_names.get(int(parent_pos))
+                # make sure we're really dealing with compound field
+                if child_names:
+                    fields.extend(names_from_bitmap(child_bitmap, child_names))
+            else:
+                # already a field name
+                fields.append(bitmap_field)
+        return fields
+
+    def decode_header(self, change_event_header: dict) -> dict:
+        """Replaces changedFields, nulledFields and diffFields with field names, in place"""
+        for bitmap_name in BITMAP_FIELDS:
+            bitmap_fields = change_event_header.get(bitmap_name)
+            if bitmap_fields:
+                change_event_header[bitmap_name] = self.decode(bitmap_fields)
+        return change_event_header
+
+
+def names_from_bitmap(bitmap: str, field_names: list) -> list:
+    # bit n of the hex bitmap (least significant first) marks the field at position n
+    value = int(bitmap, 16)
+    names = []
+    while value:
+        lowest_bit = value & -value
+        pos = lowest_bit.bit_length() - 1
+        if pos < len(field_names):
+            names.append(field_names[pos])
+        value ^= lowest_bit
+    return names
+
+
+_decoders = OrderedDict()
+_MAX_DECODERS = 128
+
+
+def get_bitmap_decoder(avro_schema: Schema) -> BitmapDecoder:
+    # decoders are cached per schema object, keeping a reference to the schema
+    # so that its id is not reused while it's in the cache
+    key = id(avro_schema)
+    cached = _decoders.get(key)
+    if cached is None or cached[0] is not avro_schema:
+        cached = (avro_schema, BitmapDecoder(avro_schema))
+        _decoders[key] = cached
+        if len(_decoders) > _MAX_DECODERS:
+            _decoders.popitem(last=False)
+    return cached[1]
+
 
 def process_bitmap(avro_schema: Schema, bitmap_fields: list):
-    fields =  []
-    if len(bitmap_fields) != 0:
-        # replace top field level bitmap with list of fields
-        if bitmap_fields[0].startswith("0x"):
-            bitmap = bitmap_fields[0]
-            fields = fields + get_fieldnames_from_bitstring(bitmap, avro_schema)
-            bitmap_fields.remove(bitmap)
-        # replace parentPos-nested Nulled BitMap with list of fields too
-        if len(bitmap_fields) != 0 and "-" in str(bitmap_fields[-1]):
-            for bitmap_field in bitmap_fields:
-                if bitmap_field is not None and "-" in str(bitmap_field):
-                    bitmap_strings = bitmap_field.split("-")
-                    # interpret the parent field name from mapping of parentFieldPos -> childFieldbitMap
-                    parent_field = avro_schema.fields[int(bitmap_strings[0])]
-                    child_schema = get_value_schema(parent_field.type)
-                    # make sure we're really dealing with compound field
-                    if child_schema.type is not None and child_schema.type == 'record':
-                        nested_size = len(child_schema.fields)
-                        parent_field_name = parent_field.name
-                        # interpret the child field names from mapping of parentFieldPos -> childFieldbitMap
-                        full_field_names = get_fieldnames_from_bitstring(bitmap_strings[1], child_schema)
-                        full_field_names = append_parent_name(parent_field_name, full_field_names)
-                        if len(full_field_names) > 0:
-                            # when all nested fields under a compound got nulled out at once by customer, we recognize the top level field instead of trying to list every single nested field
-                            fields = fields + full_field_names
-    return fields
+    return get_bitmap_decoder(avro_schema).decode(bitmap_fields)
 
 
 def convert_hexbinary_to_bitset(bitmap):
@@ -51,13 +108,7 @@ def append_parent_name(parent_field_name, full_field_names):
 
 
 def get_fieldnames_from_bitstring(bitmap, avro_schema: Schema):
-    bitmap_field_name = []
-    fields_list = list(avro_schema.fields)
-    binary_string = convert_hexbinary_to_bitset(bitmap)
-    indexes = find('1', binary_string)
-    for index in indexes:
-        bitmap_field_name.append(fields_list[index].name)
-    return bitmap_field_name
+    return names_from_bitmap(bitmap, get_bitmap_decoder(avro_schema).field_names)
 
 
 # Get the value type of an "optional" schema, which is a union of [null, valueSchema]
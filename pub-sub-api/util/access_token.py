@@ -1,5 +1,9 @@
+import time
+
 import requests
 
+from util.token_cache import TokenCache
+
 
 class AccessToken:
     def __init__(
@@ -7,14 +11,43 @@ class AccessToken:
         domain: str,
         payload: dict,
         access_token: dict = None,
+        token_cache: TokenCache = None,
+        session_lifetime: float = 7200.0,
+        min_ttl: float = 300.0,
     ):
         self.domain = domain
         self.payload = payload
         self.access_token = access_token
+        # tokens are shared with the other processes through the cache, and
+        # reused while they are valid for at least min_ttl more seconds
+        self.token_cache = token_cache
+        self.session_lifetime = session_lifetime
+        self.min_ttl = min_ttl
+
+    @property
+    def cache_key(self) -> str:
+        return TokenCache.key(
+            self.payload.get("client_id"), self.payload.get("username"), self.domain
+        )
 
     def generate_access_token(
         self,
     ) -> dict:
+        if self.token_cache is None:
+            return self._request_access_token()
+
+        # only one process requests a token, the others wait and reuse it
+        with self.token_cache.locked():
+            token = self.token_cache.get(self.cache_key, self.min_ttl)
+            if token is None:
+                token = self._request_access_token()
+                self.token_cache.put(
+                    self.cache_key, token, time.time() + self.session_lifetime
+                )
+        self.access_token = token["access_token"]
+        return token
+
+    def _request_access_token(self) -> dict:
         response = requests.post(
             f"{self.domain}/services/oauth2/token", data=self.payload
         )
@@ -0,0 +1,158 @@
+"""
+async_pubsub.py
+
+This file defines the class `AsyncPubSub`, an asyncio variant of `PubSub`
+built on `grpc.aio`.
+"""
+
+import asyncio
+import time
+from contextlib import suppress
+from typing import Awaitable, Callable
+
+import grpc
+
+import util.pubsub_api_pb2 as pb2
+from util.flow_control import FlowController
+from util.pubsub_class import PubSub, secure_channel_credentials
+from util.schema_cache import CachedSchema
+
+
+class AsyncPubSub(PubSub):
+    """
+    asyncio variant of the `PubSub` class.
+
+    The RPCs are made over a `grpc.aio` channel, so several subscriptions,
+    the decoding of events, the Kafka writes and the replay id checkpointing
+    can all run concurrently on one event loop. Authentication, the schema
+    cache, the decoding helpers and the replay id storage are shared with
+    `PubSub`. `get_topic()` and `publish()` return awaitable calls.
+
+    The `subscribe()` method sends the FetchRequests from an async iterator:
+    without a `FlowController` a new FetchRequest is sent once all requested
+    events are delivered, so the callback does not need to release anything.
+    Cancelling the task running `subscribe()` cancels the Subscribe RPC.
+
+    The instance has to be created while the event loop is running.
+    """
+
+    def create_channel(self):
+        return grpc.aio.secure_channel(self.pubsub_url, secure_channel_credentials)
+
+    async def authenticate(self, grant_type: str = "client_credentials"):
+        """
+        Runs `PubSub.authenticate()` in a worker thread, since the token
+        request is made with the blocking `requests` library.
+        """
+        await asyncio.to_thread(super().authenticate, grant_type)
+
+    async def get_schema(self, schema_id) -> CachedSchema:
+        cached = self.schema_cache.get(schema_id)
+        if cached is None:
+            res = await self.stub.GetSchema(
+                pb2.SchemaRequest(schema_id=schema_id), metadata=self.metadata
+            )
+            cached = self.schema_cache.put(schema_id, res.schema_json)
+        return cached
+
+    async def get_schema_json(self, schema_id):
+        return (await self.get_schema(schema_id)).schema_json
+
+    async def read_event(self, event, bitmap_process=None):
+        return self.decode_event(await self.get_schema(event.event.schema_id), event)
+
+    async def read_events(self, fetch_response) -> list:
+        return [
+            self.decode_event(await self.get_schema(event.event.schema_id), event)
+            for event in fetch_response.events
+        ]
+
+    async def fetch_req_stream(
+        self,
+        topic: str,
+        replay_type: str,
+        replay_id: str,
+        num_requested: int,
+        need_request: asyncio.Event,
+        flow_controller: FlowController = None,
+    ):
+        """
+        Returns an async FetchRequest stream for the Subscribe RPC. A
+        FetchRequest is considered every time `need_request` is set.
+        """
+        while True:
+            if flow_controller is None:
+                await need_request.wait()
+                need_request.clear()
+                next_num_requested = num_requested
+            else:
+                # the downstream queue depth changes without notifying us,
+                # so check again after `poll_interval`
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(
+                        need_request.wait(), flow_controller.poll_interval
+                    )
+                need_request.clear()
+                next_num_requested = flow_controller.reserve_request()
+                if next_num_requested == 0:
+                    continue
+
+            print(f"Sending Fetch Request for {next_num_requested} events")
+            yield self.make_fetch_request(
+                topic=topic,
+                replay_type=replay_type,
+                replay_id=replay_id,
+                num_requested=next_num_requested,
+            )
+
+    async def subscribe(
+        self,
+        topic: str,
+        replay_type: str,
+        replay_id: str,
+        num_requested: int,
+        callback: Callable[..., Awaitable],
+        flow_controller: FlowController = None,
+    ):
+        """
+        Calls the Subscribe RPC and awaits the client-defined coroutine
+        `callback(event, pubsub)` for every FetchResponse. The state of the
+        FetchRequest stream is local to the call, so `subscribe()` can be
+        awaited concurrently for several topics.
+        """
+        need_request = asyncio.Event()
+        need_request.set()
+        if flow_controller is not None:
+            # a new stream starts without any credits
+            flow_controller.reset()
+        call = self.stub.Subscribe(
+            self.fetch_req_stream(
+                topic,
+                replay_type,
+                replay_id,
+                num_requested,
+                need_request,
+                flow_controller,
+            ),
+            metadata=self.metadata,
+        )
+        print("> Subscribed to", topic)
+        try:
+            async for event in call:
+                start = time.monotonic()
+                await callback(event, self)
+                if flow_controller is not None:
+                    flow_controller.on_response(
+                        received=len(event.events),
+                        pending_num_requested=event.pending_num_requested,
+                        processing_time=time.monotonic() - start,
+                    )
+                    need_request.set()
+                elif event.pending_num_requested == 0:
+                    need_request.set()
+        finally:
+            # also runs on cancellation, so the RPC never outlives the task
+            call.cancel()
+
+    async def close(self):
+        await self.channel.close()
@@ -0,0 +1,339 @@
+"""
+checkpoint.py
+
+This file defines the replay ID checkpoint stores used by the listeners to
+resume their subscriptions. `CheckpointStore` coalesces the writes and the
+backends persist them: `FileCheckpointStore`, `SQLiteCheckpointStore` and
+`KafkaCheckpointStore`.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+
+class CheckpointStore(ABC):
+    """
+    Stores the latest replay ID of every topic.
+
+    `save()` only records the replay ID in memory; the recorded positions are
+    written to the backend by a timer thread once `flush_every` replay IDs
+    were saved, or at most `flush_interval` seconds after the first unwritten
+    one, and when `flush()` or `close()` is called. A crash therefore loses at
+    most that window, which is replayed again on restart, instead of costing
+    one synchronous write per FetchResponse, and `save()` never waits for the
+    backend, so it can be called from an event loop.
+    """
+
+    def __init__(self, flush_every: int = 100, flush_interval: float = 1.0):
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, bytes] = {}
+        # the replay IDs being written by a flush
+        self._flushing: Dict[str, bytes] = {}
+        self._pending_count = 0
+        self._timer = None
+        self._lock = threading.RLock()
+        # held while writing to the backend, so flushes happen one at a time
+        self._write_lock = threading.Lock()
+
+    def load(self, topic: str) -> Optional[bytes]:
+        """
+        Returns the latest replay ID saved for `topic`, or None.
+        """
+        with self._lock:
+            if topic in self._pending:
+                return self._pending[topic]
+            if topic in self._flushing:
+                return self._flushing[topic]
+            return self._read(topic)
+
+    def save(self, topic: str, replay_id: bytes):
+        """
+        Records `replay_id` as the latest position of `topic`.
+        """
+        if not replay_id:
+            return
+        with self._lock:
+            self._pending[topic] = replay_id
+            self._pending_count += 1
+            if self._pending_count == self.flush_every:
+                self._start_timer(0)
+            elif self._timer is None and self.flush_interval:
+                self._start_timer(self.flush_interval)
+
+    def _start_timer(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        """
+        Writes the pending replay IDs to the backend.
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                if not self._pending:
+                    return
+                self._flushing = dict(self._pending)
+                self._pending.clear()
+                self._pending_count = 0
+            try:
+                self._write(self._flushing)
+            except Exception:
+                # written again by the next flush, unless a newer one was saved
+                with self._lock:
+                    for topic, replay_id in self._flushing.items():
+                        self._pending.setdefault(topic, replay_id)
+                raise
+            finally:
+                with self._lock:
+                    self._flushing = {}
+
+    def close(self):
+        self.flush()
+
+    @abstractmethod
+    def _read(self, topic: str) -> Optional[bytes]:
+        """
+        Reads the replay ID of `topic` from the backend.
+        """
+
+    @abstractmethod
+    def _write(self, checkpoints: Dict[str, bytes]):
+        """
+        Durably writes the replay IDs of the given topics to the backend.
+        """
+
+
+class FileCheckpointStore(CheckpointStore):
+    """
+    Keeps the replay IDs of all topics, as hexadecimal strings, in one JSON
+    file. The file is replaced atomically: the new content is written and
+    fsynced to a temporary file which is then renamed over the old one.
+    """
+
+    def __init__(self, path: str = "replay_checkpoints.json", **kwargs):
+        super().__init__(**kwargs)
+        self.path = os.path.abspath(path)
+        self._checkpoints = self._read_file()
+
+    def _read_file(self) -> Dict[str, str]:
+        try:
+            with open(self.path, "r") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+
+    def _read(self, topic: str) -> Optional[bytes]:
+        replay_id = self._checkpoints.get(topic)
+        return bytes.fromhex(replay_id) if replay_id else None
+
+    def _write(self, checkpoints: Dict[str, bytes]):
+        for topic, replay_id in checkpoints.items():
+            self._checkpoints[topic] = replay_id.hex()
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(self._checkpoints, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+
+        # make the rename itself durable
+        dir_fd = os.open(os.path.dirname(self.path), os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    """
+    Keeps the replay IDs in a SQLite database (WAL journal), one row per
+    topic. Every flush is a single transaction.
+    """
+
+    def __init__(self, path: str = "replay_checkpoints.db", **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "topic TEXT PRIMARY KEY, replay_id BLOB NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def _read(self, topic: str) -> Optional[bytes]:
+        row = self._connection.execute(
+            "SELECT replay_id FROM checkpoints WHERE topic = ?", (topic,)
+        ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def _write(self, checkpoints: Dict[str, bytes]):
+        now = time.time()
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO checkpoints (topic, replay_id, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(topic) DO UPDATE SET "
+                "replay_id = excluded.replay_id, updated_at = excluded.updated_at",
+                [(topic, replay_id, now) for topic, replay_id in checkpoints.items()],
+            )
+
+    def close(self):
+        super().close()
+        self._connection.close()
+
+
+class KafkaCheckpointStore(CheckpointStore):
+    """
+    Keeps the replay IDs in a compacted Kafka topic, keyed by the name of the
+    Salesforce topic. The latest value of every key is read once when the
+    store is created, for at most `read_timeout` seconds; every flush
+    produces the pending replay IDs and waits for their delivery.
+    """
+
+    def __init__(self, config: dict, checkpoint_topic: str, read_timeout: float = 60.0, **kwargs):
+        super().__init__(**kwargs)
+        from confluent_kafka import Producer
+
+        self.config = config
+        self.checkpoint_topic = checkpoint_topic
+        self.read_timeout = read_timeout
+        self._producer = Producer(config)
+        self._checkpoints = self._read_topic()
+
+    def _read_topic(self) -> Dict[str, bytes]:
+        from confluent_kafka import Consumer, TopicPartition
+
+        consumer = Consumer(
+            {
+                **self.config,
+                "group.id": f"{self.checkpoint_topic}-reader",
+                "enable.auto.commit": False,
+            }
+        )
+        checkpoints = {}
+        try:
+            metadata = consumer.list_topics(self.checkpoint_topic, timeout=10)
+            partitions = metadata.topics[self.checkpoint_topic].partitions
+            end_offsets = {}
+            assignment = []
+            for partition in partitions:
+                low, high = consumer.get_watermark_offsets(
+                    TopicPartition(self.checkpoint_topic, partition), timeout=10
+                )
+                if high > low:
+                    end_offsets[partition] = high
+                    assignment.append(TopicPartition(self.checkpoint_topic, partition, low))
+            consumer.assign(assignment)
+
+            # read every partition up to its end offset at startup
+            deadline = time.monotonic() + self.read_timeout
+            while end_offsets:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(
+                        f"Timed out reading the replay id checkpoints of {self.checkpoint_topic}, "
+                        f"partitions {sorted(end_offsets)} weren't read to their end"
+                    )
+                msg = consumer.poll(1.0)
+                if msg is None or msg.error() is not None:
+                    # the last offsets may hold no message, eg: transaction
+                    # markers or compacted records, so compare the positions
+                    for position in consumer.position(
+                        [TopicPartition(self.checkpoint_topic, p) for p in end_offsets]
+                    ):
+                        if position.offset >= end_offsets[position.partition]:
+                            end_offsets.pop(position.partition)
+                    continue
+                if msg.value() is not None:
+                    checkpoints[msg.key().decode("utf-8")] = msg.value()
+                if msg.offset() + 1 >= end_offsets.get(msg.partition(), 0):
+                    end_offsets.pop(msg.partition(), None)
+        finally:
+            consumer.close()
+        return checkpoints
+
+    def _read(self, topic: str) -> Optional[bytes]:
+        return self._checkpoints.get(topic)
+
+    def _write(self, checkpoints: Dict[str, bytes]):
+        for topic, replay_id in checkpoints.items():
+            self._producer.produce(self.checkpoint_topic, key=topic, value=replay_id)
+        remaining = self._producer.flush(30)
+        if remaining:
+            raise RuntimeError(f"{remaining} replay id checkpoints were not delivered")
+        self._checkpoints.update(checkpoints)
+
+
+def create_checkpoint_store_from_env() -> CheckpointStore:
+    """
+    Creates the checkpoint store configured with the CHECKPOINT_* environment
+    variables (backend: file, sqlite or kafka).
+    """
+    backend = os.getenv("CHECKPOINT_BACKEND", "file")
+    kwargs = {
+        "flush_every": int(os.getenv("CHECKPOINT_FLUSH_EVERY", 100)),
+        "flush_interval": int(os.getenv("CHECKPOINT_FLUSH_INTERVAL_MS", 1000)) / 1000,
+    }
+    if backend == "file":
+        return FileCheckpointStore(
+            os.getenv("CHECKPOINT_PATH", "replay_checkpoints.json"), **kwargs
+        )
+    if backend == "sqlite":
+        return SQLiteCheckpointStore(
+            os.getenv("CHECKPOINT_PATH", "replay_checkpoints.db"), **kwargs
+        )
+    if backend == "kafka":
+        from util.kafka_produce import create_config_from_env
+
+        return KafkaCheckpointStore(
+            create_config_from_env(),
+            os.getenv("CHECKPOINT_TOPIC", "salesforce_replay_checkpoints"),
+            **kwargs,
+        )
+    raise ValueError(f"Invalid checkpoint backend {backend}. Choose 'file', 'sqlite' or 'kafka'")
+
+
+def replay_position(replay_id: Optional[bytes]) -> Tuple[str, str]:
+    """
+    Returns the replay type and the replay ID (as a decimal string, like
+    `PubSub.read_replay_id()`) to subscribe from a stored checkpoint.
+    """
+    if not replay_id:
+        return "LATEST", ""
+    return "CUSTOM", str(int.from_bytes(replay_id, "big"))
+
+
+def read_position(
+    checkpoint_store: CheckpointStore, topic: str, pubsub=None, replay_id_file: str = None
+) -> Tuple[str, str]:
+    """
+    Returns the replay type and the replay ID to subscribe to `topic` from.
+
+    Without a checkpoint for the topic, and if `pubsub` is given, the replay
+    ID file written by earlier versions of the listeners is read instead
+    (`replay_id_file`, or `PubSub.read_replay_id()`'s default path).
+    """
+    replay_type, replay_id = replay_position(checkpoint_store.load(topic))
+    if replay_type == "LATEST" and pubsub is not None:
+        try:
+            if replay_id_file:
+                replay_id = pubsub.read_replay_id(replay_id_file)
+            else:
+                replay_id = pubsub.read_replay_id()
+            replay_type = "CUSTOM"
+        except FileNotFoundError:
+            pass
+    return replay_type, replay_id
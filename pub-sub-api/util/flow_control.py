@@ -0,0 +1,158 @@
+"""
+flow_control.py
+
+This file defines the class `FlowController`, which decides how many events
+to ask for in the FetchRequests of a Pub/Sub API subscription.
+"""
+
+import threading
+from typing import Callable
+
+
+class FlowController(object):
+    """
+    Adaptive credit controller for the Subscribe RPC.
+
+    Every FetchRequest grants the server credits (`num_requested`) to send
+    events, and every event received uses one of them up. Instead of waiting for the credits
+    to hit zero before asking for a fixed number of events, the controller:
+
+    - keeps enough credits outstanding to cover `target_latency` seconds of
+      work at the processing rate observed in the callback,
+    - tops the credits up as soon as they drop below `low_watermark` of that
+      target, so the stream never idles between batches,
+    - shrinks the target as the downstream queue (eg: the Kafka producer's
+      local queue, via `queue_depth`) fills up, and stops requesting events
+      altogether once it reaches `max_queue_depth`.
+
+    The number of credits outstanding is always kept between `min_requested`
+    and `max_requested`, unless the downstream queue is full.
+    """
+
+    def __init__(
+        self,
+        min_requested: int = 10,
+        max_requested: int = 100,
+        target_latency: float = 1.0,
+        low_watermark: float = 0.5,
+        queue_depth: Callable[[], int] = None,
+        max_queue_depth: int = 10000,
+        smoothing: float = 0.3,
+        poll_interval: float = 0.5,
+    ):
+        if not 0 < min_requested <= max_requested:
+            raise ValueError("Expected 0 < min_requested <= max_requested")
+        self.min_requested = min_requested
+        self.max_requested = max_requested
+        self.target_latency = target_latency
+        self.low_watermark = low_watermark
+        self.queue_depth = queue_depth
+        self.max_queue_depth = max_queue_depth
+        self.smoothing = smoothing
+        self.poll_interval = poll_interval
+        # credits granted to the server that were not used up yet
+        self.outstanding = 0
+        # smoothed number of events processed per second
+        self.rate = None
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def target(self) -> int:
+        """
+        Returns the number of credits that should be outstanding right now.
+        """
+        if self.rate is None:
+            target = self.min_requested
+        else:
+            target = int(self.rate * self.target_latency)
+
+        # back off while the downstream queue fills up
+        if self.queue_depth is not None and self.max_queue_depth:
+            fill = self.queue_depth() / self.max_queue_depth
+            if fill >= 1:
+                return 0
+            target = int(target * (1 - fill))
+
+        return max(self.min_requested, min(target, self.max_requested))
+
+    def request_size(self) -> int:
+        """
+        Returns the number of events the next FetchRequest should ask for, or
+        0 if enough credits are still outstanding.
+        """
+        with self._condition:
+            return self._request_size()
+
+    def _request_size(self) -> int:
+        target = self.target()
+        if target == 0 or self.outstanding > target * self.low_watermark:
+            return 0
+        return max(target - self.outstanding, 0)
+
+    def wait_for_request(self) -> int:
+        """
+        Blocks until a top-up is needed, records the credits as outstanding
+        and returns the number of events to request. Returns 0 once the
+        controller is closed.
+        """
+        with self._condition:
+            while not self._closed:
+                num_requested = self._reserve_request()
+                if num_requested > 0:
+                    return num_requested
+                # the downstream queue depth changes without notifying us,
+                # so check again after `poll_interval`
+                self._condition.wait(self.poll_interval)
+            return 0
+
+    def reserve_request(self) -> int:
+        """
+        Non-blocking variant of `wait_for_request()`: returns 0 right away if
+        no top-up is needed.
+        """
+        with self._condition:
+            return self._reserve_request()
+
+    def _reserve_request(self) -> int:
+        num_requested = self._request_size()
+        self.outstanding += num_requested
+        return num_requested
+
+    def on_response(
+        self, received: int, pending_num_requested: int, processing_time: float
+    ):
+        """
+        Records a FetchResponse: the number of events it contained, the
+        credits the server reports as still outstanding, and the time the
+        callback took to process the events.
+
+        `pending_num_requested` is not used to replace the local count: it's
+        out of date as soon as a top-up FetchRequest was sent after the
+        response was produced, so the credits are only ever lowered by the
+        events received.
+        """
+        with self._condition:
+            self.outstanding = max(self.outstanding - received, 0)
+            if received and processing_time > 0:
+                rate = received / processing_time
+                if self.rate is None:
+                    self.rate = rate
+                else:
+                    self.rate = self.smoothing * rate + (1 - self.smoothing) * self.rate
+            self._condition.notify_all()
+
+    def reset(self):
+        """
+        Forgets the outstanding credits, eg: when the stream is resubscribed.
+        """
+        with self._condition:
+            self.outstanding = 0
+            self._closed = False
+
+    def close(self):
+        """
+        Wakes up and stops the FetchRequest stream.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
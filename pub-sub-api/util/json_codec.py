@@ -0,0 +1,55 @@
+"""
+json_codec.py
+
+This file defines the JSON helpers used to encode the decoded events before
+they are sent to Kafka. orjson is used when it is installed, otherwise the
+helpers fall back to the standard library `json` module. The output is
+compact, without indentation.
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+_stdlib_dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def json_dumps_bytes(obj: Any) -> bytes:
+    """
+    Serializes `obj` to UTF-8 encoded JSON.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # orjson rejects non string keys and integers wider than 64 bits
+            pass
+    return _stdlib_dumps(obj).encode("utf-8")
+
+
+def json_dumps(obj: Any) -> str:
+    """
+    Serializes `obj` to a JSON formatted string.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except TypeError:
+            pass
+    return _stdlib_dumps(obj)
+
+
+def json_loads(data: Union[str, bytes]) -> Any:
+    """
+    Deserializes a JSON document given as a string or as UTF-8 encoded bytes.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
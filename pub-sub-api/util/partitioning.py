@@ -0,0 +1,51 @@
+"""
+partitioning.py
+
+This file defines how the events are keyed in Kafka. The keys combine the
+entity name and the record id of the change events, so the changes of a
+record keep their order on a single partition.
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "record" keys the events by entity name and record id, "entity" by entity
+# name only, and "none" leaves the partition to the producer
+KEY_STRATEGY = os.getenv("KAFKA_KEY_STRATEGY", "record")
+# an event changing many records is produced once per record, so each copy
+# lands on the partition of its record
+FAN_OUT_RECORDS = os.getenv("KAFKA_FAN_OUT_RECORDS", "true").lower() == "true"
+
+
+def record_keys(payload: dict, default=None, strategy: str = None, fan_out: bool = None):
+    """
+    Returns the Kafka keys of a change event payload, one per produced copy.
+
+    Keys combine the entity name and the record id (eg: "Account:001..."),
+    so every change of a record goes to the same partition and stays in
+    order, while different records spread over all the partitions. Events
+    without a ChangeEventHeader (eg: platform events) are keyed by `default`.
+    """
+    strategy = strategy or KEY_STRATEGY
+    fan_out = FAN_OUT_RECORDS if fan_out is None else fan_out
+    header = payload.get("ChangeEventHeader") or {}
+    entity = header.get("entityName")
+    record_ids = header.get("recordIds") or []
+
+    if strategy == "none":
+        return [None]
+    if strategy == "entity" and entity:
+        return [entity]
+    if strategy == "record" and record_ids:
+        if not fan_out:
+            record_ids = record_ids[:1]
+        return [f"{entity}:{record_id}" if entity else record_id for record_id in record_ids]
+    return [default]
+
+
+def keyed_messages(payload: dict, value: bytes, default=None):
+    # the (key, value) pairs to produce for one event
+    return [(key, value) for key in record_keys(payload, default)]
@@ -0,0 +1,157 @@
+"""
+passthrough.py
+
+This file defines the Avro pass-through mode of the listeners. Instead of
+decoding every event and producing it as JSON, the Avro payload received
+from the Pub/Sub API is produced to Kafka unchanged, and the fields needed to
+route and filter it (schema ID, replay ID and the ChangeEventHeader fields)
+travel in the Kafka headers. Consumers fetch the writer schema by its ID from
+the schema export (a compacted topic and/or the schema cache directory) and
+decode the payloads only when they need them.
+"""
+
+import asyncio
+import os
+import threading
+
+from util.partitioning import record_keys
+from util.schema_cache import CachedSchema
+
+# "json" produces the decoded events, "avro" the payloads as they are received
+PAYLOAD_FORMAT = os.environ.get("KAFKA_PAYLOAD_FORMAT", "json").lower()
+
+CONTENT_TYPE = "avro/binary"
+
+# ChangeEventHeader fields copied to the Kafka headers, lists are joined with commas
+HEADER_FIELDS = {
+    "entityName": "entity_name",
+    "changeType": "change_type",
+    "commitTimestamp": "commit_timestamp",
+    "transactionKey": "transaction_key",
+    "recordIds": "record_ids",
+    "changedFields": "changed_fields",
+}
+
+
+def kafka_headers(schema: CachedSchema, consumer_event, topic: str, change_event_header: dict = None) -> list:
+    """
+    Returns the Kafka headers of a ConsumerEvent produced in pass-through mode.
+    """
+    headers = [
+        ("content-type", CONTENT_TYPE),
+        ("schema_id", schema.schema_id),
+        ("replay_id", consumer_event.replay_id.hex()),
+        ("event_id", consumer_event.event.id),
+        ("sf_topic", topic),
+    ]
+    for field, name in HEADER_FIELDS.items():
+        value = (change_event_header or {}).get(field)
+        if value is None:
+            continue
+        if isinstance(value, list):
+            value = ",".join(value)
+        headers.append((name, str(value)))
+    return headers
+
+
+def passthrough_messages(schema: CachedSchema, consumer_event, topic: str) -> list:
+    """
+    Returns the (key, value, headers) messages of a ConsumerEvent, with its
+    Avro payload as the value. Only the ChangeEventHeader is decoded, to key
+    the messages by record like the JSON mode does.
+    """
+    payload = consumer_event.event.payload
+    change_event_header = schema.decode_header(payload)
+    headers = kafka_headers(schema, consumer_event, topic, change_event_header)
+    keys = record_keys({"ChangeEventHeader": change_event_header or {}})
+    return [(key, payload, headers) for key in keys]
+
+
+class SchemaExporter(object):
+    """
+    Publishes every schema used by the produced events once per process, to
+    the compacted Kafka topic `topic` keyed by schema ID, so that consumers of
+    the pass-through messages can decode them. Schemas are also written to
+    `<cache_dir>/<schema_id>.avsc` by the `SchemaCache` when `SCHEMA_CACHE_DIR`
+    is set.
+
+    `export()` is for threads and returns once the schema is queued, while
+    `export_async()` returns once Kafka acknowledged it, so the events using
+    a new schema are only produced after it.
+    """
+
+    def __init__(self, producer, topic: str = None):
+        self.producer = producer
+        self.topic = topic
+        self._exported = set()
+        # schemas produced and waiting for their delivery report
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        # delivery futures of the schemas exported by `export_async()`
+        self._deliveries = {}
+
+    def export(self, schema: CachedSchema):
+        if self.topic is None:
+            return
+        with self._lock:
+            if schema.schema_id in self._exported or schema.schema_id in self._in_flight:
+                return
+            self._in_flight.add(schema.schema_id)
+
+        def on_delivery(err, msg):
+            # a schema is only exported once Kafka acknowledged it, a failed
+            # one is produced again with the next event using it
+            with self._lock:
+                self._in_flight.discard(schema.schema_id)
+                if err is None:
+                    self._exported.add(schema.schema_id)
+            if err is not None:
+                print(f"Failed to export schema {schema.schema_id}: {err}")
+
+        try:
+            self.producer.produce(
+                self.topic,
+                key=schema.schema_id,
+                value=schema.schema_json,
+                headers=[("content-type", "application/vnd.apache.avro+json")],
+                on_delivery=on_delivery,
+            )
+        except Exception:
+            with self._lock:
+                self._in_flight.discard(schema.schema_id)
+            raise
+
+
+    async def export_async(self, schema: CachedSchema, producer):
+        """
+        Exports the schema with the `AsyncProducer` `producer`, and waits for
+        Kafka to acknowledge it. Raises the delivery error if it failed, the
+        schema is then produced again by the next call.
+        """
+        if self.topic is None or schema.schema_id in self._exported:
+            return
+        delivery = self._deliveries.get(schema.schema_id)
+        if delivery is None:
+            delivery = asyncio.ensure_future(
+                producer.produce(
+                    self.topic,
+                    schema.schema_id,
+                    schema.schema_json,
+                    headers=[("content-type", "application/vnd.apache.avro+json")],
+                )
+            )
+            # callers exporting the same schema meanwhile wait for this delivery
+            self._deliveries[schema.schema_id] = delivery
+        try:
+            await asyncio.shield(delivery)
+        finally:
+            if delivery.done() and self._deliveries.get(schema.schema_id) is delivery:
+                del self._deliveries[schema.schema_id]
+                if not delivery.cancelled() and delivery.exception() is None:
+                    with self._lock:
+                        self._exported.add(schema.schema_id)
+
+
+def create_schema_exporter_from_env(producer) -> SchemaExporter:
+    # without SCHEMA_EXPORT_TOPIC the schemas are only exported to the schema cache directory
+    return SchemaExporter(producer, os.environ.get("SCHEMA_EXPORT_TOPIC"))
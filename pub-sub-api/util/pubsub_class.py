@@ -7,6 +7,7 @@ both publisher and subscriber clients.
 
 import io
 import threading
+import time
 from datetime import datetime
 import json
 from typing import Callable
@@ -20,6 +21,8 @@ import util.pubsub_api_pb2 as pb2
 import util.pubsub_api_pb2_grpc as pb2_grpc
 
 from util.access_token import AccessToken
+from util.flow_control import FlowController
+from util.schema_cache import CachedSchema, SchemaCache
 
 with open(certifi.where(), "rb") as f:
     secure_channel_credentials = grpc.ssl_channel_credentials(f.read())
@@ -50,12 +53,14 @@ class PubSub(object):
     does not need this).
 
     The `fetch_req_stream()` method returns a FetchRequest stream for the
-    Subscribe RPC.
+    Subscribe RPC. When `subscribe()` is given a `FlowController`, the
+    requests are sized and sent by the controller instead of the semaphore.
 
     The `make_fetch_request()` method creates a FetchRequest per the proto file.
 
-    The `get_schema_json()` method uses the GetSchema RPC to retrieve a schema
-    given a schema ID.
+    The `get_schema()` method returns the parsed schema for a schema ID from
+    the schema cache, calling the GetSchema RPC only on a cache miss. The
+    `get_schema_json()` method returns the JSON of that schema.
 
     The `generate_producer_events()` method encodes the data to be sent in the
     event and creates a ProducerEvent per the proto file.
@@ -84,11 +89,11 @@ class PubSub(object):
     - grpcPort: The port of the gRPC server
     - topic: The name of the topic to subscribe to
     - apiVersion: The version of the Salesforce API to use
+    - schema_cache_size: The maximum number of schemas kept in memory
+    - schema_cache_dir: Directory to persist fetched schemas in (optional)
 
     """
 
-    json_schema_dict = {}
-
     def __init__(self, argument_dict: dict, auth: AccessToken):
         self.url = argument_dict.get("url", "https://login.salesforce.com")
         self.username = argument_dict.get("username")
@@ -101,7 +106,7 @@ class PubSub(object):
         grpc_host = argument_dict.get("grpcHost", "api.pubsub.salesforce.com")
         grpc_port = argument_dict.get("grpcPort", "7443")
         self.pubsub_url = grpc_host + ":" + grpc_port
-        self.channel = grpc.secure_channel(self.pubsub_url, secure_channel_credentials)
+        self.channel = self.create_channel()
         self.stub = pb2_grpc.PubSubStub(self.channel)
         self.access_token = None
         self.tenant_id = None
@@ -109,6 +114,10 @@ class PubSub(object):
         self.topic_name = argument_dict.get("topic_name", "/data/ChangeEvents")
         self.apiVersion = argument_dict.get("apiVersion", "60.0")
         self.auth = auth
+        self.schema_cache = SchemaCache(
+            max_size=int(argument_dict.get("schema_cache_size") or 128),
+            cache_dir=argument_dict.get("schema_cache_dir"),
+        )
         """
         Semaphore used for subscriptions. This keeps the subscription stream open
         to receive events and to notify when to send the next FetchRequest.
@@ -116,6 +125,13 @@ class PubSub(object):
         https://developer.salesforce.com/docs/platform/pub-sub-api/guide/qs-python-quick-start.html
         """
         self.semaphore = threading.Semaphore(1)
+        self.flow_controller = None
+
+    def create_channel(self):
+        """
+        Opens the gRPC channel used by the stub.
+        """
+        return grpc.secure_channel(self.pubsub_url, secure_channel_credentials)
 
     def authenticate(self, grant_type: str = "client_credentials"):
         """
@@ -203,6 +219,20 @@ class PubSub(object):
         """
         Returns a FetchRequest stream for the Subscribe RPC.
         """
+        if self.flow_controller is not None:
+            # the flow controller decides when to top up and by how much
+            while True:
+                num_requested = self.flow_controller.wait_for_request()
+                if num_requested == 0:
+                    return
+                print(f"Sending Fetch Request for {num_requested} events")
+                yield self.make_fetch_request(
+                    topic=topic,
+                    replay_type=replay_type,
+                    replay_id=replay_id,
+                    num_requested=num_requested,
+                )
+
         while True:
             # Only send FetchRequest when needed. Semaphore release indicates need for new FetchRequest
             self.semaphore.acquire()
@@ -259,21 +289,24 @@ class PubSub(object):
             pb2.TopicRequest(topic_name=topic_name), metadata=self.metadata
         )
 
-    def get_schema_json(self, schema_id):
+    def get_schema(self, schema_id) -> CachedSchema:
         """
-        Uses GetSchema RPC to retrieve schema given a schema ID.
+        Returns the parsed schema for a schema ID, using the GetSchema RPC
+        only if the schema is not in the schema cache yet.
         """
-        # If the schema is not found in the dictionary, get the schema and store it in the dictionary
-        if (
-            schema_id not in self.json_schema_dict
-            or self.json_schema_dict[schema_id] is None
-        ):
+        cached = self.schema_cache.get(schema_id)
+        if cached is None:
             res = self.stub.GetSchema(
                 pb2.SchemaRequest(schema_id=schema_id), metadata=self.metadata
             )
-            self.json_schema_dict[schema_id] = res.schema_json
+            cached = self.schema_cache.put(schema_id, res.schema_json)
+        return cached
 
-        return self.json_schema_dict[schema_id]
+    def get_schema_json(self, schema_id):
+        """
+        Uses GetSchema RPC to retrieve schema given a schema ID.
+        """
+        return self.get_schema(schema_id).schema_json
 
     def generate_producer_events(self, schema, schema_id):
         """
@@ -295,6 +328,7 @@ class PubSub(object):
         replay_id: str,
         num_requested: int,
         callback: Callable,
+        flow_controller: FlowController = None,
     ):
         """
         Calls the Subscribe RPC defined in the proto file and accepts a
@@ -303,14 +337,30 @@ class PubSub(object):
         connection prematurely (this is due to the way Python's GRPC library is
         designed and may not be necessary for other languages--Java, for
         example, does not need this).
+
+        If a `flow_controller` is given, `num_requested` is ignored and the
+        controller sizes the FetchRequests from the time the callback takes to
+        process every FetchResponse.
         """
+        self.flow_controller = flow_controller
         sub_stream = self.stub.Subscribe(
             self.fetch_req_stream(topic, replay_type, replay_id, num_requested),
             metadata=self.metadata,
         )
         print("> Subscribed to", topic)
-        for event in sub_stream:
-            callback(event, self)
+        try:
+            for event in sub_stream:
+                start = time.monotonic()
+                callback(event, self)
+                if flow_controller is not None:
+                    flow_controller.on_response(
+                        received=len(event.events),
+                        pending_num_requested=event.pending_num_requested,
+                        processing_time=time.monotonic() - start,
+                    )
+        finally:
+            if flow_controller is not None:
+                flow_controller.close()
 
     def publish(self, topic_name, schema, schema_id):
         """
@@ -327,22 +377,19 @@ class PubSub(object):
 
     def read_event(self, event, bitmap_process):
         payloadbytes = event.event.payload
-        schemaid = event.event.schema_id
-        schema = self.stub.GetSchema(
-            pb2.SchemaRequest(schema_id=schemaid), metadata=self.metadata
-        ).schema_json
+        schema = self.get_schema(event.event.schema_id)
 
-        decoded = self.decode(schema, payloadbytes)
+        decoded = schema.decode(payloadbytes)
         decoded["ChangeEventHeader"]["changedFields"] = bitmap_process(
-            avro.schema.parse(schema),
+            schema.schema,
             decoded["ChangeEventHeader"]["changedFields"],
         )
         decoded["ChangeEventHeader"]["nulledFields"] = bitmap_process(
-            avro.schema.parse(schema),
+            schema.schema,
             decoded["ChangeEventHeader"]["nulledFields"],
         )
         decoded["ChangeEventHeader"]["diffFields"] = bitmap_process(
-            avro.schema.parse(schema),
+            schema.schema,
             decoded["ChangeEventHeader"]["diffFields"],
         )
 
@@ -356,6 +403,29 @@ class PubSub(object):
                 print("=========================================")
         return decoded
 
+    def read_events(self, fetch_response) -> list:
+        """
+        Decodes all the events of a FetchResponse at once, replacing the
+        changedFields, nulledFields and diffFields bitmaps of every
+        ChangeEventHeader with field names using the decoder cached with the
+        event's schema.
+        """
+        return [
+            self.decode_event(self.get_schema(event.event.schema_id), event)
+            for event in fetch_response.events
+        ]
+
+    @staticmethod
+    def decode_event(schema: CachedSchema, event) -> dict:
+        """
+        Decodes a ConsumerEvent with its (cached) schema and replaces the
+        bitmap fields of its ChangeEventHeader with field names.
+        """
+        decoded = schema.decode(event.event.payload)
+        if "ChangeEventHeader" in decoded:
+            schema.bitmap_decoder.decode_header(decoded["ChangeEventHeader"])
+        return decoded
+
     @staticmethod
     def return_event(decoded_event: dict):
         print("Processing event...\n")
@@ -376,7 +446,7 @@ class PubSub(object):
 
         return processed_event
 
-    def store_replay_id(self, replay_id: bytes):
+    def store_replay_id(self, replay_id: bytes, filepath: str = "replay_id.txt"):
         """
         Store the replay ID in a file. This is used to resume
         receiving events from a specific point in time. The replay ID is
@@ -384,13 +454,14 @@ class PubSub(object):
         retrieve events from a specific point in time.
 
         The replay ID is stored as a hexadecimal string in a file called
-        `replay_id.txt`.
+        `replay_id.txt`, unless another `filepath` is given (eg: one file per
+        topic when subscribing to several topics).
 
         When reading the replay ID from the file, it must be converted to
         bytes before being used in the FetchRequest. In python, this can be
         done with the `bytes.fromhex()` method.
         """
-        with open("replay_id.txt", "wb") as file:
+        with open(filepath, "wb") as file:
             # store as hexadecimal string
             file.write((replay_id.hex() + "\n").encode("utf-8"))
 
@@ -0,0 +1,146 @@
+"""
+schema_cache.py
+
+This file defines the class `SchemaCache`, which keeps the Avro schemas of the
+events received through the Pub/Sub API so that the `GetSchema` RPC and the
+parsing of the schema JSON only happen once per schema ID.
+"""
+
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import avro.io
+import avro.schema
+
+from util.ChangeEventHeaderUtility import BitmapDecoder
+
+
+class CachedSchema(object):
+    """
+    A parsed event schema together with the objects needed to decode events
+    written with it.
+
+    - schema_id: The ID of the schema
+    - schema_json: The schema as returned by the GetSchema RPC
+    - schema: The parsed Avro schema
+    - reader: A reusable `DatumReader` for the schema
+    - field_names: The top level field names, by field position
+    - field_index: The position of every top level field, by field name
+    - bitmap_decoder: Decoder for the bitmap fields of the ChangeEventHeader
+    """
+
+    def __init__(self, schema_id: str, schema_json: str):
+        self.schema_id = schema_id
+        self.schema_json = schema_json
+        self.schema = avro.schema.parse(schema_json)
+        self.reader = avro.io.DatumReader(self.schema)
+        self.field_names = [field.name for field in self.schema.fields]
+        self.field_index = {name: pos for pos, name in enumerate(self.field_names)}
+        self.bitmap_decoder = BitmapDecoder(self.schema)
+        # change event schemas start with the ChangeEventHeader, which can be
+        # decoded on its own without reading the rest of the payload
+        self.header_reader = None
+        if self.field_names and self.field_names[0] == "ChangeEventHeader":
+            self.header_reader = avro.io.DatumReader(self.schema.fields[0].type)
+
+    def decode(self, payload: bytes) -> dict:
+        """
+        Decodes an Avro-encoded event payload written with this schema.
+        """
+        decoder = avro.io.BinaryDecoder(io.BytesIO(payload))
+        return self.reader.read(decoder)
+
+    def decode_header(self, payload: bytes) -> Optional[dict]:
+        """
+        Decodes only the ChangeEventHeader of an Avro-encoded event payload,
+        with its bitmap fields replaced by field names. Returns None for
+        events without a ChangeEventHeader.
+        """
+        if self.header_reader is not None:
+            decoder = avro.io.BinaryDecoder(io.BytesIO(payload))
+            header = self.header_reader.read(decoder)
+        else:
+            header = self.decode(payload).get("ChangeEventHeader")
+        if header is not None:
+            self.bitmap_decoder.decode_header(header)
+        return header
+
+
+class SchemaCache(object):
+    """
+    LRU cache of `CachedSchema` objects keyed by schema ID.
+
+    At most `max_size` schemas are kept in memory. When `cache_dir` is set,
+    every schema added to the cache is also written to
+    `<cache_dir>/<schema_id>.avsc`, and schemas evicted from memory (or cached
+    by a previous run of the listener) are loaded from there instead of calling
+    the GetSchema RPC again.
+    """
+
+    def __init__(self, max_size: int = 128, cache_dir: str = None):
+        self.max_size = max_size
+        self.cache_dir = cache_dir
+        self._schemas = OrderedDict()
+        self._lock = threading.Lock()
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get(self, schema_id: str) -> Optional[CachedSchema]:
+        """
+        Returns the cached schema for `schema_id`, or None if the schema is
+        neither in memory nor on disk.
+        """
+        with self._lock:
+            cached = self._schemas.get(schema_id)
+            if cached is not None:
+                self._schemas.move_to_end(schema_id)
+                return cached
+
+        schema_json = self._read_from_disk(schema_id)
+        if schema_json is None:
+            return None
+        return self._add(CachedSchema(schema_id, schema_json))
+
+    def put(self, schema_id: str, schema_json: str) -> CachedSchema:
+        """
+        Parses `schema_json` and stores it in the cache.
+        """
+        cached = self._add(CachedSchema(schema_id, schema_json))
+        self._write_to_disk(schema_id, schema_json)
+        return cached
+
+    def _add(self, cached: CachedSchema) -> CachedSchema:
+        with self._lock:
+            self._schemas[cached.schema_id] = cached
+            self._schemas.move_to_end(cached.schema_id)
+            while self.max_size and len(self._schemas) > self.max_size:
+                self._schemas.popitem(last=False)
+        return cached
+
+    def _schema_path(self, schema_id: str) -> str:
+        return os.path.join(self.cache_dir, f"{schema_id}.avsc")
+
+    def _read_from_disk(self, schema_id: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._schema_path(schema_id), "r") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_to_disk(self, schema_id: str, schema_json: str):
+        if not self.cache_dir:
+            return
+        # write to a temporary file first so a crash never leaves a partial schema behind
+        path = self._schema_path(schema_id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write(schema_json)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self._schemas)
@@ -0,0 +1,250 @@
+"""
+subscription_manager.py
+
+This file defines the class `SubscriptionManager`, which runs several
+Subscribe streams over the single gRPC channel of an `AsyncPubSub` instance.
+"""
+
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import grpc
+
+from util.async_pubsub import AsyncPubSub
+from util.flow_control import FlowController
+
+
+class Subscription(object):
+    """
+    The settings and the position of one topic handled by a
+    `SubscriptionManager`.
+
+    - topic: The name of the topic
+    - callback: Coroutine function called with `(event, pubsub)` for every
+      FetchResponse of the topic
+    - replay_type / replay_id: Where to start the subscription
+    - num_requested: Events per FetchRequest, if no flow controller is used
+    - flow_controller: Optional `FlowController` for the topic
+    - resume: Optional function returning the replay type and replay ID to
+      resubscribe with after the callback failed, eg: the last committed
+      checkpoint, since the events it handled before may not be delivered.
+      When it returns None the topic restarts from `replay_type`/`replay_id`
+    - latest_replay_id: The latest replay ID processed by the callback, used
+      to resume the topic after the stream fails
+    """
+
+    def __init__(
+        self,
+        topic: str,
+        callback: Callable[..., Awaitable],
+        replay_type: str = "LATEST",
+        replay_id: str = "",
+        num_requested: int = 10,
+        flow_controller: FlowController = None,
+        resume: Callable[[], Optional[Tuple[str, str]]] = None,
+    ):
+        self.topic = topic
+        self.callback = callback
+        self.replay_type = replay_type
+        self.replay_id = replay_id
+        self.num_requested = num_requested
+        self.flow_controller = flow_controller
+        self.resume = resume
+        self.latest_replay_id = None
+        self.callback_failed = False
+        self.task = None
+
+    async def on_event(self, event, pubsub):
+        try:
+            await self.callback(event, pubsub)
+        except Exception:
+            # the latest replay ID may be past events that were never delivered
+            self.latest_replay_id = None
+            self.callback_failed = True
+            raise
+        if event.latest_replay_id:
+            self.latest_replay_id = event.latest_replay_id
+
+    def resume_position(self):
+        """
+        Returns the replay type and replay ID to (re)subscribe with.
+        """
+        if self.latest_replay_id:
+            return "CUSTOM", str(int.from_bytes(self.latest_replay_id, "big"))
+        if self.callback_failed and self.resume is not None:
+            position = self.resume()
+            if position is not None:
+                return position
+        return self.replay_type, self.replay_id
+
+
+class SubscriptionManager(object):
+    """
+    Multiplexes the Subscribe streams of several topics over one gRPC channel.
+
+    gRPC runs every Subscribe call as its own HTTP/2 stream, so all topics
+    share the TLS connection, the access token and the schema cache of the
+    given `AsyncPubSub`, while keeping their own replay position, flow
+    control and callback. A failing stream is resubscribed from its latest
+    replay ID (or from its `resume` position if the callback failed) with
+    exponential backoff without affecting the other topics;
+    an expired access token is refreshed once for all of them.
+
+    `on_token_rejected` is called with an access token the server rejected
+    before a new one is requested, eg: to remove it from a shared token
+    cache which would otherwise hand the same token out again.
+    """
+
+    def __init__(
+        self,
+        pubsub: AsyncPubSub,
+        max_retry_wait: float = 30,
+        on_token_rejected: Callable[[str], None] = None,
+    ):
+        self.pubsub = pubsub
+        self.max_retry_wait = max_retry_wait
+        self.on_token_rejected = on_token_rejected
+        self.subscriptions: Dict[str, Subscription] = {}
+        self._auth_lock = asyncio.Lock()
+
+    def add(
+        self,
+        topic: str,
+        callback: Callable[..., Awaitable],
+        replay_type: str = "LATEST",
+        replay_id: str = "",
+        num_requested: int = 10,
+        flow_controller: FlowController = None,
+        resume: Callable[[], Optional[Tuple[str, str]]] = None,
+    ) -> Subscription:
+        """
+        Registers a topic. Topics added after `run()` was called are
+        subscribed to right away.
+        """
+        if topic in self.subscriptions:
+            raise ValueError(f"Already subscribed to {topic}")
+        subscription = Subscription(
+            topic=topic,
+            callback=callback,
+            replay_type=replay_type,
+            replay_id=replay_id,
+            num_requested=num_requested,
+            flow_controller=flow_controller,
+            resume=resume,
+        )
+        self.subscriptions[topic] = subscription
+        if self._running():
+            self._start(subscription)
+        return subscription
+
+    async def remove(self, topic: str):
+        """
+        Cancels the Subscribe stream of a topic.
+        """
+        subscription = self.subscriptions.pop(topic)
+        if subscription.task is not None:
+            subscription.task.cancel()
+            await asyncio.gather(subscription.task, return_exceptions=True)
+
+    def _running(self) -> bool:
+        return any(
+            subscription.task is not None
+            for subscription in self.subscriptions.values()
+        )
+
+    def _start(self, subscription: Subscription):
+        subscription.task = asyncio.ensure_future(self._run_subscription(subscription))
+
+    async def run(self):
+        """
+        Subscribes to every registered topic and runs until `stop()` is
+        called or the task running it gets cancelled.
+        """
+        for subscription in self.subscriptions.values():
+            if subscription.task is None:
+                self._start(subscription)
+        try:
+            while self._running():
+                tasks = [
+                    subscription.task
+                    for subscription in self.subscriptions.values()
+                    if subscription.task is not None
+                ]
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for subscription in self.subscriptions.values():
+                    if subscription.task is not None and subscription.task.done():
+                        task, subscription.task = subscription.task, None
+                        if not task.cancelled() and task.exception() is not None:
+                            print(
+                                f"Subscription to {subscription.topic} stopped: "
+                                f"{task.exception()!r}"
+                            )
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        tasks = [
+            subscription.task
+            for subscription in self.subscriptions.values()
+            if subscription.task is not None
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for subscription in self.subscriptions.values():
+            subscription.task = None
+
+    async def _run_subscription(self, subscription: Subscription):
+        wait_time = 1
+        reauthenticated = False
+        while True:
+            replay_type, replay_id = subscription.resume_position()
+            resumed_from = subscription.latest_replay_id
+            try:
+                await self.pubsub.subscribe(
+                    topic=subscription.topic,
+                    replay_type=replay_type,
+                    replay_id=replay_id,
+                    num_requested=subscription.num_requested,
+                    callback=subscription.on_event,
+                    flow_controller=subscription.flow_controller,
+                )
+                wait_time = 1
+                reauthenticated = False
+            except grpc.aio.AioRpcError as e:
+                if subscription.latest_replay_id != resumed_from:
+                    # the stream received events, the new token was accepted
+                    reauthenticated = False
+                error = e.details()
+                if e.code() == grpc.StatusCode.UNAUTHENTICATED:
+                    try:
+                        await self._reauthenticate()
+                    except Exception as auth_error:
+                        # eg: the token request failed, retried after the backoff
+                        error = f"{error}, reauthentication failed: {auth_error}"
+                    else:
+                        if not reauthenticated:
+                            # retry right away once, then back off if the new
+                            # token gets rejected too
+                            reauthenticated = True
+                            continue
+                print(
+                    f"Subscription to {subscription.topic} failed: {error}. "
+                    f"Retrying in {wait_time} seconds..."
+                )
+            except Exception as e:
+                print(
+                    f"Subscription to {subscription.topic} failed: {e}. "
+                    f"Retrying in {wait_time} seconds..."
+                )
+            await asyncio.sleep(wait_time)
+            wait_time = min(wait_time * 2, self.max_retry_wait)
+
+    async def _reauthenticate(self):
+        # every stream fails at once when the token expires, only refresh it once
+        metadata = self.pubsub.metadata
+        async with self._auth_lock:
+            if self.pubsub.metadata is metadata:
+                if self.on_token_rejected is not None:
+                    await asyncio.to_thread(self.on_token_rejected, self.pubsub.access_token)
+                await self.pubsub.authenticate()
@@ -0,0 +1,147 @@
+"""
+token_cache.py
+
+This file defines `TokenCache`, an access token cache stored in a JSON file
+and shared by every listener process using the same path. Tokens are stored
+under a key derived from the domain, the client id and the username, along
+with the time they expire, so a restarted or reconnecting listener reuses a
+valid token instead of requesting a new one.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import grpc
+
+
+class TokenCache(object):
+    """
+    Access tokens shared by processes through a JSON file.
+
+    Callers hold the exclusive `flock()` lock of the cache with `locked()`
+    while they look up and request a token, so when several processes need a
+    token at the same time only the first one requests it, and the others
+    find it in the cache once they get the lock. The file is replaced
+    atomically, so readers never see a partial write.
+    """
+
+    def __init__(self, path: str = "token_cache.json"):
+        self.path = path
+        self.lock_path = path + ".lock"
+
+    @staticmethod
+    def key(client_id: str, username: Optional[str] = None, domain: str = "") -> str:
+        """
+        Returns the cache key of the tokens of a client and user, which
+        doesn't reveal the client id.
+        """
+        value = "\0".join((domain or "", client_id or "", username or ""))
+        return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+    @contextmanager
+    def locked(self):
+        """
+        Holds the exclusive lock of the cache, blocking until it's free.
+        """
+        lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            # closing the file releases the lock
+            os.close(lock_fd)
+
+    def get(self, key: str, min_ttl: float = 0.0) -> Optional[dict]:
+        """
+        Returns the cached token response of `key`, or None if there is none
+        or if it expires in less than `min_ttl` seconds.
+        """
+        entry = self._read().get(key)
+        if entry is None or entry["expires_at"] - min_ttl <= time.time():
+            return None
+        return entry["token"]
+
+    def put(self, key: str, token: dict, expires_at: float):
+        """
+        Stores the token response of `key`, valid until `expires_at` (as
+        returned by `time.time()`). Should be called while holding the lock.
+        """
+        now = time.time()
+        # drop the expired tokens of every key while rewriting the file
+        entries = {k: v for k, v in self._read().items() if v["expires_at"] > now}
+        entries[key] = {"token": token, "expires_at": expires_at}
+        self._write(entries)
+
+    def discard(self, access_token: str, key: str = None):
+        """
+        Removes `access_token` from the cache, eg: after the server rejected
+        it, looking for it under `key` only if given. Cached tokens which
+        differ from it are kept. Should be called while holding the lock.
+        """
+        if access_token is None:
+            return
+        entries = self._read()
+        remaining = {
+            k: v
+            for k, v in entries.items()
+            if (key is not None and k != key)
+            or v["token"].get("access_token") != access_token
+        }
+        if len(remaining) != len(entries):
+            self._write(remaining)
+
+    def _read(self) -> Dict[str, Any]:
+        try:
+            with open(self.path, "rb") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            # a corrupt cache is treated as empty, and rewritten on next put
+            return {}
+
+    def _write(self, entries: Dict[str, Any]):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        # mkstemp creates the file readable only by the user, the tokens are
+        # credentials
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".token_cache")
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(entries, file)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def discard_token(token_cache: TokenCache, access_token: str):
+    # removes a token rejected by the server from the shared cache
+    with token_cache.locked():
+        token_cache.discard(access_token)
+
+
+def discard_rejected_token(token_cache: Optional[TokenCache], pubsub, error):
+    # a token the server rejects is removed from the shared cache, so the next
+    # attempt requests a new one instead of reusing it until it expires
+    if (
+        token_cache is not None
+        and pubsub is not None
+        and isinstance(error, grpc.RpcError)
+        and error.code() == grpc.StatusCode.UNAUTHENTICATED
+    ):
+        discard_token(token_cache, pubsub.access_token)
+
+
+def create_token_cache_from_env() -> Optional[TokenCache]:
+    # the cache is opt-in, without TOKEN_CACHE_PATH every authentication
+    # requests a new token
+    path = os.environ.get("TOKEN_CACHE_PATH")
+    if not path:
+        return None
+    return TokenCache(path)